@@ -1,6 +1,9 @@
 import logging
 import os
 import pathlib
+import sqlite3
+import threading
+import time
 import BingImageCreator
 from PyQt5 import QtCore
 from PyQt5.QtCore import QEvent, QObject
@@ -10,16 +13,35 @@ from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 import qdarktheme
-from PIL import Image, ImageQt
-import PIL.ExifTags
+from create_images.BackupEngine import BackupEngine, makeTarget
+from create_images.BulkWorker import BulkWorker, retagFile
 from create_images.ImageBackupWorker import ImageBackupWorker
 from create_images.ImageGenerationWorker import ImageGenerationWorker
 from create_images.ImageUpscaleWorker import ImageUpscaleWorker
+from create_images.InpaintBenchmark import (
+    REPORT_FILE as INPAINT_REPORT_FILE,
+    selectInpainter,
+)
+from create_images.UpscaleCache import UpscaleCache
+from create_images.UpscaleScheduler import UpscaleScheduler
 from create_images.Img import Img
+from create_images.LagMonitor import LagMonitor
 from create_images.LoadingSpinner import LoadingSpinnerWidget
-from create_images.Utils import apply_function_to_files
+from create_images.Metrics import registry
+from create_images.PixelCache import PixelCache
+from create_images.Profiling import profiled
+from create_images.PromptExpansion import plan
+from create_images.StatsPanel import StatsPanel
+from create_images.UpscalerBenchmark import REPORT_FILE, selectUpscaler
 from create_images.ErrorDialog import ErrorDialog
+from create_images.Exporter import exportFile
 from create_images.ImageData import ImageData
+from create_images.Library import loadLibrary, toPixmaps
+from create_images.LibraryLoadWorker import LibraryLoadWorker
+from create_images.LibraryBrowser import LibraryBrowser
+from create_images.SessionSnapshot import SessionSnapshot
+from create_images.SimilarityIndex import SimilarityIndex
+from create_images.SimilarImagesDialog import SimilarImagesDialog
 import cv2
 from win10toast import ToastNotifier
 
@@ -42,6 +64,28 @@ class Application(QMainWindow):
         self.setWindowTitle(self.tr("Bing Image Creator"))
         self.setMinimumSize(800, 800)
 
+        # decoded pixels of recently viewed images, mapped instead of
+        # decoded again on the next start
+        self.pixelCache = None
+        if config.get("PIXEL_CACHE", "True") == "True":
+            self.pixelCache = PixelCache(
+                directory=config.get("PIXEL_CACHE_DIR", "pixel-cache"),
+                budget=int(config.get("PIXEL_CACHE_BUDGET_MB", "1024")) * 2 ** 20
+            )
+
+        # runtime state lives here rather than in .env
+        self.session = SessionSnapshot(config.get("SESSION_FILE", "session.sqlite3"))
+        self.sessionResident = int(config.get("SESSION_RESIDENT", "4"))
+        self.placeholders = {}
+
+        self.similarityIndex = SimilarityIndex(
+            config.get("SIMILARITY_INDEX_DIR", "similarity-index")
+        )
+
+        # a local stand-in (see BingStub) can take the place of the service
+        if config.get("BING_URL"):
+            BingImageCreator.BING_URL = config["BING_URL"]
+
         self.imageGenerationWorker = ImageGenerationWorker(
             outDir=self.outDir,
             historyFile=config["HISTORY_FILE"],
@@ -52,35 +96,140 @@ class Application(QMainWindow):
             watermarkMask=cv2.imread(
                 "res/bing-mask.png",
                 cv2.IMREAD_GRAYSCALE
-            )
+            ),
+            similarityIndex=self.similarityIndex,
+            watermarkThreshold=float(config.get("WATERMARK_THRESHOLD", "0.3")),
+            inpaintMethod=self.selectInpaintMethod()
         )
         self.imageGenerationWorker.generated.connect(
             self.receiveGeneratedImages
         )
+        self.generateBatchRequest.connect(
+            self.imageGenerationWorker.generateBatch
+        )
 
         self.imageGenerationThread = QThread(self)
         self.imageGenerationThread.setObjectName("imageGenerationThread")
         self.imageGenerationWorker.moveToThread(self.imageGenerationThread)
         self.imageGenerationThread.start()
 
+        upscaleMethod = self.selectUpscaleMethod()
+        self.upscaleCache = UpscaleCache(
+            directory=config.get(
+                "UPSCALE_CACHE_DIR", (self.upscaledDir / "cache").as_posix()
+            ),
+            budget=int(config.get("UPSCALE_CACHE_BUDGET_MB", "2048")) * 2 ** 20,
+            scale=int(config["UPSCALER_SCALE"]),
+            model=f"{upscaleMethod}-{pathlib.Path(config['UPSCALE_MODEL']).stem}"
+        )
+
         self.imageUpscaleWorker = ImageUpscaleWorker(
-            outDir=self.upscaledDir,
+            cache=self.upscaleCache,
             scale=int(config["UPSCALER_SCALE"]),
-            model=config["UPSCALE_MODEL"]
+            model=config["UPSCALE_MODEL"],
+            method=upscaleMethod,
+            cacheDir=config.get("MODEL_CACHE_DIR", "res/models/compiled")
         )
-        self.imageUpscaleWorker.upscaled.connect(self.onUpscaled)
 
         self.imageUpscaleThread = QThread(self)
         self.imageUpscaleThread.setObjectName("imageUpscaleThread")
         self.imageUpscaleWorker.moveToThread(self.imageUpscaleThread)
         self.imageUpscaleThread.start()
 
-        self.imageBackupWorker = ImageBackupWorker()
+        self.upscaleScheduler = UpscaleScheduler(self.imageUpscaleWorker, self)
+        self.upscaleScheduler.upscaled.connect(self.onUpscaled)
+        self.upscaleScheduler.failed.connect(self.onUpscaleFailed)
+        self.imageUpscaleWorker.regionUpscaled.connect(self.onRegionUpscaled)
+
+        self.speculativeUpscale = (
+            config.get("SPECULATIVE_UPSCALE", "True") == "True"
+        )
+        self.speculativeRadius = int(config.get("SPECULATIVE_RADIUS", "2"))
+        self.speculationTimer = QTimer(self)
+        self.speculationTimer.setSingleShot(True)
+        self.speculationTimer.setInterval(
+            int(config.get("SPECULATIVE_DELAY_MS", "1500"))
+        )
+        self.speculationTimer.timeout.connect(self.speculateNeighbours)
+
+        self.imageBackupWorker = ImageBackupWorker(
+            engine=BackupEngine(
+                target=makeTarget(
+                    config.get("BACKUP_TARGET", "backup"),
+                    endpoint=config.get("BACKUP_S3_ENDPOINT"),
+                    accessKey=config.get("BACKUP_S3_ACCESS_KEY"),
+                    secretKey=config.get("BACKUP_S3_SECRET_KEY"),
+                ),
+                manifestPath=config.get(
+                    "BACKUP_MANIFEST", "backup-manifest.json"
+                ),
+            ),
+            directories=[self.outDir]
+        )
+        self.imageBackupWorker.backupSaved.connect(self.onBackupSaved)
+        self.imageBackupWorker.failed.connect(self.onBackupFailed)
         self.imageBackupThread = QThread(self)
         self.imageBackupThread.setObjectName("imageBackupThread")
         self.imageBackupWorker.moveToThread(self.imageBackupThread)
         self.imageBackupThread.start()
 
+        exportWorkers = config.get("EXPORT_WORKERS")
+        self.libraryLoadWorker = LibraryLoadWorker(
+            directory=self.outDir,
+            upscaledDir=self.upscaledDir,
+            upscaleCache=self.upscaleCache,
+            pixelCache=self.pixelCache,
+            workers=int(config.get("LIBRARY_WORKERS", "4"))
+        )
+        self.libraryLoadWorker.listed.connect(self.onLibraryListed)
+        self.libraryLoadWorker.decoded.connect(self.onImageDecoded)
+        self.libraryLoadWorker.failed.connect(self.onImagesFailed)
+        self.loadLibraryRequest.connect(self.libraryLoadWorker.load)
+        self.libraryLoadThread = QThread(self)
+        self.libraryLoadThread.setObjectName("libraryLoadThread")
+        self.libraryLoadWorker.moveToThread(self.libraryLoadThread)
+        self.libraryLoadThread.start()
+
+        self.bulkWorker = BulkWorker(
+            self.upscaleCache,
+            exportWorkers=int(exportWorkers) if exportWorkers else None
+        )
+        self.bulkThread = QThread(self)
+        self.bulkThread.setObjectName("bulkThread")
+        self.bulkWorker.moveToThread(self.bulkThread)
+        self.bulkThread.start()
+
+        self.libraryBrowser = LibraryBrowser(
+            self.bulkWorker, self.imageBackupWorker, self.upscaleScheduler, self,
+            pixelCache=self.pixelCache
+        )
+        self.libraryBrowser.openRequest.connect(
+            lambda file: self.openImageFile(os.path.abspath(file))
+        )
+        self.libraryBrowser.filesDeleted.connect(self.onFilesDeleted)
+        self.libraryBrowser.filesRetagged.connect(self.onFilesRetagged)
+
+        # where the generation wall time goes, scraped from a file rather
+        # than a socket so that nothing listens while the app is open
+        self.metricsFile = config.get("METRICS_FILE", "metrics.json")
+        self.prometheusFile = config.get("METRICS_PROMETHEUS_FILE", "metrics.prom")
+        self.metricsTimer = QTimer(self)
+        self.metricsTimer.setInterval(
+            int(config.get("METRICS_INTERVAL_S", "30")) * 1000
+        )
+        self.metricsTimer.timeout.connect(self.exportMetrics)
+        self.metricsTimer.start()
+        self.statsPanel = StatsPanel(registry, self)
+
+        self.lagMonitor = None
+        if config.get("LAG_MONITOR", "True") == "True":
+            self.lagMonitor = LagMonitor(
+                threshold=int(config.get("LAG_THRESHOLD_MS", "200")) / 1000,
+                interval=int(config.get("LAG_HEARTBEAT_MS", "50")) / 1000,
+                parent=self
+            )
+            self.lagMonitor.start()
+
         self.imageLabel = Img(self)
         self.imageLabel.setText(self.tr("No images generated"))
         self.imageLabel.setScaledContents(True)
@@ -92,6 +241,11 @@ class Application(QMainWindow):
         self.imageLabel.saveRequest.connect(self.saveCurrentImage)
         self.imageLabel.upscaleRequest.connect(self.upscaleCurrentImage)
         self.imageLabel.backupRequest.connect(self.backupCurrentImage)
+        self.imageLabel.backupAllRequest.connect(self.backupAllImages)
+        self.imageLabel.findSimilarRequest.connect(self.findSimilarImages)
+        self.imageLabel.statsRequest.connect(self.statsPanel.show)
+        self.imageLabel.libraryRequest.connect(self.openLibrary)
+        self.imageLabel.regionUpscaleRequest.connect(self.upscaleRegion)
         self.imageLabel.nextPicture.connect(
             lambda: self.setImage(self.currentImage + 1)
         )
@@ -115,9 +269,17 @@ class Application(QMainWindow):
         self.prepend.setMaximumWidth(200)
         self.prompt.setPlaceholderText(self.tr("Prompt"))
         self.append.setPlaceholderText(self.tr("Append"))
+        self.append.setMaximumWidth(200)
+
+        # "a | b" and "{a,b}" in any field expand to every combination
+        for field in (self.prepend, self.prompt, self.append):
+            field.setToolTip(self.tr(
+                "Alternatives: \"a | b\" or \"a {red,blue} car\""
+            ))
 
         search.addWidget(self.prepend)
         search.addWidget(self.prompt)
+        search.addWidget(self.append)
         search.addWidget(self.acceptButton)
 
         self.main.addLayout(search)
@@ -149,29 +311,88 @@ class Application(QMainWindow):
 
         self.imageGenerationWorker.started.connect(self.loadingSpinner.start)
         self.imageGenerationWorker.finished.connect(self.loadingSpinner.stop)
+        self.imageGenerationWorker.preview.connect(self.onPreview)
+        self.imageGenerationWorker.finished.connect(self.imageLabel.clearPreview)
 
-        # self.imageUpscaleWorker.started.connect(self.loadingSpinner.start)
-        # self.imageUpscaleWorker.finished.connect(self.loadingSpinner.stop)
+        self.upscaleScheduler.explicitStarted.connect(self.loadingSpinner.start)
+        self.upscaleScheduler.explicitFinished.connect(self.loadingSpinner.stop)
 
         self.setWindowFlags(Qt.Window)
 
         self.loadState()
         self.imageLabel.setFocus()
 
+    generateBatchRequest = pyqtSignal(object)
+    loadLibraryRequest = pyqtSignal(str)
+
+    def selectInpaintMethod(self):
+        method = config.get("INPAINT_METHOD", "telea")
+        if method != "auto":
+            return method
+
+        selected = selectInpainter(
+            config.get("INPAINT_BENCHMARK_REPORT", INPAINT_REPORT_FILE),
+            float(config.get("INPAINT_QUALITY_FLOOR", "35"))
+        )
+        return selected or "telea"
+
+    def selectUpscaleMethod(self):
+        method = config.get("UPSCALE_METHOD", "esrgan")
+        if method != "auto":
+            return method
+
+        selected = selectUpscaler(
+            config.get("UPSCALE_BENCHMARK_REPORT", REPORT_FILE),
+            float(config.get("UPSCALE_QUALITY_FLOOR", "0")),
+            int(config["UPSCALER_SCALE"])
+        )
+        return selected or "esrgan"
+
     @pyqtSlot()
     def generateImages(self):
         if not self.prompt.text():
             return
 
-        prompt = self.prepend.text().strip() + " " + self.prompt.text().strip()
+        prompts, skipped, overflow = plan(
+            self.prepend.text(),
+            self.prompt.text(),
+            self.append.text(),
+            config["HISTORY_FILE"],
+            limit=int(config.get("PROMPT_EXPANSION_LIMIT", "64"))
+        )
 
-        try:
-            QMetaObject.invokeMethod(
-                self.imageGenerationWorker,
-                "generateImages",
-                Qt.ConnectionType.QueuedConnection,
-                Q_ARG(str, prompt),
+        # a single prompt is generated again on purpose, a batch only
+        # spends quota on combinations that were never generated
+        if not prompts and len(skipped) == 1:
+            prompts, skipped = skipped, []
+        if len(prompts) + len(skipped) > 1:
+            answer = QMessageBox.question(
+                self,
+                self.tr("Generate"),
+                self.tr(
+                    "{count} prompts will be generated, {skipped} were "
+                    "generated before and are skipped{overflow}."
+                ).format(
+                    count=len(prompts),
+                    skipped=len(skipped),
+                    overflow=self.tr(", {count} over the limit").format(
+                        count=overflow
+                    ) if overflow else "",
+                )
             )
+            if answer != QMessageBox.Yes or not prompts:
+                return
+
+        try:
+            if len(prompts) == 1:
+                QMetaObject.invokeMethod(
+                    self.imageGenerationWorker,
+                    "generateImages",
+                    Qt.ConnectionType.QueuedConnection,
+                    Q_ARG(str, prompts[0]),
+                )
+            else:
+                self.generateBatchRequest.emit(prompts)
         except Exception as e:
             dialog = ErrorDialog(
                 e, self.tr("Do not panic and try different prompt"), self
@@ -180,12 +401,12 @@ class Application(QMainWindow):
 
     @pyqtSlot()
     def upscaleCurrentImage(self):
+        if self.images[self.currentImage].placeholder:
+            return
         try:
-            QMetaObject.invokeMethod(
-                self.imageUpscaleWorker,
-                "upscaleImage",
-                Qt.ConnectionType.QueuedConnection,
-                Q_ARG(QPixmap, self.images[self.currentImage].image),
+            self.upscaleScheduler.request(
+                self.images[self.currentImage].file,
+                self.images[self.currentImage].image,
             )
         except Exception as e:
             dialog = ErrorDialog(
@@ -193,6 +414,36 @@ class Application(QMainWindow):
             )
             dialog.exec_()
 
+    @pyqtSlot(QRect)
+    def upscaleRegion(self, region):
+        data = self.images[self.currentImage] if self.images else None
+        if data is None or data.placeholder:
+            return
+        self.upscaleScheduler.requestRegion(data.file, data.image, region)
+
+    @pyqtSlot(str, QRect, QImage)
+    def onRegionUpscaled(self, file, rect, tile: QImage):
+        if self.images and self.images[self.currentImage].file == file:
+            self.imageLabel.addDetailTile(rect, QPixmap.fromImage(tile))
+
+    @pyqtSlot()
+    def speculateNeighbours(self):
+        if not self.speculativeUpscale or not self.images:
+            return
+
+        self.upscaleScheduler.clear(UpscaleScheduler.NEIGHBOUR)
+
+        # nearest first, the next image before the previous one
+        for distance in range(1, self.speculativeRadius + 1):
+            for offset in (distance, -distance):
+                image = self.images[
+                    (self.currentImage + offset) % len(self.images)
+                ]
+                if image.upscaled is None and not image.placeholder:
+                    self.upscaleScheduler.speculate(
+                        UpscaleScheduler.NEIGHBOUR, image.file, image.image
+                    )
+
     @pyqtSlot()
     def backupCurrentImage(self):
         try:
@@ -200,7 +451,7 @@ class Application(QMainWindow):
                 self.imageBackupWorker,
                 "backupImage",
                 Qt.ConnectionType.QueuedConnection,
-                Q_ARG(QPixmap, self.images[self.currentImage].image),
+                Q_ARG(str, self.images[self.currentImage].file),
             )
         except Exception as e:
             dialog = ErrorDialog(
@@ -208,8 +459,119 @@ class Application(QMainWindow):
             )
             dialog.exec_()
 
+    @pyqtSlot()
+    def backupAllImages(self):
+        QMetaObject.invokeMethod(
+            self.imageBackupWorker,
+            "backupAll",
+            Qt.ConnectionType.QueuedConnection,
+        )
+
+    @pyqtSlot(object)
+    def onBackupSaved(self, summary):
+        # the library browser reports its own backups
+        if self.libraryBrowser.job == "backup":
+            return
+        if summary["files"] <= 1:
+            # per file failures only end up in the summary
+            if summary["errors"]:
+                dialog = ErrorDialog(
+                    "\n".join(summary["errors"]), self.tr("Backup failed!"), self
+                )
+                dialog.exec_()
+            return
+        QMessageBox.information(
+            self,
+            self.tr("Backup finished"),
+            self.tr(
+                "{files} files checked, {uploaded} uploaded, "
+                "{deduplicated} already backed up, {errors} errors"
+            ).format(
+                files=summary["files"],
+                uploaded=summary["uploaded"],
+                deduplicated=summary["deduplicated"] + summary["unchanged"],
+                errors=len(summary["errors"]),
+            )
+        )
+
+    @pyqtSlot(object)
+    def onBackupFailed(self, e):
+        if self.libraryBrowser.job == "backup":
+            return
+        dialog = ErrorDialog(e, self.tr("Backup failed!"), self)
+        dialog.exec_()
+
+    @pyqtSlot()
+    def findSimilarImages(self):
+        if not self.images:
+            return
+
+        try:
+            startTime = time.perf_counter()
+            results = self.similarityIndex.queryFile(
+                os.path.abspath(self.images[self.currentImage].file),
+                k=int(config.get("SIMILAR_IMAGES", "24"))
+            )
+            elapsed = time.perf_counter() - startTime
+        except Exception as e:
+            dialog = ErrorDialog(e, self.tr("Search failed!"), self)
+            dialog.exec_()
+            return
+
+        dialog = SimilarImagesDialog(self, pixelCache=self.pixelCache)
+        dialog.openRequest.connect(self.openImageFile)
+        dialog.exec_(results, elapsed)
+
+    @pyqtSlot(str)
+    def openImageFile(self, file):
+        for i, data in enumerate(self.images):
+            if os.path.abspath(data.file) == file:
+                self.setImage(i)
+                return
+
+    @pyqtSlot()
+    def openLibrary(self):
+        self.libraryBrowser.setImages(self.images)
+        self.libraryBrowser.show()
+        self.libraryBrowser.raise_()
+
+    @pyqtSlot(object)
+    def onFilesDeleted(self, files):
+        if not files:
+            return
+        deleted = set(files)
+        for file in files:
+            self.upscaleScheduler.discard(file)
+            self.similarityIndex.remove(os.path.abspath(file))
+
+        current = self.images[self.currentImage].file if self.images else None
+        self.images = [data for data in self.images if data.file not in deleted]
+        if not self.images:
+            self.imageLabel.clear()
+            self.imageLabel.setText(self.tr("No images generated"))
+            return
+
+        for i, data in enumerate(self.images):
+            if data.file == current:
+                self.setImage(i)
+                return
+        self.setImage(min(self.currentImage, len(self.images) - 1))
+
+    @pyqtSlot(object, str)
+    def onFilesRetagged(self, files, prompt):
+        retagged = set(files)
+        for data in self.images:
+            if data.file in retagged:
+                data.prompt = prompt
+        if self.images and self.images[self.currentImage].file in retagged:
+            self.imageLabel.setPrompt(prompt)
+
     @pyqtSlot()
     def deleteCurrentImage(self):
+        self.upscaleScheduler.discard(self.images[self.currentImage].file)
+        self.similarityIndex.remove(
+            os.path.abspath(self.images[self.currentImage].file)
+        )
         os.remove(self.images[self.currentImage].file)
         self.images.pop(self.currentImage)
         self.setImage(self.currentImage)
@@ -219,11 +581,16 @@ class Application(QMainWindow):
         filePath, _ = QFileDialog.getSaveFileName(
             self, self.tr("Save Image"),
             "",
-            "Image Files (*.png, *.jpg, *.jpeg, *jfif)"
+            "Image Files (*.png *.jpg *.jpeg *.jfif *.webp)"
         )
         if not filePath:
             return
-        self.images[self.currentImage].image.save(filePath)
+        # encoded from the file rather than the pixmap so the prompt survives
+        try:
+            exportFile(self.images[self.currentImage].file, filePath)
+        except Exception as e:
+            dialog = ErrorDialog(e, self.tr("Saving failed!"), self)
+            dialog.exec_()
 
     @pyqtSlot(str)
     def changeCurrentImageMetadata(self, prompt):
@@ -231,52 +598,145 @@ class Application(QMainWindow):
             return
 
         currentFile = self.images[self.currentImage].file
-
-        with Image.open(currentFile) as image:
-            metadata = image.getexif()
-            metadata[PIL.ExifTags.Base.XPComment] = prompt
-            image.save(currentFile, exif=metadata)
+        retagFile(currentFile, prompt, self.upscaleCache)()
+        self.images[self.currentImage].prompt = prompt
 
     def saveState(self):
-        dotenv.set_key(".env", "PREPEND", self.prepend.text())
-        dotenv.set_key(".env", "PROMPT", self.prompt.text())
+        try:
+            self.session.save(
+                {
+                    "prepend": self.prepend.text(),
+                    "prompt": self.prompt.text(),
+                    "append": self.append.text(),
+                },
+                self.images,
+                self.currentImage,
+                self.imageLabel.size(),
+                self.sessionResident
+            )
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"Could not save the session: {e}")
 
+    @profiled("loadState")
     def loadState(self):
-        self.prepend.setText(config["PREPEND"])
-        self.prompt.setText(config["PROMPT"])
-
-        def loadImage(filepath):
-            try:
-                upscaledPath = os.path.join(
-                    self.upscaledDir, os.path.basename(filepath)
-                )
-                upscaledImage = (
-                    None if not os.path.exists(upscaledPath)
-                    else QPixmap(upscaledPath)
-                )
-
-                with Image.open(filepath) as image:
-                    self.images.append(
-                        ImageData(
-                            QPixmap(filepath),
-                            image.getexif().get(PIL.ExifTags.Base.XPComment),
-                            filepath,
-                            upscaledImage
-                        )
-                    )
-            except Exception as e:
-                logging.debug(
-                    f"Error while loading file \"{filepath}\":\n {e}"
+        snapshot = self.session.load()
+        state = snapshot["state"] if snapshot else {}
+        # the fields were kept in .env before there was a snapshot
+        self.prepend.setText(state.get("prepend", config.get("PREPEND", "")))
+        self.prompt.setText(state.get("prompt", config.get("PROMPT", "")))
+        self.append.setText(state.get("append", config.get("APPEND", "")))
+
+        if snapshot and snapshot["library"]:
+            # the last session is shown as it was left, from its thumbnails,
+            # while the library is listed and decoded in the background
+            self.images = [
+                ImageData(
+                    snapshot["resident"].get(file, QPixmap()),
+                    prompt,
+                    file,
+                    placeholder=True
                 )
+                for file, prompt in snapshot["library"]
+            ]
+            self.placeholders = {data.file: data for data in self.images}
+            current = next(
+                (
+                    i for i, data in enumerate(self.images)
+                    if data.file == state.get("currentFile")
+                ),
+                0
+            )
+            self.setImage(current)
+            self.loadLibraryRequest.emit(self.images[current].file)
+            return
 
-        apply_function_to_files(loadImage, self.outDir.as_posix())
-        self.images.sort(key=lambda x: -os.path.getctime(x.file))
+        self.images = loadLibrary(
+            self.outDir,
+            self.upscaledDir,
+            self.upscaleCache,
+            workers=int(config.get("LIBRARY_WORKERS", "4")),
+            pixelCache=self.pixelCache
+        )
         self.setImage(0)
+        self.updateSimilarityIndex()
+
+    def updateSimilarityIndex(self):
+        # features of images the index has not seen yet are computed in
+        # the background, queries work on whatever is indexed so far
+        threading.Thread(
+            target=self.similarityIndex.update,
+            args=([os.path.abspath(image.file) for image in self.images],),
+            name="similarityIndexUpdate",
+            daemon=True,
+        ).start()
+
+    @pyqtSlot(object)
+    def onLibraryListed(self, files):
+        current = self.images[self.currentImage].file if self.images else None
+        listed = set(files)
+        loaded = {data.file: data for data in self.images if not data.placeholder}
+
+        # images generated while the listing ran are kept in front, files
+        # that disappeared since the last session are dropped
+        images = [data for file, data in loaded.items() if file not in listed]
+        for file in files:
+            data = (
+                loaded.get(file)
+                or self.placeholders.get(file)
+                or ImageData(QPixmap(), None, file, placeholder=True)
+            )
+            if data.placeholder:
+                self.placeholders[file] = data
+            images.append(data)
+        self.placeholders = {
+            file: data for file, data in self.placeholders.items()
+            if file in listed
+        }
+        self.images = images
+
+        if self.images:
+            self.setImage(next(
+                (i for i, data in enumerate(self.images) if data.file == current),
+                0
+            ))
+        self.updateSimilarityIndex()
+
+    @pyqtSlot(object)
+    def onImageDecoded(self, decoded: ImageData):
+        data = self.placeholders.pop(decoded.file, None)
+        if data is None:
+            return
+        loaded = toPixmaps(decoded)
+        data.image = loaded.image
+        data.prompt = loaded.prompt
+        data.upscaled = data.upscaled or loaded.upscaled
+        data.placeholder = False
+
+        if self.images and self.images[self.currentImage] is data:
+            self.setImage(self.currentImage)
+
+    @pyqtSlot(object)
+    def onImagesFailed(self, files):
+        # unreadable files are left out, as the eager library load does,
+        # instead of staying placeholders for good
+        self.onFilesDeleted([
+            file for file in files
+            if self.placeholders.pop(file, None) is not None
+        ])
+
+    @pyqtSlot(str, QImage)
+    def onPreview(self, file, image: QImage):
+        self.imageLabel.setPreview(image)
 
     @pyqtSlot(object)
     def receiveGeneratedImages(self, images):
         self.images = images + self.images
         self.setImage(0)
+        if self.speculativeUpscale:
+            for image in images:
+                self.upscaleScheduler.speculate(
+                    UpscaleScheduler.GENERATED, image.file, image.image
+                )
         if self.notifyWhenGenerated and not self.isActiveWindow():
             self.toast.show_toast(
                 "Generated",
@@ -291,23 +751,56 @@ class Application(QMainWindow):
         self.imageLabel.setPrompt(self.images[self.currentImage].prompt)
         self.imageLabel.setFilePath(self.images[self.currentImage].file)
         self.imageLabel.setUpscaled(self.images[self.currentImage].upscaled)
-
-    @pyqtSlot(object)
-    def onUpscaled(self, image: Image):
-        image.save(
-            os.path.join(
-                self.upscaledDir,
-                os.path.basename(self.images[self.currentImage].file)
+        if (
+            self.pixelCache is not None
+            and not self.images[self.currentImage].placeholder
+        ):
+            self.pixelCache.remember(
+                self.images[self.currentImage].file,
+                self.images[self.currentImage].image
             )
-        )
-        self.setImage(self.currentImage)
-        self.imageLabel.setUpscaled(ImageQt.toqpixmap(image))
+        self.speculationTimer.start()
+
+    @pyqtSlot(str, QImage)
+    def onUpscaled(self, file, image: QImage):
+        # the worker already stored the result in the cache, it may belong
+        # to any image when it was upscaled speculatively
+        for data in self.images:
+            if data.file == file:
+                data.upscaled = QPixmap.fromImage(image)
+                break
+
+        if self.images and self.images[self.currentImage].file == file:
+            self.imageLabel.setUpscaled(self.images[self.currentImage].upscaled)
+
+    @pyqtSlot(str, object)
+    def onUpscaleFailed(self, file, e):
+        dialog = ErrorDialog(e, self.tr("Upscaling failed!"), self)
+        dialog.exec_()
+
+    @pyqtSlot()
+    def exportMetrics(self):
+        try:
+            registry.export(self.metricsFile, self.prometheusFile)
+        except OSError as e:
+            logging.warning(f"Could not export metrics: {e}")
 
     def closeEvent(self, e: QCloseEvent):
         self.saveState()
+        self.imageUpscaleWorker.shutdown()
+        self.similarityIndex.save()
+        if self.pixelCache is not None:
+            self.pixelCache.shutdown()
+            logging.info(f"Pixel cache: {self.pixelCache.summary()}")
+        if self.lagMonitor is not None:
+            self.lagMonitor.stop()
+            logging.info(self.lagMonitor.summary())
+        self.exportMetrics()
         self.imageGenerationThread.terminate()
         self.imageUpscaleThread.terminate()
         self.imageBackupThread.terminate()
+        self.bulkThread.terminate()
+        self.libraryLoadThread.terminate()
         e.accept()
 
     def mousePressEvent(self, e: QMouseEvent) -> None:
@@ -0,0 +1,349 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from create_images.Utils import apply_function_to_files
+
+
+def hashFile(path, chunkSize=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(chunkSize):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileChangedError(Exception):
+    pass
+
+
+def snapshotFile(path, chunkSize=1 << 20):
+    # the bytes uploaded are the bytes hashed here, a file rewritten in
+    # place after it was first hashed never ends up under the old digest
+    digest = hashlib.sha256()
+    fd, tmpPath = tempfile.mkstemp(prefix="backup-")
+    try:
+        with open(path, "rb") as source, os.fdopen(fd, "wb") as copy:
+            while chunk := source.read(chunkSize):
+                digest.update(chunk)
+                copy.write(chunk)
+    except BaseException:
+        os.remove(tmpPath)
+        raise
+    return digest.hexdigest(), tmpPath
+
+
+def objectKey(digest):
+    return f"objects/{digest[:2]}/{digest}"
+
+
+class LocalDirectoryTarget:
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+
+    def exists(self, key):
+        return (self.root / key).exists()
+
+    def upload(self, key, path):
+        destination = self.root / key
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # copy under a temporary name first so an interrupted copy never
+        # looks like a finished object
+        tmpPath = destination.with_name(destination.name + ".part")
+        shutil.copyfile(path, tmpPath)
+        os.replace(tmpPath, destination)
+
+    def putBytes(self, key, data):
+        destination = self.root / key
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        tmpPath = destination.with_name(destination.name + ".part")
+        tmpPath.write_bytes(data)
+        os.replace(tmpPath, destination)
+
+    def __str__(self):
+        return self.root.as_posix()
+
+
+class S3Target:
+    def __init__(
+        self,
+        bucket,
+        prefix="",
+        endpoint=None,
+        accessKey=None,
+        secretKey=None,
+        region=None
+    ):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        self.ClientError = ClientError
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint,
+            aws_access_key_id=accessKey,
+            aws_secret_access_key=secretKey,
+            region_name=region,
+        )
+
+    def fullKey(self, key):
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.fullKey(key))
+            return True
+        except self.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return False
+            raise
+
+    def upload(self, key, path):
+        # s3 objects only become visible once the upload completes
+        self.client.upload_file(str(path), self.bucket, self.fullKey(key))
+
+    def putBytes(self, key, data):
+        self.client.put_object(
+            Bucket=self.bucket, Key=self.fullKey(key), Body=data
+        )
+
+    def __str__(self):
+        return f"s3://{self.bucket}/{self.prefix}"
+
+
+def makeTarget(location, endpoint=None, accessKey=None, secretKey=None):
+    if location.startswith("s3://"):
+        bucket, _, prefix = location[len("s3://"):].partition("/")
+        return S3Target(bucket, prefix, endpoint, accessKey, secretKey)
+    if location.startswith("file://"):
+        location = location[len("file://"):]
+    return LocalDirectoryTarget(location)
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.journalPath = self.path.with_name(self.path.name + ".journal")
+        self.lock = threading.Lock()
+        self.files = {}
+        self.objects = set()
+        self.load()
+
+    def load(self):
+        if self.path.exists():
+            with open(self.path) as file:
+                manifest = json.load(file)
+            self.files = manifest.get("files", {})
+            self.objects = set(manifest.get("objects", []))
+
+        # replay whatever an interrupted run managed to finish
+        if self.journalPath.exists():
+            with open(self.journalPath) as journal:
+                for line in journal:
+                    kind, _, payload = line.rstrip("\n").partition(" ")
+                    if kind == "object":
+                        self.objects.add(payload)
+                    elif kind == "file":
+                        try:
+                            entry = json.loads(payload)
+                        except ValueError:
+                            # torn last line of a crashed run
+                            continue
+                        self.files[entry.pop("path")] = entry
+
+    def isCurrent(self, path, stat):
+        entry = self.files.get(path)
+        return (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime_ns
+            and entry["hash"] in self.objects
+        )
+
+    def recordObject(self, digest):
+        with self.lock:
+            self.objects.add(digest)
+            self.journal(f"object {digest}")
+
+    def recordFiles(self, files):
+        lines = []
+        with self.lock:
+            for path, digest, stat in files:
+                entry = {
+                    "hash": digest,
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime_ns,
+                }
+                self.files[path] = entry
+                lines.append(f"file {json.dumps({'path': path, **entry})}")
+            self.journal(*lines)
+
+    def journal(self, *lines):
+        if not lines:
+            return
+        with open(self.journalPath, "a") as journal:
+            journal.write("".join(line + "\n" for line in lines))
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def snapshot(self):
+        with self.lock:
+            return json.dumps(
+                {"files": self.files, "objects": sorted(self.objects)},
+                indent=1
+            ).encode()
+
+    def compact(self):
+        data = self.snapshot()
+        tmpPath = self.path.with_name(self.path.name + ".tmp")
+        tmpPath.write_bytes(data)
+        os.replace(tmpPath, self.path)
+        self.journalPath.unlink(missing_ok=True)
+        return data
+
+
+class BackupEngine:
+    def __init__(self, target, manifestPath, workers=None):
+        self.target = target
+        self.manifest = Manifest(manifestPath)
+        self.workers = workers or min(8, (os.cpu_count() or 1) + 2)
+
+    def backupFiles(self, paths, cancelled=None, snapshot=False, progress=None):
+        summary = {
+            "target": str(self.target),
+            "files": 0,
+            "unchanged": 0,
+            "hashed": 0,
+            "uploaded": 0,
+            "deduplicated": 0,
+            "bytesUploaded": 0,
+            "cancelled": False,
+            "errors": [],
+        }
+
+        pending = {}
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                summary["errors"].append(f"{path}: {e}")
+                continue
+            summary["files"] += 1
+            if self.manifest.isCurrent(path, stat):
+                summary["unchanged"] += 1
+            else:
+                pending[path] = stat
+
+        with ThreadPoolExecutor(self.workers) as executor:
+            # hashlib releases the gil for large buffers, so threads hash
+            # files in parallel
+            # hashing and uploading each take half of the reported progress
+            steps = 2 * len(pending)
+            hashes = {}
+            futures = {executor.submit(hashFile, path): path for path in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    hashes[path] = future.result()
+                    summary["hashed"] += 1
+                except OSError as e:
+                    summary["errors"].append(f"{path}: {e}")
+                if progress is not None:
+                    progress(done, steps)
+
+            uploads = {}
+            for path, digest in hashes.items():
+                if digest in self.manifest.objects or digest in uploads:
+                    summary["deduplicated"] += 1
+                else:
+                    uploads[digest] = path
+
+            futures = {
+                executor.submit(self.uploadObject, digest, path, cancelled): digest
+                for digest, path in uploads.items()
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                if progress is not None:
+                    progress(
+                        len(pending) + done * len(pending) // len(futures), steps
+                    )
+                digest = futures[future]
+                try:
+                    sent = future.result()
+                    if sent:
+                        summary["uploaded"] += 1
+                        summary["bytesUploaded"] += sent
+                    else:
+                        summary["deduplicated"] += 1
+                except InterruptedError:
+                    summary["cancelled"] = True
+                except Exception as e:
+                    summary["errors"].append(f"{uploads[digest]}: {e}")
+
+        self.manifest.recordFiles([
+            (path, digest, pending[path])
+            for path, digest in hashes.items()
+            if digest in self.manifest.objects
+        ])
+        self.publishManifest(snapshot)
+        return summary
+
+    def uploadObject(self, digest, path, cancelled=None):
+        if cancelled is not None and cancelled():
+            raise InterruptedError("backup cancelled")
+
+        key = objectKey(digest)
+        # an interrupted run may have finished the upload without
+        # getting to journal it
+        if self.target.exists(key):
+            self.manifest.recordObject(digest)
+            return 0
+
+        actual, tmpPath = snapshotFile(path)
+        try:
+            if actual != digest:
+                # the next run hashes the new contents
+                raise FileChangedError("file changed while backing up")
+            self.target.upload(key, tmpPath)
+            size = os.path.getsize(tmpPath)
+        finally:
+            os.remove(tmpPath)
+        self.manifest.recordObject(digest)
+        return size
+
+    def backupDirectories(self, directories, cancelled=None):
+        paths = []
+        for directory in directories:
+            apply_function_to_files(paths.append, str(directory))
+        return self.backupFiles(paths, cancelled, snapshot=True)
+
+    def publishManifest(self, snapshot=False):
+        data = self.manifest.compact()
+        if snapshot:
+            stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+            self.target.putBytes(f"manifests/{stamp}.json", data)
+        self.target.putBytes("manifests/latest.json", data)
+
+
+if __name__ == "__main__":
+    engine = BackupEngine(
+        makeTarget(
+            sys.argv[1],
+            endpoint=os.environ.get("BACKUP_S3_ENDPOINT"),
+            accessKey=os.environ.get("BACKUP_S3_ACCESS_KEY"),
+            secretKey=os.environ.get("BACKUP_S3_SECRET_KEY"),
+        ),
+        os.environ.get("BACKUP_MANIFEST", "backup-manifest.json")
+    )
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(engine.backupDirectories(sys.argv[2:]), indent=2))
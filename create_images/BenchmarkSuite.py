@@ -0,0 +1,300 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+from create_images.UpscalerBenchmark import machineFingerprint, syntheticImage
+from create_images.Utils import apply_function_to_files, scan_files
+
+BENCHMARK_FILE = "benchmark-results.json"
+MASK_FILE = "res/bing-mask.png"
+IMAGE_SIZE = 1024
+TILE_SIZE = 64
+
+
+def watermarked(image: Image.Image, mask: Image.Image) -> Image.Image:
+    # the bing logo is drawn as a light, partly transparent overlay, the
+    # mask covers it with a small margin so a bit of blending is enough
+    alpha = np.asarray(mask.convert("L"), dtype=np.float32)[..., None] / 255 * 0.7
+    pixels = np.asarray(image, dtype=np.float32)
+    pixels = pixels * (1 - alpha) + 235 * alpha
+    return Image.fromarray(pixels.round().astype(np.uint8))
+
+
+def buildCorpus(directory, count, seed=0, maskFile=MASK_FILE):
+    with Image.open(maskFile) as mask:
+        mask = mask.resize((IMAGE_SIZE, IMAGE_SIZE))
+        files = []
+        for i in range(count):
+            path = os.path.join(directory, f"bench-{i:04d}.jpg")
+            watermarked(syntheticImage(IMAGE_SIZE, seed + i), mask).save(
+                path, "JPEG", quality=90
+            )
+            # fixed mtimes keep the size:mtime stamps the caches key on
+            # the same between runs; ctime cannot be set, the library order
+            # comes from writing the files one after another
+            os.utime(path, ns=(i * 1_000_000_000, i * 1_000_000_000))
+            files.append(path)
+
+    ctimes = [os.stat(path).st_ctime_ns for path in files]
+    if any(a >= b for a, b in zip(ctimes, ctimes[1:])):
+        logging.warning(
+            "Corpus files share creation times, library order is not stable"
+        )
+    return files
+
+
+def measure(function, items, repeat=1):
+    samples = []
+    for _ in range(repeat):
+        for item in items:
+            startTime = time.perf_counter()
+            function(item)
+            samples.append(time.perf_counter() - startTime)
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "runs": len(samples),
+    }
+
+
+def benchInpaint(files, mask, repeat):
+    from PyQt5.QtGui import QPixmap
+    from create_images.ImageGenerationWorker import ImageGenerationWorker
+
+    worker = ImageGenerationWorker(
+        outDir=None, historyFile=None, generator=None, watermarkMask=mask
+    )
+    pixmaps = [QPixmap(file) for file in files]
+    return measure(worker.inpaintWatermark, pixmaps, repeat)
+
+
+def benchMetadata(files, repeat):
+    import pathlib
+    from create_images.ImageGenerationWorker import ImageGenerationWorker
+
+    worker = ImageGenerationWorker(
+        outDir=None, historyFile=None, generator=None, watermarkMask=None
+    )
+    return measure(
+        lambda file: worker.includeMetadata(
+            pathlib.Path(file), "a synthetic benchmark prompt"
+        ),
+        files,
+        repeat
+    )
+
+
+def benchLoadLibrary(directory, upscaledDir, repeat):
+    from create_images.Library import loadLibrary
+    return measure(
+        lambda _: loadLibrary(directory, upscaledDir), range(repeat)
+    )
+
+
+def benchWalk(directory, repeat):
+    return measure(
+        lambda _: apply_function_to_files(lambda f: None, directory),
+        range(repeat)
+    )
+
+
+def benchScan(directory, repeat):
+    return measure(
+        lambda _: sum(1 for _ in scan_files(directory, (".jpg",))),
+        range(repeat)
+    )
+
+
+def benchNavigation(directory, upscaledDir, repeat):
+    from create_images.Img import Img
+    from create_images.Library import loadLibrary
+
+    images = loadLibrary(directory, upscaledDir)
+    label = Img()
+    label.setScaledContents(True)
+    label.resize(800, 800)
+    label.show()
+
+    def show(data):
+        label.setPixmap(data.image)
+        label.setPrompt(data.prompt)
+        label.setFilePath(data.file)
+        label.setUpscaled(data.upscaled)
+        label.repaint()
+
+    try:
+        return measure(show, images, repeat)
+    finally:
+        label.close()
+
+
+def benchUpscaleTile(files, method, repeat):
+    try:
+        from create_images.Upscaler import loadUpscaler
+        upscaler = loadUpscaler(method, 4)
+    except (ImportError, OSError) as e:
+        # the models are optional downloads, a tree without them still
+        # benchmarks everything else
+        return {"skipped": str(e)}
+
+    tiles = []
+    for file in files:
+        with Image.open(file) as image:
+            tiles.append(image.convert("RGB").crop((0, 0, TILE_SIZE, TILE_SIZE)))
+    upscaler(tiles[0])  # warm up
+    return measure(upscaler, tiles, repeat)
+
+
+def run(count, repeat, seed, method):
+    import cv2
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication(sys.argv)
+    mask = cv2.imread(MASK_FILE, cv2.IMREAD_GRAYSCALE)
+
+    workDir = tempfile.mkdtemp(prefix="bic-bench-")
+    try:
+        libraryDir = os.path.join(workDir, "library")
+        upscaledDir = os.path.join(workDir, "upscaled")
+        scratchDir = os.path.join(workDir, "scratch")
+        for directory in (libraryDir, upscaledDir, scratchDir):
+            os.mkdir(directory)
+
+        files = buildCorpus(libraryDir, count, seed)
+        scratch = []
+        for file in files:
+            scratch.append(shutil.copy(file, scratchDir))
+
+        sample = files[:min(len(files), 8)]
+        results = {}
+        cases = {
+            "inpaintWatermark": lambda: benchInpaint(sample, mask, repeat),
+            "includeMetadata": lambda: benchMetadata(scratch[:len(sample)], repeat),
+            "loadLibrary": lambda: benchLoadLibrary(libraryDir, upscaledDir, repeat),
+            "apply_function_to_files": lambda: benchWalk(libraryDir, repeat),
+            "scan_files": lambda: benchScan(libraryDir, repeat),
+            "navigation": lambda: benchNavigation(libraryDir, upscaledDir, repeat),
+            f"upscaleTile[{method}]": lambda: benchUpscaleTile(sample, method, repeat),
+        }
+        for name, case in cases.items():
+            logging.info(f"Running {name}")
+            results[name] = case()
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    return {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "machine": machineFingerprint(),
+        "python": platform.python_version(),
+        "config": {"count": count, "repeat": repeat, "seed": seed},
+        "results": results,
+    }
+
+
+def loadRuns(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return []
+
+
+def saveRuns(path, runs):
+    tmpPath = f"{path}.tmp"
+    with open(tmpPath, "w") as file:
+        json.dump(runs, file, indent=1)
+    os.replace(tmpPath, path)
+
+
+def findBaseline(runs, current):
+    # timings are only comparable on the same machine with the same corpus
+    for previous in reversed(runs):
+        if (
+            previous["machine"] == current["machine"]
+            and previous["config"] == current["config"]
+        ):
+            return previous
+    return None
+
+
+def regressions(baseline, current, threshold, minimum):
+    found = []
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if not previous or "median" not in previous or "median" not in result:
+            continue
+        before, after = previous["median"], result["median"]
+        if after > before * (1 + threshold) and after - before > minimum:
+            found.append((name, before, after))
+    return found
+
+
+def printRun(current, baseline):
+    print(f"{'case':<28} {'median':>10} {'min':>10} {'baseline':>10} {'change':>8}")
+    for name, result in current["results"].items():
+        if "skipped" in result:
+            print(f"{name:<28} skipped: {result['skipped']}")
+            continue
+        previous = (baseline or {}).get("results", {}).get(name, {})
+        before = previous.get("median")
+        change = (
+            f"{(result['median'] / before - 1) * 100:+.1f}%" if before else ""
+        )
+        print(
+            f"{name:<28} {result['median'] * 1000:>8.2f}ms"
+            f" {result['min'] * 1000:>8.2f}ms"
+            f" {before * 1000 if before else float('nan'):>8.2f}ms"
+            f" {change:>8}"
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--method", default="esrgan")
+    parser.add_argument("--results", default=BENCHMARK_FILE)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--threshold", type=float, default=0.15)
+    parser.add_argument("--minimum-ms", type=float, default=1.0)
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    current = run(args.count, args.repeat, args.seed, args.method)
+
+    runs = loadRuns(args.results)
+    baseline = findBaseline(
+        loadRuns(args.baseline) if args.baseline else runs, current
+    )
+    printRun(current, baseline)
+
+    if not args.no_save:
+        saveRuns(args.results, runs + [current])
+
+    if baseline is None:
+        print("no comparable baseline, this run becomes the baseline")
+        sys.exit(0)
+
+    found = regressions(
+        baseline, current, args.threshold, args.minimum_ms / 1000
+    )
+    for name, before, after in found:
+        print(
+            f"REGRESSION {name}: {before * 1000:.2f}ms -> {after * 1000:.2f}ms "
+            f"(+{(after / before - 1) * 100:.1f}%)"
+        )
+    sys.exit(1 if found else 0)
@@ -0,0 +1,266 @@
+import argparse
+import io
+import logging
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+from create_images.BenchmarkSuite import IMAGE_SIZE, MASK_FILE, watermarked
+from create_images.UpscalerBenchmark import syntheticImage
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        if self.rate <= 0:
+            return True
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class BingStub:
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency=3.0,
+        jitter=1.0,
+        downloadLatency=0.05,
+        errorRate=0.0,
+        blockRate=0.0,
+        downloadErrorRate=0.0,
+        rate=0.0,
+        burst=10,
+        imagesPerPrompt=4,
+        variants=8,
+        seed=0,
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.downloadLatency = downloadLatency
+        self.errorRate = errorRate
+        self.blockRate = blockRate
+        self.downloadErrorRate = downloadErrorRate
+        self.imagesPerPrompt = imagesPerPrompt
+        self.throttle = TokenBucket(rate, burst)
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.stats = {
+            "created": 0,
+            "throttled": 0,
+            "failed": 0,
+            "blocked": 0,
+            "polls": 0,
+            "downloads": 0,
+            "downloadErrors": 0,
+        }
+        self.images = self.renderImages(variants, seed)
+
+        class Handler(BingStubHandler):
+            stub = self
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @staticmethod
+    def renderImages(variants, seed):
+        # rendered once up front so that serving an image costs no more
+        # than the network copy
+        images = []
+        with Image.open(MASK_FILE) as mask:
+            mask = mask.resize((IMAGE_SIZE, IMAGE_SIZE))
+            for i in range(variants):
+                buffer = io.BytesIO()
+                watermarked(syntheticImage(IMAGE_SIZE, seed + i), mask).save(
+                    buffer, "JPEG", quality=90
+                )
+                images.append(buffer.getvalue())
+        return images
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="bingStub", daemon=True
+        )
+        self.thread.start()
+        logging.info(f"Bing stub listening on {self.url}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def roll(self, probability):
+        with self.lock:
+            return self.random.random() < probability
+
+    def createJob(self, prompt):
+        with self.lock:
+            delay = max(0.0, self.random.gauss(self.latency, self.jitter))
+            jobId = uuid.uuid4().hex
+            self.jobs[jobId] = {
+                "prompt": prompt,
+                "readyAt": time.monotonic() + delay,
+                "images": [
+                    self.random.randrange(len(self.images))
+                    for _ in range(self.imagesPerPrompt)
+                ],
+            }
+            self.stats["created"] += 1
+            return jobId
+
+    def job(self, jobId):
+        with self.lock:
+            return self.jobs.get(jobId)
+
+
+class BingStubHandler(BaseHTTPRequestHandler):
+    stub: BingStub = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.debug(f"bing stub: {format % args}")
+
+    def reply(self, status, body=b"", contentType="text/html", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        url = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        if url.path != "/images/create":
+            return self.reply(404)
+
+        query = urllib.parse.parse_qs(url.query)
+        prompt = query.get("q", [""])[0]
+
+        if not self.stub.throttle.take():
+            self.stub.count("throttled")
+            return self.reply(429, b"Too many requests")
+        if self.stub.roll(self.stub.errorRate):
+            self.stub.count("failed")
+            return self.reply(500, b"Internal error")
+        if self.stub.roll(self.stub.blockRate):
+            self.stub.count("blocked")
+            return self.reply(200, b"<div>This prompt has been blocked</div>")
+
+        jobId = self.stub.createJob(prompt)
+        location = (
+            f"/images/create?q={urllib.parse.quote(prompt)}"
+            f"&rt=4&FORM=GENCRE&id={jobId}"
+        )
+        self.reply(302, headers={"Location": location})
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+
+        if url.path == "/images/create":
+            return self.reply(200, b"<html><body>creating</body></html>")
+
+        match = re.fullmatch(r"/images/create/async/results/(\w+)", url.path)
+        if match:
+            self.stub.count("polls")
+            job = self.stub.job(match.group(1))
+            if job is None:
+                return self.reply(404)
+            if time.monotonic() < job["readyAt"]:
+                # an empty body makes the client sleep and poll again
+                return self.reply(200)
+            body = "".join(
+                f'<img class="mimg" src="{self.stub.url}/th/id/{match.group(1)}-{n}'
+                f'-{variant}.jpg?w=270&h=270&c=6">'
+                for n, variant in enumerate(job["images"])
+            )
+            return self.reply(200, body.encode())
+
+        match = re.fullmatch(r"/th/id/\w+-\d+-(\d+)\.jpg", url.path)
+        if match:
+            time.sleep(self.stub.downloadLatency)
+            if self.stub.roll(self.stub.downloadErrorRate):
+                self.stub.count("downloadErrors")
+                return self.reply(503, b"Service unavailable")
+            self.stub.count("downloads")
+            return self.reply(
+                200, self.stub.images[int(match.group(1))], "image/jpeg"
+            )
+
+        self.reply(404)
+
+
+def pointGeneratorAt(url):
+    # the library reads BING_URL into a module global at import time
+    import BingImageCreator
+    BingImageCreator.BING_URL = url
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=3.0)
+    parser.add_argument("--jitter", type=float, default=1.0)
+    parser.add_argument("--download-latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--block-rate", type=float, default=0.0)
+    parser.add_argument("--download-error-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=0.0)
+    parser.add_argument("--burst", type=int, default=10)
+    args = parser.parse_args()
+
+    stub = BingStub(
+        args.host,
+        args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        downloadLatency=args.download_latency,
+        errorRate=args.error_rate,
+        blockRate=args.block_rate,
+        downloadErrorRate=args.download_error_rate,
+        rate=args.rate,
+        burst=args.burst,
+    )
+    print(f"set BING_URL={stub.url} before starting the application")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(stub.stats)
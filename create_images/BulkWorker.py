@@ -0,0 +1,155 @@
+import logging
+import os
+import threading
+from PyQt5.QtMultimedia import *
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import *
+from PIL import Image
+import PIL.ExifTags
+from create_images.Exporter import exportFiles as runExport
+from create_images.UpscaleCache import UpscaleCache
+
+BATCH_SIZE = 32
+
+
+def retagFile(file, prompt, upscaleCache: UpscaleCache = None, tmpSuffix=".retag"):
+    # re-encoding changes size and mtime, the upscale cache memo has to
+    # follow or the upscaled twin is lost
+    digest = upscaleCache.fileDigest(file) if upscaleCache else None
+
+    tmpFile = file + tmpSuffix
+    with Image.open(file) as image:
+        metadata = image.getexif()
+        metadata[PIL.ExifTags.Base.XPComment] = prompt
+        # the jpeg quantization tables and subsampling are reused, pillow's
+        # defaults would degrade the image on every retag
+        options = (
+            {"quality": "keep", "subsampling": "keep"}
+            if image.format == "JPEG" else {}
+        )
+        image.save(tmpFile, format=image.format, exif=metadata, **options)
+
+    def commit():
+        os.replace(tmpFile, file)
+        if digest:
+            upscaleCache.rememberFile(file, digest)
+    return commit
+
+
+def newSummary(operation, total):
+    return {
+        "operation": operation,
+        "files": total,
+        "done": [],
+        "errors": [],
+        "cancelled": False,
+    }
+
+
+class BulkWorker(QObject):
+    def __init__(
+        self,
+        upscaleCache: UpscaleCache = None,
+        exportWorkers=None,
+        *args,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+
+        self.upscaleCache = upscaleCache
+        self.exportWorkers = exportWorkers
+        self.cancelled = threading.Event()
+
+    progress = pyqtSignal(int, int)
+    completed = pyqtSignal(object)
+    started = pyqtSignal()
+    finished = pyqtSignal()
+
+    def cancel(self):
+        # called directly from the GUI thread, this thread is busy
+        self.cancelled.set()
+
+    def batches(self, files, summary):
+        for start in range(0, len(files), BATCH_SIZE):
+            if self.cancelled.is_set():
+                summary["cancelled"] = True
+                return
+            yield files[start:start + BATCH_SIZE]
+            self.progress.emit(min(start + BATCH_SIZE, len(files)), len(files))
+
+    def run(self, operation, files, job, cleanup=None):
+        self.started.emit()
+        self.cancelled.clear()
+        summary = newSummary(operation, len(files))
+        self.progress.emit(0, len(files))
+        try:
+            for batch in self.batches(files, summary):
+                job(batch, summary)
+        except Exception as e:
+            logging.exception(f"Bulk {operation} failed")
+            summary["errors"].append(("", e))
+        finally:
+            if cleanup is not None:
+                cleanup()
+            self.completed.emit(summary)
+            self.finished.emit()
+
+    @pyqtSlot(object)
+    def deleteFiles(self, files):
+        def job(batch, summary):
+            for file in batch:
+                try:
+                    os.remove(file)
+                    summary["done"].append(file)
+                except OSError as e:
+                    summary["errors"].append((file, e))
+
+        self.run("delete", list(files), job)
+
+    @pyqtSlot(object, str)
+    def retagFiles(self, files, prompt):
+        def job(batch, summary):
+            # every file of the batch is rewritten next to itself first, then
+            # the whole batch is swapped in with one pass of renames
+            commits = []
+            for file in batch:
+                try:
+                    commits.append((file, retagFile(file, prompt, self.upscaleCache)))
+                except Exception as e:
+                    summary["errors"].append((file, e))
+            for file, commit in commits:
+                try:
+                    commit()
+                    summary["done"].append(file)
+                except OSError as e:
+                    summary["errors"].append((file, e))
+
+        self.run(
+            "retag", list(files), job,
+            cleanup=self.upscaleCache.save if self.upscaleCache else None
+        )
+
+    @pyqtSlot(object, str, str, int)
+    def exportFiles(self, files, target, format, maxSize):
+        # the exporter has its own process pool and streams into the
+        # target, so it is not split into batches here
+        self.started.emit()
+        self.cancelled.clear()
+        summary = newSummary("export", len(files))
+        try:
+            summary = runExport(
+                files,
+                target,
+                format=format,
+                maxSize=maxSize or None,
+                workers=self.exportWorkers,
+                cancelled=self.cancelled.is_set,
+                progress=self.progress.emit,
+            )
+        except Exception as e:
+            logging.exception("Bulk export failed")
+            summary["errors"].append(("", e))
+        finally:
+            self.completed.emit(summary)
+            self.finished.emit()
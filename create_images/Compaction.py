@@ -0,0 +1,296 @@
+import argparse
+import functools
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+import numpy as np
+from PIL import Image
+import PIL.ExifTags
+from create_images.UpscaleCache import UpscaleCache
+from create_images.Utils import map_files, psnr, scan_files
+
+JPEG_EXTENSIONS = (".jpg", ".jpeg", ".jfif")
+# upscaled twins may be stored under these instead of the original name,
+# the library looks for them in this order (see Library.findUpscaled)
+COMPACT_EXTENSIONS = (".webp", ".jxl")
+METHODS = ("jpegtran", "webp", "jxl")
+TMP_SUFFIX = ".compact"
+# a verified copy about to replace the original, see recoverLeftovers
+VERIFIED_SUFFIX = ".compacted"
+
+
+class VerificationError(Exception):
+    pass
+
+
+def readPrompt(path):
+    with Image.open(path) as image:
+        return image.getexif().get(PIL.ExifTags.Base.XPComment)
+
+
+def decode(path):
+    with Image.open(path) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def run(command):
+    subprocess.run(command, check=True, capture_output=True)
+
+
+def encodeJpegtran(source, destination, options):
+    # huffman optimization and progressive scans rewrite only the entropy
+    # coding, the dct coefficients and every marker (-copy all) stay
+    run([
+        options.get("jpegtran", "jpegtran"),
+        "-copy", "all", "-optimize", "-progressive",
+        "-outfile", destination, source
+    ])
+
+
+def encodeWebp(source, destination, options):
+    with Image.open(source) as image:
+        image.save(
+            destination, "WEBP",
+            quality=options.get("quality", 90),
+            method=6,
+            exif=image.getexif()
+        )
+
+
+def encodeJxl(source, destination, options):
+    # jpeg bitstream reconstruction, the original file can be restored
+    # byte for byte with djxl
+    run([
+        options.get("cjxl", "cjxl"), source, destination,
+        "--lossless_jpeg=1", "--quiet"
+    ])
+
+
+def verifyJpegtran(source, output, options):
+    if not np.array_equal(decode(source), decode(output)):
+        raise VerificationError("decoded pixels differ")
+    if readPrompt(source) != readPrompt(output):
+        raise VerificationError("prompt was not preserved")
+
+
+def verifyWebp(source, output, options):
+    reference, image = decode(source), decode(output)
+    if reference.shape != image.shape:
+        raise VerificationError("image size changed")
+    quality = psnr(reference, image)
+    if quality < options.get("minPsnr", 40):
+        raise VerificationError(f"psnr {quality:.1f} dB is below the floor")
+    if readPrompt(source) != readPrompt(output):
+        raise VerificationError("prompt was not preserved")
+
+
+def verifyJxl(source, output, options):
+    restored = output + ".jpg"
+    try:
+        run([options.get("djxl", "djxl"), output, restored, "--quiet"])
+        with open(source, "rb") as a, open(restored, "rb") as b:
+            if a.read() != b.read():
+                raise VerificationError("reconstructed jpeg differs")
+    finally:
+        if os.path.exists(restored):
+            os.remove(restored)
+
+
+ENCODERS = {
+    "jpegtran": (encodeJpegtran, verifyJpegtran, None),
+    "webp": (encodeWebp, verifyWebp, ".webp"),
+    "jxl": (encodeJxl, verifyJxl, ".jxl"),
+}
+
+
+def overwriteInPlace(source, path):
+    # the library is ordered by creation time, rewriting the existing file
+    # keeps it where a rename would not; the verified copy carries the
+    # original times and stays on disk until the rewrite is done, so an
+    # interrupted rewrite is finished by recoverLeftovers
+    stat = os.stat(source)
+    with open(source, "rb") as input, open(path, "r+b") as output:
+        shutil.copyfileobj(input, output)
+        output.truncate()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.remove(source)
+
+
+def recoverLeftovers(directory, recursive=True):
+    # unverified output is thrown away, a verified copy means the original
+    # may be half rewritten and the rewrite has to be finished
+    recovered = 0
+    for entry in scan_files(
+        directory, (TMP_SUFFIX, VERIFIED_SUFFIX), recursive=recursive
+    ):
+        if entry.name.endswith(TMP_SUFFIX):
+            os.remove(entry.path)
+            continue
+        path = entry.path[:-len(VERIFIED_SUFFIX)]
+        if os.path.exists(path):
+            overwriteInPlace(entry.path, path)
+        else:
+            os.replace(entry.path, path)
+        logging.info(f"Finished interrupted compaction of \"{path}\"")
+        recovered += 1
+    return recovered
+
+
+def compactFile(path, method="jpegtran", options=None):
+    # runs in a worker process; returns (status, bytes before, bytes after,
+    # upscale cache stamp before)
+    options = options or {}
+    encode, verify, extension = ENCODERS[method]
+
+    if not path.lower().endswith(JPEG_EXTENSIONS):
+        return "skipped", 0, 0, None
+
+    stamp = UpscaleCache.stamp(path)
+    before = os.path.getsize(path)
+    # not an image extension, a leftover never shows up in the library
+    tmpPath = path + TMP_SUFFIX
+    try:
+        encode(path, tmpPath, options)
+        verify(path, tmpPath, options)
+        after = os.path.getsize(tmpPath)
+        if after >= before:
+            os.remove(tmpPath)
+            return "larger", before, before, stamp
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+    if extension is None:
+        verifiedPath = path + VERIFIED_SUFFIX
+        stat = os.stat(path)
+        os.utime(tmpPath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        os.replace(tmpPath, verifiedPath)
+        overwriteInPlace(verifiedPath, path)
+    else:
+        os.replace(tmpPath, os.path.splitext(path)[0] + extension)
+        os.remove(path)
+    return "compacted", before, after, stamp
+
+
+def compactDirectory(
+    directory,
+    method="jpegtran",
+    options=None,
+    workers=None,
+    recursive=True,
+    upscaleCache: UpscaleCache = None
+):
+    summary = {
+        "directory": str(directory),
+        "method": method,
+        "files": 0,
+        "compacted": 0,
+        "bytesBefore": 0,
+        "bytesAfter": 0,
+        "errors": [],
+    }
+
+    startTime = time.perf_counter()
+    summary["recovered"] = recoverLeftovers(directory, recursive)
+    for path, (status, before, after, stamp) in map_files(
+        functools.partial(compactFile, method=method, options=options),
+        scan_files(directory, JPEG_EXTENSIONS, recursive=recursive),
+        workers=os.cpu_count() if workers is None else workers,
+        processes=True,
+        ordered=False,
+        errors=summary["errors"]
+    ):
+        summary["files"] += 1
+        summary["bytesBefore"] += before
+        summary["bytesAfter"] += after
+        if status == "compacted":
+            summary["compacted"] += 1
+            # a new size is a new stamp, the upscaled twin would be lost
+            if upscaleCache is not None:
+                upscaleCache.repointFile(stamp, path)
+        logging.debug(f"{status}: \"{path}\" {before} -> {after}")
+
+    summary["seconds"] = time.perf_counter() - startTime
+    summary["bytesSaved"] = summary["bytesBefore"] - summary["bytesAfter"]
+    return summary
+
+
+def printSummary(summary):
+    saved = summary["bytesSaved"]
+    before = summary["bytesBefore"] or 1
+    print(
+        f"{summary['directory']} [{summary['method']}]: "
+        f"{summary['compacted']} of {summary['files']} files compacted, "
+        f"{saved / 2 ** 20:.1f} MiB saved ({saved / before * 100:.1f}%) "
+        f"in {summary['seconds']:.1f} s"
+    )
+    for path, e in summary["errors"]:
+        print(f"kept: {path}: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    import dotenv
+
+    logging.basicConfig(level=logging.INFO)
+    config = dotenv.dotenv_values(".env")
+
+    parser = argparse.ArgumentParser(
+        description="Recompresses the library in place. Close the app first, "
+        "it may read an image while it is being rewritten."
+    )
+    parser.add_argument("--output-dir", default=config.get("OUTPUT_DIR"))
+    parser.add_argument("--upscaled-dir", default=config.get("UPSCALED_DIR"))
+    parser.add_argument(
+        "--upscaled-method", choices=METHODS, default="jpegtran",
+        help="webp and jxl rename the twins, jxl needs a qt jxl image plugin"
+    )
+    parser.add_argument("--webp-quality", type=int, default=90)
+    parser.add_argument("--min-psnr", type=float, default=40)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    options = {"quality": args.webp_quality, "minPsnr": args.min_psnr}
+    for tool in ("jpegtran", "cjxl", "djxl"):
+        if shutil.which(tool) is None:
+            logging.info(f"{tool} is not on the path")
+
+    upscaleCache = None
+    if args.upscaled_dir:
+        # only the file memo is updated, scale and model name keys of
+        # entries that are never read here
+        upscaleCache = UpscaleCache(
+            directory=config.get(
+                "UPSCALE_CACHE_DIR", os.path.join(args.upscaled_dir, "cache")
+            ),
+            budget=int(config.get("UPSCALE_CACHE_BUDGET_MB", "2048")) * 2 ** 20,
+            scale=config.get("UPSCALER_SCALE", "4"),
+            model="compaction"
+        )
+
+    summaries = []
+    if args.output_dir:
+        # originals are only ever recompressed losslessly and keep their name
+        summaries.append(compactDirectory(
+            args.output_dir, "jpegtran", options, args.workers,
+            upscaleCache=upscaleCache
+        ))
+    if args.upscaled_dir:
+        # the upscale cache lives below the upscaled directory by default
+        summaries.append(compactDirectory(
+            args.upscaled_dir, args.upscaled_method, options, args.workers,
+            recursive=False
+        ))
+
+    if upscaleCache is not None:
+        upscaleCache.save()
+
+    for summary in summaries:
+        printSummary(summary)
+    print(
+        f"total saved: "
+        f"{sum(s['bytesSaved'] for s in summaries) / 2 ** 20:.1f} MiB"
+    )
@@ -1,21 +1,114 @@
+import json
 import uuid
 import cv2
+import shutil
 import sys
 import os
-from Utils import apply_function_to_files
+from PIL import Image
+from Inpaint import INPAINTERS, makeInpainter
+from Utils import IMAGE_EXTENSIONS, map_files, scan_files
+from Watermark import WatermarkDetector, isProcessed, markProcessed
 
+BATCH_SIZE = 16
+# files the detector found clean keep their bytes, so they cannot carry the
+# processed marker; their size and mtime are remembered here instead
+CLEAN_FILE = ".watermark-clean.json"
+
+
+def copy_unchanged(i, o):
+    # untouched files are copied byte for byte, re-encoding would only
+    # lose quality
+    if os.path.abspath(i) != os.path.abspath(o):
+        shutil.copy2(i, o)
+
+
+def stamp(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def load_clean(path):
+    try:
+        with open(path) as file:
+            return set(json.load(file))
+    except (OSError, ValueError):
+        return set()
+
+
+def save_clean(path, clean):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(sorted(clean), file)
+    os.replace(tmp_path, path)
+
+
+def save_inpainted(i, o, res):
+    # saved through pillow to carry the prompt over and mark the file
+    with Image.open(i) as original:
+        metadata = markProcessed(original.getexif())
+    Image.fromarray(cv2.cvtColor(res, cv2.COLOR_BGR2RGB)).save(
+        o, exif=metadata, quality=95
+    )
+    print(f"file saved as: \"{o}\"")
+
+
+def make_inpaint_all(mask, method="telea", clean=None):
+    detector = WatermarkDetector(mask)
+    inpainter = makeInpainter(method, mask)
+    clean = set() if clean is None else clean
+
+    def pending(i, o):
+        if isProcessed(i) or stamp(i) in clean:
+            copy_unchanged(i, o)
+            print(f"file: \"{i}\" already processed, skipped")
+            return None
+
+        src = cv2.imread(i)
+        if detector.present(src) is False:
+            copy_unchanged(i, o)
+            clean.add(stamp(i))
+            print(f"file: \"{i}\" has no watermark, skipped")
+            return None
+        return src
 
-def make_inpaint_all(mask):
     def inpaint_all(i, o):
         try:
+            src = pending(i, o)
+            if src is None:
+                return
             print(f"file: \"{i}\" started processing")
-            src = cv2.imread(i)
-            res = cv2.inpaint(src, mask, 3, cv2.INPAINT_TELEA)
-            cv2.imwrite(o, res)
-            print(f"file saved as: \"{o}\"")
+            save_inpainted(i, o, inpainter(src))
         except Exception as e:
             print(e)
             return
+
+    def inpaint_batch(pairs):
+        # images of the same size share one call to the inpainter, the
+        # stencil backend fills the whole batch with a single product
+        groups = {}
+        for i, o in pairs:
+            try:
+                src = pending(i, o)
+            except Exception as e:
+                print(e)
+                continue
+            if src is not None:
+                groups.setdefault(src.shape, []).append((i, o, src))
+
+        for group in groups.values():
+            print(f"processing {len(group)} files")
+            try:
+                results = inpainter.batch([src for _, _, src in group])
+            except Exception as e:
+                print(e)
+                continue
+            for (i, o, _), res in zip(group, results):
+                try:
+                    save_inpainted(i, o, res)
+                except Exception as e:
+                    print(e)
+
+    inpaint_all.batch = inpaint_batch
     return inpaint_all
 
 
@@ -46,12 +139,47 @@ def make_change_extension(from_ext, to_ext):
 
 
 if __name__ == "__main__":
-    apply_function_to_files(
-        make_inpaint_all(
-            cv2.imread(
-                sys.argv[3],
-                cv2.IMREAD_GRAYSCALE)
-        ),
-        sys.argv[1],
-        sys.argv[2]
+    input_directory, output_directory = sys.argv[1], sys.argv[2]
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else os.cpu_count()
+    # run `python -m create_images.InpaintBenchmark` to compare the methods
+    method = sys.argv[5] if len(sys.argv) > 5 else "telea"
+    if method not in INPAINTERS:
+        sys.exit(
+            f"unknown method \"{method}\", "
+            f"expected one of: {', '.join(INPAINTERS)}"
+        )
+    clean_file = os.path.join(output_directory, CLEAN_FILE)
+    clean = load_clean(clean_file)
+    inpaint_all = make_inpaint_all(
+        cv2.imread(sys.argv[3], cv2.IMREAD_GRAYSCALE), method, clean
     )
+
+    def outputs(entries):
+        for entry in entries:
+            o = os.path.join(
+                output_directory, os.path.relpath(entry.path, input_directory)
+            )
+            os.makedirs(os.path.dirname(o), exist_ok=True)
+            yield entry.path, o
+
+    def batches(pairs):
+        batch = []
+        for pair in pairs:
+            batch.append(pair)
+            if len(batch) == BATCH_SIZE:
+                yield tuple(batch)
+                batch = []
+        if batch:
+            yield tuple(batch)
+
+    # cv2 and numpy release the gil while inpainting, threads are enough
+    for _ in map_files(
+        inpaint_all.batch,
+        batches(outputs(scan_files(input_directory, IMAGE_EXTENSIONS))),
+        workers=workers,
+        ordered=False
+    ):
+        pass
+
+    os.makedirs(output_directory, exist_ok=True)
+    save_clean(clean_file, clean)
@@ -0,0 +1,64 @@
+from PyQt5.QtMultimedia import *
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import *
+from create_images.Exporter import FORMATS
+
+
+class ExportDialog(QDialog):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.setWindowTitle(self.tr("Export"))
+
+        layout = QFormLayout()
+
+        self.format = QComboBox(self)
+        self.format.addItems(list(FORMATS))
+
+        self.maxSize = QSpinBox(self)
+        self.maxSize.setRange(0, 16384)
+        self.maxSize.setSingleStep(256)
+        self.maxSize.setSpecialValueText(self.tr("Original size"))
+        self.maxSize.setSuffix(" px")
+
+        target = QHBoxLayout()
+        self.target = QLineEdit(self)
+        folderButton = QPushButton(self.tr("Folder..."), self)
+        folderButton.clicked.connect(self.chooseFolder)
+        archiveButton = QPushButton(self.tr("Archive..."), self)
+        archiveButton.clicked.connect(self.chooseArchive)
+        target.addWidget(self.target)
+        target.addWidget(folderButton)
+        target.addWidget(archiveButton)
+
+        buttons = QDialogButtonBox(
+            QDialogButtonBox.Ok | QDialogButtonBox.Cancel, parent=self
+        )
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        layout.addRow(self.tr("Format"), self.format)
+        layout.addRow(self.tr("Longest side"), self.maxSize)
+        layout.addRow(self.tr("Target"), target)
+        layout.addRow(buttons)
+        self.setLayout(layout)
+
+    @pyqtSlot()
+    def chooseFolder(self):
+        directory = QFileDialog.getExistingDirectory(self, self.tr("Export to"))
+        if directory:
+            self.target.setText(directory)
+
+    @pyqtSlot()
+    def chooseArchive(self):
+        path, _ = QFileDialog.getSaveFileName(
+            self, self.tr("Export to"),
+            "",
+            "Archives (*.zip *.tar *.tar.gz *.tgz)"
+        )
+        if path:
+            self.target.setText(path)
+
+    def options(self):
+        return self.format.currentText(), self.maxSize.value()
@@ -0,0 +1,249 @@
+import argparse
+import functools
+import io
+import logging
+import os
+import pathlib
+import sys
+import tarfile
+import time
+import zipfile
+from PIL import Image
+from create_images.Utils import IMAGE_EXTENSIONS, map_files, scan_files
+
+# format name -> pillow format, extension and encoder options
+FORMATS = {
+    "jpeg": ("JPEG", ".jpg", {"quality": 95, "subsampling": 0}),
+    "png": ("PNG", ".png", {"compress_level": 6}),
+    "webp": ("WEBP", ".webp", {"quality": 90, "method": 4}),
+    "original": (None, None, {}),
+}
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+def exportName(file, format):
+    _, extension, _ = FORMATS[format]
+    name = os.path.basename(file)
+    if extension is None:
+        return name
+    return os.path.splitext(name)[0] + extension
+
+
+def transcode(file, format="jpeg", maxSize=None):
+    # runs in a worker process, only the encoded bytes travel back
+    pillowFormat, _, options = FORMATS[format]
+    if pillowFormat is None and not maxSize:
+        return pathlib.Path(file).read_bytes()
+
+    with Image.open(file) as image:
+        sourceFormat = image.format
+        pillowFormat = pillowFormat or sourceFormat
+        resize = bool(maxSize) and max(image.size) > maxSize
+        # nothing to change, re-encoding would only lose another generation
+        if pillowFormat == sourceFormat and not resize:
+            return pathlib.Path(file).read_bytes()
+        if not options:
+            # a resized original is encoded like an export to its format
+            options = next(
+                (
+                    formatOptions
+                    for name, _, formatOptions in FORMATS.values()
+                    if name == pillowFormat
+                ),
+                {}
+            )
+
+        # the prompt lives in the exif block, it goes along with the pixels
+        metadata = image.getexif()
+        if resize:
+            image.thumbnail((maxSize, maxSize), Image.LANCZOS)
+        if pillowFormat == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        buffer = io.BytesIO()
+        image.save(buffer, pillowFormat, exif=metadata, **options)
+        return buffer.getvalue()
+
+
+class DirectorySink:
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.names = set()
+
+    def uniqueName(self, name):
+        stem, extension = os.path.splitext(name)
+        candidate, i = name, 1
+        while candidate in self.names or self.exists(candidate):
+            candidate = f"{stem}-{i}{extension}"
+            i += 1
+        self.names.add(candidate)
+        return candidate
+
+    def exists(self, name):
+        return (self.root / name).exists()
+
+    def write(self, name, data):
+        destination = self.root / self.uniqueName(name)
+        tmpPath = destination.with_name(destination.name + ".part")
+        tmpPath.write_bytes(data)
+        os.replace(tmpPath, destination)
+
+    def close(self):
+        pass
+
+    def __str__(self):
+        return self.root.as_posix()
+
+
+class ZipSink(DirectorySink):
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.names = set()
+        # images are compressed already, deflating them only costs time
+        self.archive = zipfile.ZipFile(self.path, "w", zipfile.ZIP_STORED)
+
+    def exists(self, name):
+        return False
+
+    def write(self, name, data):
+        self.archive.writestr(self.uniqueName(name), data)
+
+    def close(self):
+        self.archive.close()
+
+    def __str__(self):
+        return self.path.as_posix()
+
+
+class TarSink(DirectorySink):
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.names = set()
+        compressed = self.path.name.endswith((".tar.gz", ".tgz"))
+        self.archive = tarfile.open(self.path, "w:gz" if compressed else "w")
+
+    def exists(self, name):
+        return False
+
+    def write(self, name, data):
+        info = tarfile.TarInfo(self.uniqueName(name))
+        info.size = len(data)
+        info.mtime = time.time()
+        self.archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.archive.close()
+
+    def __str__(self):
+        return self.path.as_posix()
+
+
+def makeSink(target):
+    target = str(target)
+    if target.endswith((".tar.gz", ".tgz", ".tar")):
+        return TarSink(target)
+    if target.endswith(".zip"):
+        return ZipSink(target)
+    return DirectorySink(target)
+
+
+def exportFiles(
+    files,
+    target,
+    format="jpeg",
+    maxSize=None,
+    workers=None,
+    cancelled=None,
+    progress=None,
+):
+    # results are written as they come back from the pool, the bounded
+    # window of map_files keeps only a few encoded images in memory
+    files = list(files)
+    summary = {
+        "operation": "export",
+        "files": len(files),
+        "done": [],
+        "errors": [],
+        "cancelled": False,
+        "target": str(target),
+        "bytes": 0,
+    }
+
+    workers = os.cpu_count() if workers is None else workers
+    sink = makeSink(target)
+    startTime = time.perf_counter()
+    try:
+        for file, data in map_files(
+            functools.partial(transcode, format=format, maxSize=maxSize),
+            files,
+            workers=workers,
+            processes=True,
+            ordered=False,
+            errors=summary["errors"]
+        ):
+            sink.write(exportName(file, format), data)
+            summary["done"].append(file)
+            summary["bytes"] += len(data)
+            if progress is not None:
+                progress(len(summary["done"]) + len(summary["errors"]), len(files))
+            if cancelled is not None and cancelled():
+                summary["cancelled"] = True
+                break
+    finally:
+        sink.close()
+
+    summary["seconds"] = time.perf_counter() - startTime
+    summary["imagesPerSecond"] = (
+        len(summary["done"]) / summary["seconds"] if summary["seconds"] else 0.0
+    )
+    logging.info(
+        f"Exported {len(summary['done'])} images to \"{sink}\" "
+        f"at {summary['imagesPerSecond']:.1f} images/s"
+    )
+    return summary
+
+
+def exportFile(file, destination, maxSize=None):
+    # a single synchronous export, the format follows the extension
+    extension = os.path.splitext(str(destination))[1].lower()
+    format = next(
+        (
+            name for name, (_, formatExtension, _) in FORMATS.items()
+            if formatExtension == extension
+        ),
+        "jpeg" if extension in (".jpeg", ".jfif") else "original"
+    )
+    data = transcode(file, format, maxSize)
+    with open(destination, "wb") as output:
+        output.write(data)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("source", help="image directory")
+    parser.add_argument("target", help="directory, .zip or .tar(.gz) archive")
+    parser.add_argument("--format", choices=list(FORMATS), default="jpeg")
+    parser.add_argument("--max-size", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    summary = exportFiles(
+        (entry.path for entry in scan_files(args.source, IMAGE_EXTENSIONS)),
+        args.target,
+        format=args.format,
+        maxSize=args.max_size,
+        workers=args.workers,
+    )
+    print(
+        f"{len(summary['done'])} of {summary['files']} images, "
+        f"{summary['bytes'] / 2 ** 20:.1f} MiB in {summary['seconds']:.1f} s, "
+        f"{summary['imagesPerSecond']:.1f} images/s"
+    )
+    for file, e in summary["errors"]:
+        print(f"failed: {file}: {e}", file=sys.stderr)
+    sys.exit(1 if summary["errors"] else 0)
@@ -1,19 +1,62 @@
+import logging
+import threading
 from PyQt5.QtMultimedia import *
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-import time
+from create_images.BackupEngine import BackupEngine
+from create_images.Metrics import registry
 
 
 class ImageBackupWorker(QObject):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, engine: BackupEngine, directories, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        self.engine = engine
+        self.directories = directories
+        self.cancelled = threading.Event()
+
     backupSaved = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    progress = pyqtSignal(int, int)
     started = pyqtSignal()
     finished = pyqtSignal()
 
-    @pyqtSlot(QPixmap)
-    def backupImage(self, image: QPixmap):
-        time.sleep(5)
-        print(f"Backup of {image} finished")
+    @pyqtSlot(str)
+    def backupImage(self, file):
+        self.runBackup(self.engine.backupFiles, [file])
+
+    @pyqtSlot()
+    def backupAll(self):
+        self.runBackup(self.engine.backupDirectories, self.directories)
+
+    @pyqtSlot(object)
+    def backupFiles(self, files):
+        self.runBackup(
+            lambda paths: self.engine.backupFiles(
+                paths, self.cancelled.is_set, progress=self.progress.emit
+            ),
+            files
+        )
+
+    def cancel(self):
+        # called directly from the GUI thread, this thread is busy uploading
+        self.cancelled.set()
+
+    def runBackup(self, backup, paths):
+        self.started.emit()
+        self.cancelled.clear()
+        try:
+            with registry.stage("backup"):
+                summary = backup(paths)
+            registry.inc("backup_uploaded_bytes", summary["bytesUploaded"])
+            registry.inc("backup_files", summary["uploaded"], result="uploaded")
+            registry.inc("backup_files", summary["unchanged"], result="unchanged")
+            logging.info(f"Backup finished: {summary}")
+            self.backupSaved.emit(summary)
+        except Exception as e:
+            registry.inc("errors", stage="backup")
+            logging.exception("Backup failed")
+            self.failed.emit(e)
+        finally:
+            self.finished.emit()
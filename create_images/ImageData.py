@@ -9,3 +9,5 @@ class ImageData:
     prompt: str
     file: str
     upscaled: QPixmap = None
+    # shown from the session snapshot until the file itself is decoded
+    placeholder: bool = False
@@ -1,3 +1,4 @@
+import logging
 import os
 import uuid
 from PyQt5.QtMultimedia import *
@@ -6,12 +7,42 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 from PIL import Image
 import PIL.ExifTags
-import cv2
 import qimage2ndarray
 from create_images.ImageData import ImageData
+from create_images.Inpaint import makeInpainter
+from create_images.Metrics import registry
+from create_images.Profiling import profiled
+from create_images.SimilarityIndex import SimilarityIndex, features
+from create_images.Watermark import (
+    DEFAULT_THRESHOLD,
+    WatermarkDetector,
+    markProcessed,
+)
 import time
 
 
+DOWNLOAD_CHUNK = 16 * 1024
+PREVIEW_MIN_BYTES = 32 * 1024
+PREVIEW_INTERVAL = 0.15
+PREVIEW_SIZE = 256
+
+
+def decodePreview(data: bytes, size) -> QImage:
+    buffer = QBuffer()
+    buffer.setData(QByteArray(data))
+    buffer.open(QIODevice.ReadOnly)
+
+    reader = QImageReader(buffer, b"jpeg")
+    fullSize = reader.size()
+    if not fullSize.isValid():
+        # the header has not arrived yet
+        return None
+    reader.setScaledSize(fullSize.scaled(size, size, Qt.KeepAspectRatio))
+
+    image = reader.read()
+    return None if image.isNull() else image
+
+
 class ImageGenerationWorker(QObject):
     def __init__(
         self,
@@ -19,17 +50,30 @@ class ImageGenerationWorker(QObject):
         historyFile,
         generator,
         watermarkMask,
+        similarityIndex: SimilarityIndex = None,
+        watermarkThreshold=DEFAULT_THRESHOLD,
+        inpaintMethod="telea",
         *args,
         **kwargs
     ):
         super().__init__(*args, **kwargs)
 
         self.watermarkMask = watermarkMask
+        self.watermarkDetector = (
+            None if watermarkMask is None
+            else WatermarkDetector(watermarkMask, watermarkThreshold)
+        )
+        self.inpainter = (
+            None if watermarkMask is None
+            else makeInpainter(inpaintMethod, watermarkMask)
+        )
         self.historyFile = historyFile
         self.outDir = outDir
         self.generator = generator
+        self.similarityIndex = similarityIndex
 
     generated = pyqtSignal(object)
+    preview = pyqtSignal(str, QImage)
     started = pyqtSignal()
     finished = pyqtSignal()
 
@@ -40,7 +84,32 @@ class ImageGenerationWorker(QObject):
         # self.finished.emit()
         # return
         try:
-            imagesLinks = self.generator.get_images(prompt)
+            self.generate(prompt)
+        finally:
+            self.finished.emit()
+
+    @pyqtSlot(object)
+    def generateBatch(self, prompts):
+        # one busy period for the whole batch, every prompt shows up as
+        # soon as its images are in and a failed one does not stop the rest
+        self.started.emit()
+        try:
+            for prompt in prompts:
+                try:
+                    self.generate(prompt)
+                    registry.inc("batch_prompts", result="done")
+                except Exception:
+                    logging.exception(f"Generating \"{prompt}\" failed")
+                    registry.inc("batch_prompts", result="failed")
+        finally:
+            self.finished.emit()
+
+    @profiled("generate")
+    def generate(self, prompt):
+        try:
+            with registry.stage("create", prompt=prompt):
+                imagesLinks = self.generator.get_images(prompt)
+            registry.inc("prompts")
             generatedImages = []
 
             if not os.path.exists(self.outDir) or not os.path.isdir(self.outDir):
@@ -48,36 +117,85 @@ class ImageGenerationWorker(QObject):
 
             with open(self.historyFile, "a") as history:
                 for link in imagesLinks:
+                    outFilePath = self.getUniquePath()
+                    labels = {"prompt": prompt, "image": outFilePath.name}
+
                     with self.generator.session.get(link, stream=True) as res:
-                        # requesting image
-                        res.raise_for_status()
+                        # requesting image, previewing it while it arrives
+                        with registry.stage("download", **labels):
+                            res.raise_for_status()
+                            content = self.download(res, outFilePath.as_posix())
+                        registry.inc("downloaded_bytes", len(content))
 
                         # loading image from response
-                        pixmap = QPixmap()
-                        pixmap.loadFromData(res.content, "JPEG")
+                        with registry.stage("decode", **labels):
+                            pixmap = QPixmap()
+                            pixmap.loadFromData(content, "JPEG")
 
                         # removing watermark
-                        pixmap = self.inpaintWatermark(pixmap)
+                        with registry.stage("inpaint", **labels):
+                            if self.hasWatermark(pixmap):
+                                pixmap = self.inpaintWatermark(pixmap)
+
+                        # the processed image takes the place of the preview
+                        self.preview.emit(outFilePath.as_posix(), pixmap.toImage())
 
                         # saving image file
-                        outFilePath = self.getUniquePath()
-                        pixmap.save(outFilePath.as_posix(), "JPEG")
+                        with registry.stage("encode", **labels):
+                            pixmap.save(outFilePath.as_posix(), "JPEG")
 
                         # saving prompt to history
                         history.write(f"{prompt} :: [{outFilePath}]\n")
 
                         # including prompt to exif comment metadata tag
-                        self.includeMetadata(outFilePath, prompt)
+                        with registry.stage("exif", **labels):
+                            self.includeMetadata(outFilePath, prompt)
+
+                        # indexing image for similarity search
+                        if self.similarityIndex is not None:
+                            with registry.stage("index", **labels):
+                                self.similarityIndex.add(
+                                    outFilePath.as_posix(),
+                                    features(Image.fromarray(
+                                        qimage2ndarray.rgb_view(pixmap.toImage())
+                                    ))
+                                )
 
                         # adding image to generated images
                         generatedImages.append(
                             ImageData(pixmap, prompt, outFilePath.as_posix())
                         )
+                        registry.inc("images_generated")
             self.generated.emit(generatedImages)
+            if self.similarityIndex is not None:
+                self.similarityIndex.save()
         except Exception as e:
+            registry.inc("errors", stage="generate")
             raise e
-        finally:
-            self.finished.emit()
+
+    def download(self, res, file):
+        # the partial data is re-decoded at a fraction of the size, the jpeg
+        # decoder scales in the dct and fills what is missing with gray
+        total = int(res.headers.get("Content-Length") or 0)
+        step = max(PREVIEW_MIN_BYTES, total // 4)
+        content = bytearray()
+        previewedAt = 0
+        previewTime = 0.0
+
+        for chunk in res.iter_content(chunk_size=DOWNLOAD_CHUNK):
+            content += chunk
+            now = time.monotonic()
+            if (
+                len(content) - previewedAt >= step
+                and now - previewTime >= PREVIEW_INTERVAL
+                and len(content) != total
+            ):
+                image = decodePreview(bytes(content), PREVIEW_SIZE)
+                if image is not None:
+                    self.preview.emit(file, image)
+                    previewedAt, previewTime = len(content), now
+
+        return bytes(content)
 
     def getUniquePath(self):
         return self.outDir.absolute() / f"{uuid.uuid4()}.jpg"
@@ -86,16 +204,21 @@ class ImageGenerationWorker(QObject):
         with Image.open(outFilePath) as image:
             metadata = image.getexif()
             metadata[PIL.ExifTags.Base.XPComment] = prompt
-            image.save(outFilePath, exif=metadata)
+            image.save(outFilePath, exif=markProcessed(metadata))
+
+    def hasWatermark(self, pixmap: QPixmap):
+        present = self.watermarkDetector.present(
+            qimage2ndarray.rgb_view(pixmap.toImage())
+        )
+        registry.inc("watermark", result={
+            True: "present", False: "absent", None: "unknown"
+        }[present])
+        # when the detector cannot tell, inpaint as before
+        return present is not False
 
     def inpaintWatermark(self, pixmap: QPixmap) -> QPixmap:
         return QPixmap.fromImage(
             qimage2ndarray.array2qimage(
-                cv2.inpaint(
-                    qimage2ndarray.rgb_view(pixmap.toImage()),
-                    self.watermarkMask,
-                    3,
-                    cv2.INPAINT_TELEA
-                )
+                self.inpainter(qimage2ndarray.rgb_view(pixmap.toImage()))
             )
         )
@@ -0,0 +1,107 @@
+import os
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+from PyQt5.QtWidgets import *
+
+
+class ImageGridModel(QAbstractListModel):
+    def __init__(self, thumbnailSize=160, *args, pixelCache=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.thumbnailSize = thumbnailSize
+        self.pixelCache = pixelCache
+        self.variant = f"thumbnail-{thumbnailSize}"
+        self.files = []
+        self.captions = {}
+        self.thumbnails = {}
+
+    def setFiles(self, files, captions=None):
+        self.beginResetModel()
+        self.files = list(files)
+        self.captions = captions or {}
+        self.endResetModel()
+
+    def removeFiles(self, files):
+        files = set(files)
+        self.setFiles(
+            [file for file in self.files if file not in files], self.captions
+        )
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.files)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+
+        file = self.files[index.row()]
+
+        if role == Qt.DecorationRole:
+            return self.thumbnail(file)
+        if role == Qt.DisplayRole:
+            return self.captions.get(file)
+        if role == Qt.ToolTipRole:
+            return os.path.basename(file)
+        if role == Qt.UserRole:
+            return file
+        return None
+
+    def thumbnail(self, file):
+        # thumbnails are only decoded once the view asks for them, and the
+        # reader decodes straight to the small size
+        if file not in self.thumbnails and self.pixelCache is not None:
+            image = self.pixelCache.get(file, self.variant)
+            if image is not None:
+                self.thumbnails[file] = QPixmap.fromImage(image)
+        if file not in self.thumbnails:
+            reader = QImageReader(file)
+            size = reader.size()
+            if size.isValid():
+                reader.setScaledSize(
+                    size.scaled(
+                        self.thumbnailSize,
+                        self.thumbnailSize,
+                        Qt.KeepAspectRatio
+                    )
+                )
+            image = reader.read()
+            if self.pixelCache is not None and not image.isNull():
+                self.pixelCache.remember(file, image, self.variant)
+            self.thumbnails[file] = QPixmap.fromImage(image)
+        return self.thumbnails[file]
+
+
+class ImageGrid(QListView):
+    def __init__(self, thumbnailSize=160, *args, pixelCache=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.gridModel = ImageGridModel(
+            thumbnailSize, self, pixelCache=pixelCache
+        )
+        self.setModel(self.gridModel)
+        self.setViewMode(QListView.IconMode)
+        self.setResizeMode(QListView.Adjust)
+        self.setMovement(QListView.Static)
+        self.setUniformItemSizes(True)
+        self.setIconSize(QSize(thumbnailSize, thumbnailSize))
+        self.setGridSize(QSize(thumbnailSize + 16, thumbnailSize + 32))
+        self.setSpacing(4)
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(64)
+
+        self.activated.connect(
+            lambda index: self.fileActivated.emit(index.data(Qt.UserRole))
+        )
+
+    fileActivated = pyqtSignal(str)
+
+    def setFiles(self, files, captions=None):
+        self.gridModel.setFiles(files, captions)
+
+    def selectedFiles(self):
+        return [
+            index.data(Qt.UserRole)
+            for index in sorted(
+                self.selectionModel().selectedIndexes(), key=QModelIndex.row
+            )
+        ]
@@ -3,48 +3,213 @@ from PyQt5.QtMultimedia import *
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from PIL import ImageQt
-import torch
-from RealESRGAN import RealESRGAN
+import math
+import os
+import numpy as np
+import qimage2ndarray
+from create_images.Metrics import registry
+from create_images.Profiling import profiled
+from create_images.UpscaleCache import UpscaleCache
+from create_images.UpscaleHost import UpscaleCancelled, UpscaleHost
+
+# tiles are in source pixels, the margin is context the network sees around
+# a tile so that its edges agree with the neighbours
+TILE_SIZE = 128
+TILE_MARGIN = 16
+
+
+def tileRect(tx, ty, width, height):
+    x, y = tx * TILE_SIZE, ty * TILE_SIZE
+    return x, y, min(TILE_SIZE, width - x), min(TILE_SIZE, height - y)
+
+
+def tilesCovering(region: QRect, width, height):
+    region = region.intersected(QRect(0, 0, width, height))
+    if region.isEmpty():
+        return []
+    tiles = [
+        (tx, ty)
+        for ty in range(region.top() // TILE_SIZE, region.bottom() // TILE_SIZE + 1)
+        for tx in range(region.left() // TILE_SIZE, region.right() // TILE_SIZE + 1)
+    ]
+    # the middle of the view first, that is where the eye is
+    center = region.center()
+    return sorted(tiles, key=lambda tile: math.hypot(
+        (tile[0] + 0.5) * TILE_SIZE - center.x(),
+        (tile[1] + 0.5) * TILE_SIZE - center.y()
+    ))
 
 
 class ImageUpscaleWorker(QObject):
     def __init__(
         self,
-        outDir,
+        cache: UpscaleCache,
         scale,
         model,
+        method="esrgan",
+        cacheDir=None,
         *args,
         **kwargs
     ):
         super().__init__(*args, **kwargs)
 
-        self.outDir = outDir
-        self.deviseType = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.cache = cache
+        # bumped from the GUI thread to preempt, jobs carry the value they
+        # were dispatched with and stop at their next check once it moved on
+        self.generation = 0
 
-        logging.info(f"Selected device type: {self.deviseType}")
+        logging.info(f"Selected upscale method: {method}")
 
-        self.model = RealESRGAN(
-            device=torch.device(self.deviseType),
-            scale=scale
-        )
-        self.model.load_weights(
-            model_path=model,
-            download=True
+        # the model runs in a child process so that inference neither
+        # competes with the GUI for the GIL nor takes the app down on a crash
+        self.host = UpscaleHost(
+            method, scale, weights=model, cacheDir=cacheDir
         )
 
-    upscaled = pyqtSignal(object)
+    upscaled = pyqtSignal(str, QImage)
+    regionUpscaled = pyqtSignal(str, QRect, QImage)
+    regionFinished = pyqtSignal(str, bool)
+    cancelled = pyqtSignal(str)
+    failed = pyqtSignal(str, object)
     started = pyqtSignal()
     finished = pyqtSignal()
 
-    @pyqtSlot(QPixmap)
-    def upscaleImage(self, image: QPixmap):
+    @pyqtSlot(str, QPixmap, int)
+    @profiled("upscale")
+    def upscaleImage(self, file, image: QPixmap, generation):
         self.started.emit()
         try:
-            lrImage = ImageQt.fromqpixmap(image).convert("RGB")
-            res = self.model.predict(lrImage)
-            self.upscaled.emit(res)
+            self.checkPreempted(generation)
+            lrImage = image.toImage()
+            pixels = qimage2ndarray.rgb_view(lrImage)
+            digest = self.cache.digest(pixels)
+            self.cache.rememberFile(file, digest)
+
+            labels = {"image": os.path.basename(file)}
+
+            cached = self.cache.get(digest)
+            if cached is not None:
+                registry.inc("upscale_cache", result="hit")
+                with registry.stage("decode", source="upscale-cache", **labels):
+                    res = QImage(cached.as_posix())
+            else:
+                registry.inc("upscale_cache", result="miss")
+                with registry.stage("upscale", **labels):
+                    # tiles inspected before are reused, the rest is done
+                    # tile by tile so that a preempted upscale keeps its work
+                    if self.hasTiles(pixels, digest):
+                        res = qimage2ndarray.array2qimage(
+                            self.upscaleTiled(pixels, digest, generation)
+                        )
+                    else:
+                        self.checkPreempted(generation)
+                        res = qimage2ndarray.array2qimage(
+                            self.host.upscale(pixels)
+                        )
+                with registry.stage("encode", source="upscale-cache", **labels):
+                    self.cache.put(digest, res)
+
+            self.upscaled.emit(file, res)
+        except UpscaleCancelled:
+            registry.inc("upscale_cancelled")
+            self.cancelled.emit(file)
         except Exception as e:
-            raise e
+            registry.inc("errors", stage="upscale")
+            # raising from a slot would abort the whole application
+            logging.exception("Upscaling failed")
+            self.failed.emit(file, e)
         finally:
             self.finished.emit()
+
+    @pyqtSlot(str, QPixmap, QRect, int)
+    def upscaleRegion(self, file, image: QPixmap, region: QRect, generation):
+        cancelled = False
+        try:
+            self.checkPreempted(generation)
+            lrImage = image.toImage()
+            pixels = qimage2ndarray.rgb_view(lrImage)
+            digest = self.cache.fileDigest(file)
+            if digest is None:
+                digest = self.cache.digest(pixels)
+                self.cache.rememberFile(file, digest)
+
+            height, width, _ = pixels.shape
+            with registry.stage("upscale-region", image=os.path.basename(file)):
+                for tx, ty in tilesCovering(region, width, height):
+                    self.checkPreempted(generation)
+                    tile = self.upscaleTile(pixels, digest, tx, ty)
+                    self.regionUpscaled.emit(
+                        file,
+                        QRect(*tileRect(tx, ty, width, height)),
+                        qimage2ndarray.array2qimage(tile)
+                    )
+        except UpscaleCancelled:
+            registry.inc("upscale_cancelled")
+            cancelled = True
+        except Exception:
+            registry.inc("errors", stage="upscale-region")
+            logging.exception("Region upscaling failed")
+        finally:
+            self.regionFinished.emit(file, cancelled)
+
+    def checkPreempted(self, generation):
+        # the host only cancels the job it is running, between tiles and
+        # before the first one this is what stops a preempted job
+        if generation != self.generation:
+            raise UpscaleCancelled("preempted")
+
+    def upscaleTile(self, pixels, digest, tx, ty):
+        height, width, _ = pixels.shape
+        scale = self.host.scale
+        x, y, w, h = tileRect(tx, ty, width, height)
+        key = self.cache.tileDigest(digest, tx, ty)
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            registry.inc("upscale_tile_cache", result="hit")
+            return np.array(qimage2ndarray.rgb_view(QImage(cached.as_posix())))
+        registry.inc("upscale_tile_cache", result="miss")
+
+        left, top = max(0, x - TILE_MARGIN), max(0, y - TILE_MARGIN)
+        right = min(width, x + w + TILE_MARGIN)
+        bottom = min(height, y + h + TILE_MARGIN)
+        result = self.host.upscale(
+            np.ascontiguousarray(pixels[top:bottom, left:right])
+        )
+        tile = np.ascontiguousarray(result[
+            (y - top) * scale:(y - top + h) * scale,
+            (x - left) * scale:(x - left + w) * scale
+        ])
+        self.cache.put(key, qimage2ndarray.array2qimage(tile))
+        return tile
+
+    def hasTiles(self, pixels, digest):
+        height, width, _ = pixels.shape
+        return any(
+            self.cache.contains(self.cache.tileDigest(digest, tx, ty))
+            for tx in range(math.ceil(width / TILE_SIZE))
+            for ty in range(math.ceil(height / TILE_SIZE))
+        )
+
+    def upscaleTiled(self, pixels, digest, generation):
+        height, width, _ = pixels.shape
+        scale = self.host.scale
+        result = np.empty((height * scale, width * scale, 3), dtype=np.uint8)
+        for ty in range(math.ceil(height / TILE_SIZE)):
+            for tx in range(math.ceil(width / TILE_SIZE)):
+                self.checkPreempted(generation)
+                x, y, w, h = tileRect(tx, ty, width, height)
+                result[
+                    y * scale:(y + h) * scale, x * scale:(x + w) * scale
+                ] = self.upscaleTile(pixels, digest, tx, ty)
+        return result
+
+    def preempt(self):
+        # called directly from the GUI thread, this thread is busy upscaling
+        self.generation += 1
+        self.host.cancel()
+
+    def shutdown(self):
+        self.host.stop()
+        self.cache.save()
+        logging.info(f"Upscale cache: {self.cache.summary()}")
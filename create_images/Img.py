@@ -5,6 +5,40 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
 import os
 
+MAX_ZOOM = 8.0
+ZOOM_STEP = 1.25
+# share of the view added on every side when asking for a detail upscale
+REGION_MARGIN = 0.25
+
+
+def blurredSnapshot(pixmap: QPixmap, size: QSize, radius, downscale=4) -> QPixmap:
+    # blurring throws the detail away anyway, so it is done at a fraction
+    # of the size and scaled back up once
+    small = pixmap.scaled(
+        max(1, size.width() // downscale),
+        max(1, size.height() // downscale),
+        Qt.IgnoreAspectRatio,
+        Qt.SmoothTransformation
+    )
+
+    item = QGraphicsPixmapItem(small)
+    blurEffect = QGraphicsBlurEffect()
+    blurEffect.setBlurRadius(radius / downscale)
+    blurEffect.setBlurHints(QGraphicsBlurEffect.QualityHint)
+    item.setGraphicsEffect(blurEffect)
+    scene = QGraphicsScene()
+    scene.addItem(item)
+
+    blurred = QImage(small.size(), QImage.Format_ARGB32_Premultiplied)
+    blurred.fill(Qt.transparent)
+    painter = QPainter(blurred)
+    scene.render(painter, QRectF(blurred.rect()), QRectF(small.rect()))
+    painter.end()
+
+    return QPixmap.fromImage(blurred).scaled(
+        size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation
+    )
+
 
 class DummyStyle(QProxyStyle):
     def __init__(self, *args, **kwargs):
@@ -86,6 +120,20 @@ class Img(QLabel):
         self._index = None
         self.originalImage = None
         self.upscaledImage = None
+        self.disabledSnapshot = None
+        self.previewImage = None
+        self.previewScaled = None
+        # zoom 1 fits the image, the center is relative to the image size
+        self.zoom = 1.0
+        self.zoomCenter = QPointF(0.5, 0.5)
+        self.dragStart = None
+        self.detailTiles = {}
+        self.showingUpscaled = False
+
+        self.regionTimer = QTimer(self)
+        self.regionTimer.setSingleShot(True)
+        self.regionTimer.setInterval(250)
+        self.regionTimer.timeout.connect(self.requestRegion)
 
         saveIcon = QIcon("res/icons/save.svg")
         copyIcon = QIcon("res/icons/copy.svg")
@@ -131,6 +179,9 @@ class Img(QLabel):
         self.backupAction = QAction(backupIcon, self.tr("Backup"), self)
         self.backupAction.triggered.connect(self.backupRequest.emit)
 
+        self.backupAllAction = QAction(backupIcon, self.tr("Backup All"), self)
+        self.backupAllAction.triggered.connect(self.backupAllRequest.emit)
+
         self.copyPromptAction = QAction(copyIcon, self.tr("Copy Prompt"), self)
         self.copyPromptAction.setShortcut("Ctrl+Shift+C")
         copyPromptShortcut = QShortcut("Ctrl+Shift+C", self)
@@ -140,6 +191,36 @@ class Img(QLabel):
         self.editPromptAction = QAction(editIcon, self.tr("Edit Prompt"), self)
         self.editPromptAction.triggered.connect(self.openPromptEditor)
 
+        self.findSimilarAction = QAction(
+            originalIcon, self.tr("Find Similar"), self
+        )
+        self.findSimilarAction.setShortcut("Ctrl+F")
+        findSimilarShortcut = QShortcut("Ctrl+F", self)
+        findSimilarShortcut.activated.connect(self.findSimilarRequest.emit)
+        self.findSimilarAction.triggered.connect(self.findSimilarRequest.emit)
+
+        self.statsAction = QAction(self.tr("Statistics"), self)
+        self.statsAction.setShortcut("Ctrl+I")
+        statsShortcut = QShortcut("Ctrl+I", self)
+        statsShortcut.activated.connect(self.statsRequest.emit)
+        self.statsAction.triggered.connect(self.statsRequest.emit)
+
+        self.detailAction = QAction(upscaleIcon, self.tr("Upscale Details"), self)
+        self.detailAction.setCheckable(True)
+        self.detailAction.setShortcut("D")
+        detailShortcut = QShortcut(QKeySequence(Qt.Key_D), self)
+        detailShortcut.activated.connect(self.detailAction.toggle)
+        self.detailAction.toggled.connect(self.scheduleRegion)
+
+        resetZoomShortcut = QShortcut(QKeySequence(Qt.Key_0), self)
+        resetZoomShortcut.activated.connect(self.resetZoom)
+
+        self.libraryAction = QAction(self.tr("Library"), self)
+        self.libraryAction.setShortcut("Ctrl+L")
+        libraryShortcut = QShortcut("Ctrl+L", self)
+        libraryShortcut.activated.connect(self.libraryRequest.emit)
+        self.libraryAction.triggered.connect(self.libraryRequest.emit)
+
         self.nextPictureAction = QAction(nextIcon, self.tr("Next"), self)
         nextShortcut = QShortcut(QKeySequence(Qt.Key_Right), self)
         nextShortcut.activated.connect(self.nextPicture.emit)
@@ -168,18 +249,29 @@ class Img(QLabel):
         self.menu.addAction(self.upscaleAction)        # 2
         self.menu.addAction(self.deleteAction)         # 3
         self.menu.addAction(self.backupAction)         # 4
+        self.menu.addAction(self.backupAllAction)      # 5
+        self.menu.addSeparator()                       # _
+        self.menu.addAction(self.editPromptAction)     # 6
         self.menu.addSeparator()                       # _
-        self.menu.addAction(self.editPromptAction)     # 5
+        self.menu.addAction(self.findSimilarAction)    # 7
+        self.menu.addAction(self.nextPictureAction)    # 8
+        self.menu.addAction(self.prevPictureAction)    # 9
+        self.menu.addAction(self.setFullScreenAction)  # 10
+        self.menu.addAction(self.detailAction)         # 11
         self.menu.addSeparator()                       # _
-        self.menu.addAction(self.nextPictureAction)    # 6
-        self.menu.addAction(self.prevPictureAction)    # 7
-        self.menu.addAction(self.setFullScreenAction)  # 8
+        self.menu.addAction(self.libraryAction)        # 12
+        self.menu.addAction(self.statsAction)          # 13
 
         self.setStyle(DummyStyle())
 
     promptChangeRequest = pyqtSignal(str)
     upscaleRequest = pyqtSignal()
     backupRequest = pyqtSignal()
+    backupAllRequest = pyqtSignal()
+    findSimilarRequest = pyqtSignal()
+    statsRequest = pyqtSignal()
+    libraryRequest = pyqtSignal()
+    regionUpscaleRequest = pyqtSignal(QRect)
     deleteRequest = pyqtSignal()
     saveRequest = pyqtSignal()
     nextPicture = pyqtSignal()
@@ -222,6 +314,156 @@ class Img(QLabel):
         super().setPixmap(pm)
         self.updateMargins()
         self.originalImage = pm
+        self.disabledSnapshot = None
+        self.detailTiles = {}
+        self.showingUpscaled = False
+        self.resetZoom()
+        self.clearPreview()
+
+    def setPreview(self, image: QImage):
+        self.previewImage = QPixmap.fromImage(image)
+        self.previewScaled = None
+        self.update()
+
+    def clearPreview(self):
+        if self.previewImage is not None:
+            self.previewImage = None
+            self.previewScaled = None
+            self.update()
+
+    def sourceRect(self) -> QRectF:
+        # the part of the pixmap that is on screen
+        pw, ph = self.pixmap().width(), self.pixmap().height()
+        w, h = pw / self.zoom, ph / self.zoom
+        x = min(max(self.zoomCenter.x() * pw - w / 2, 0), pw - w)
+        y = min(max(self.zoomCenter.y() * ph - h / 2, 0), ph - h)
+        return QRectF(x, y, w, h)
+
+    def setZoom(self, zoom, anchor: QPointF = None):
+        if self.pixmap() is None or self.pixmap().isNull():
+            return
+        zoom = min(max(zoom, 1.0), MAX_ZOOM)
+        target = QRectF(self.contentsRect())
+        if anchor is None or target.isEmpty():
+            anchor = target.center()
+
+        # the image point under the anchor stays under it
+        source = self.sourceRect()
+        fx = (anchor.x() - target.x()) / target.width()
+        fy = (anchor.y() - target.y()) / target.height()
+        px = source.x() + fx * source.width()
+        py = source.y() + fy * source.height()
+
+        self.zoom = zoom
+        pw, ph = self.pixmap().width(), self.pixmap().height()
+        w, h = pw / zoom, ph / zoom
+        self.zoomCenter = QPointF(
+            (px - fx * w + w / 2) / pw, (py - fy * h + h / 2) / ph
+        )
+        self.clampCenter()
+        self.update()
+        self.scheduleRegion()
+
+    def clampCenter(self):
+        half = 0.5 / self.zoom
+        self.zoomCenter = QPointF(
+            min(max(self.zoomCenter.x(), half), 1 - half),
+            min(max(self.zoomCenter.y(), half), 1 - half),
+        )
+
+    @pyqtSlot()
+    def resetZoom(self):
+        self.zoom = 1.0
+        self.zoomCenter = QPointF(0.5, 0.5)
+        self.dragStart = None
+        self.regionTimer.stop()
+        self.update()
+
+    def addDetailTile(self, rect: QRect, tile: QPixmap):
+        # a region that is asked for again returns the same tiles
+        self.detailTiles[rect.x(), rect.y()] = (rect, tile)
+        self.update()
+
+    @pyqtSlot()
+    def scheduleRegion(self):
+        if self.detailAction.isChecked() and self.zoom > 1:
+            self.regionTimer.start()
+
+    @pyqtSlot()
+    def requestRegion(self):
+        # only the original has a use for upscaled details
+        if (
+            not self.detailAction.isChecked()
+            or self.zoom <= 1
+            or self.upscaledImage
+            or self.showingUpscaled
+        ):
+            return
+        source = self.sourceRect()
+        margin = REGION_MARGIN * max(source.width(), source.height())
+        region = source.adjusted(-margin, -margin, margin, margin).toAlignedRect()
+        self.regionUpscaleRequest.emit(
+            region.intersected(self.pixmap().rect())
+        )
+
+    def wheelEvent(self, e: QWheelEvent) -> None:
+        steps = e.angleDelta().y() / 120
+        if steps:
+            self.setZoom(self.zoom * ZOOM_STEP ** steps, QPointF(e.pos()))
+
+    def mousePressEvent(self, e: QMouseEvent) -> None:
+        if e.button() == Qt.LeftButton and self.zoom > 1:
+            self.dragStart = (QPointF(e.pos()), self.zoomCenter)
+        super().mousePressEvent(e)
+
+    def mouseMoveEvent(self, e: QMouseEvent) -> None:
+        if self.dragStart is not None:
+            start, center = self.dragStart
+            target = self.contentsRect()
+            delta = QPointF(e.pos()) - start
+            self.zoomCenter = QPointF(
+                center.x() - delta.x() / (target.width() * self.zoom),
+                center.y() - delta.y() / (target.height() * self.zoom),
+            )
+            self.clampCenter()
+            self.update()
+        super().mouseMoveEvent(e)
+
+    def mouseReleaseEvent(self, e: QMouseEvent) -> None:
+        if self.dragStart is not None:
+            self.dragStart = None
+            self.scheduleRegion()
+        super().mouseReleaseEvent(e)
+
+    def mouseDoubleClickEvent(self, e: QMouseEvent) -> None:
+        self.resetZoom()
+        super().mouseDoubleClickEvent(e)
+
+    def paintZoomed(self):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        target = QRectF(self.contentsRect())
+        source = self.sourceRect()
+        painter.drawPixmap(target, self.pixmap(), source)
+
+        if self.showingUpscaled:
+            return
+        sx = target.width() / source.width()
+        sy = target.height() / source.height()
+        for rect, tile in self.detailTiles.values():
+            rect = QRectF(rect)
+            if not rect.intersects(source):
+                continue
+            painter.drawPixmap(
+                QRectF(
+                    target.x() + (rect.x() - source.x()) * sx,
+                    target.y() + (rect.y() - source.y()) * sy,
+                    rect.width() * sx,
+                    rect.height() * sy,
+                ),
+                tile,
+                QRectF(tile.rect())
+            )
 
     def updateMargins(self):
         if self.pixmap() is None:
@@ -242,19 +484,44 @@ class Img(QLabel):
 
     def changeEvent(self, e: QEvent) -> None:
         if e.type() == QEvent.EnabledChange:
-            if not self.isEnabled():
-                blurEffect = QGraphicsBlurEffect(self)
-                blurEffect.setBlurRadius(10)
-                blurEffect.setBlurHints(QGraphicsBlurEffect.QualityHint)
-                self.setGraphicsEffect(blurEffect)
-            else:
-                self.setGraphicsEffect(None)
+            self.disabledSnapshot = None
+            self.update()
         return super().changeEvent(e)
 
     def resizeEvent(self, e: QResizeEvent) -> None:
         self.updateMargins()
+        self.disabledSnapshot = None
+        self.previewScaled = None
         super().resizeEvent(e)
 
+    def paintEvent(self, e: QPaintEvent) -> None:
+        if self.previewImage is not None:
+            # the image being generated is shown sharp even while disabled
+            if self.previewScaled is None:
+                self.previewScaled = self.previewImage.scaled(
+                    self.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation
+                )
+            target = self.previewScaled.rect()
+            target.moveCenter(self.rect().center())
+            QPainter(self).drawPixmap(target.topLeft(), self.previewScaled)
+            return
+
+        if self.pixmap() is None or self.pixmap().isNull():
+            return super().paintEvent(e)
+        if self.isEnabled():
+            if self.zoom > 1:
+                return self.paintZoomed()
+            return super().paintEvent(e)
+
+        # a live blur effect re-blurs the full resolution pixmap on every
+        # spinner tick, the blurred image is computed once instead
+        if self.disabledSnapshot is None:
+            self.disabledSnapshot = blurredSnapshot(
+                self.pixmap(), self.contentsRect().size(), 10
+            )
+        painter = QPainter(self)
+        painter.drawPixmap(self.contentsRect().topLeft(), self.disabledSnapshot)
+
     def contextMenuEvent(self, event):
         self.menu.exec_(self.mapToGlobal(event.pos()))
 
@@ -278,6 +545,8 @@ class Img(QLabel):
     def swapToUpscaled(self):
         super().setPixmap(self.upscaledImage)
         self.updateMargins()
+        self.disabledSnapshot = None
+        self.showingUpscaled = True
 
         self.menu.removeAction(self.showUpscaledAction)
         self.menu.insertAction(self.deleteAction, self.showOriginalAction)
@@ -285,6 +554,8 @@ class Img(QLabel):
     def swapToOriginal(self):
         super().setPixmap(self.originalImage)
         self.updateMargins()
+        self.disabledSnapshot = None
+        self.showingUpscaled = False
 
         self.menu.removeAction(self.showOriginalAction)
         self.menu.insertAction(self.deleteAction, self.showUpscaledAction)
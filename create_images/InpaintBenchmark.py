@@ -0,0 +1,170 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import time
+import cv2
+import numpy as np
+from create_images.BenchmarkSuite import IMAGE_SIZE, MASK_FILE, watermarked
+from create_images.Inpaint import INPAINTERS, makeInpainter
+from create_images.UpscalerBenchmark import machineFingerprint, syntheticImage
+from create_images.Utils import psnr
+
+REPORT_FILE = "inpaint-benchmark.json"
+PSNR_CAP = 100.0
+
+
+def corpus(mask, count, seed=0):
+    # watermarked synthetic images with their clean originals
+    from PIL import Image
+
+    maskImage = Image.fromarray(mask)
+    images = []
+    for i in range(count):
+        clean = syntheticImage(IMAGE_SIZE, seed + i)
+        images.append((
+            np.asarray(clean),
+            np.asarray(watermarked(clean, maskImage)),
+        ))
+    return images
+
+
+def maskedPsnr(reference, image, mask):
+    # everything outside the mask is untouched, only the fill is compared
+    inside = mask > 0
+    return min(psnr(reference[inside], image[inside]), PSNR_CAP)
+
+
+def runMethod(method, mask, images, references, runs, batchSize):
+    inpainter = makeInpainter(method, mask)
+    dirty = [image for _, image in images]
+    inpainter(dirty[0])  # warm up
+
+    timings = []
+    outputs = []
+    for _ in range(runs):
+        outputs = []
+        for image in dirty:
+            startTime = time.perf_counter()
+            outputs.append(inpainter(image))
+            timings.append(time.perf_counter() - startTime)
+
+    batchTimings = []
+    for _ in range(runs):
+        for start in range(0, len(dirty), batchSize):
+            chunk = dirty[start:start + batchSize]
+            startTime = time.perf_counter()
+            inpainter.batch(chunk)
+            batchTimings.append((time.perf_counter() - startTime) / len(chunk))
+
+    return {
+        "method": method,
+        "seconds": float(np.median(timings)),
+        "batchSeconds": float(np.median(batchTimings)),
+        "psnrTelea": float(np.mean([
+            maskedPsnr(reference, output, mask)
+            for reference, output in zip(references, outputs)
+        ])),
+        "psnrClean": float(np.mean([
+            maskedPsnr(clean, output, mask)
+            for (clean, _), output in zip(images, outputs)
+        ])),
+    }
+
+
+def run(methods, count=8, runs=3, batchSize=8, seed=0, maskFile=MASK_FILE):
+    mask = cv2.imread(maskFile, cv2.IMREAD_GRAYSCALE)
+    if mask.shape != (IMAGE_SIZE, IMAGE_SIZE):
+        mask = cv2.resize(mask, (IMAGE_SIZE, IMAGE_SIZE))
+
+    images = corpus(mask, count, seed)
+    # error is measured against the fill used so far
+    telea = makeInpainter("telea", mask)
+    references = [telea(image) for _, image in images]
+
+    rows = []
+    for method in methods:
+        print(f"Benchmarking {method}")
+        try:
+            rows.append(runMethod(method, mask, images, references, runs, batchSize))
+        except Exception as e:
+            rows.append({"method": method, "error": str(e)})
+
+    return {
+        "machine": machineFingerprint(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {"count": count, "runs": runs, "batchSize": batchSize},
+        "results": rows,
+    }
+
+
+def writeReport(report, path=REPORT_FILE):
+    tmpPath = f"{path}.tmp"
+    with open(tmpPath, "w") as file:
+        json.dump(report, file, indent=2)
+    os.replace(tmpPath, path)
+
+
+def loadReport(path=REPORT_FILE):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        logging.info(f"Inpaint benchmark report \"{path}\" unavailable: {e}")
+        return None
+
+
+def selectInpainter(reportPath, qualityFloor, batched=False):
+    report = loadReport(reportPath)
+    if report is None:
+        return None
+
+    if report.get("machine") != machineFingerprint():
+        logging.info("Inpaint benchmark report was made on another machine")
+        return None
+
+    key = "batchSeconds" if batched else "seconds"
+    candidates = [
+        (row[key], row["method"])
+        for row in report["results"]
+        if "error" not in row and row["psnrTelea"] >= qualityFloor
+    ]
+    if not candidates:
+        logging.info(f"No inpainter meets quality floor of {qualityFloor} dB")
+        return None
+
+    return min(candidates)[1]
+
+
+def printReport(report):
+    print(
+        f"{'method':<12}{'ms/image':>10}{'batched':>10}"
+        f"{'vs telea':>10}{'vs clean':>10}"
+    )
+    for row in report["results"]:
+        if "error" in row:
+            print(f"{row['method']:<12}  failed: {row['error']}")
+            continue
+        print(
+            f"{row['method']:<12}{row['seconds'] * 1000:>10.2f}"
+            f"{row['batchSeconds'] * 1000:>10.2f}"
+            f"{row['psnrTelea']:>8.2f}dB{row['psnrClean']:>8.2f}dB"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--report", default=REPORT_FILE)
+    parser.add_argument("--methods", nargs="+", default=list(INPAINTERS))
+    parser.add_argument("--count", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--mask", default=MASK_FILE)
+    args = parser.parse_args()
+
+    report = run(
+        args.methods, args.count, args.runs, args.batch_size, maskFile=args.mask
+    )
+    writeReport(report, args.report)
+    printReport(report)
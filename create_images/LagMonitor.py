@@ -0,0 +1,118 @@
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from PyQt5.QtCore import *
+from create_images.Metrics import registry
+
+STALL_BUCKETS = (0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+
+
+def stallSite(frame):
+    # the innermost frame of our own code is what needs fixing, qt and
+    # library frames below it only tell how it got slow
+    fallback = None
+    while frame is not None:
+        location = (
+            f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+        )
+        if fallback is None:
+            fallback = location
+        if "create_images" in frame.f_code.co_filename:
+            return location
+        frame = frame.f_back
+    return fallback or "?"
+
+
+class LagMonitor(QObject):
+    def __init__(self, threshold=0.2, interval=0.05, maxSamples=5, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.threshold = threshold
+        self.interval = interval
+        self.maxSamples = maxSamples
+        self.mainThreadId = threading.get_ident()
+
+        self.lock = threading.Lock()
+        self.lastBeat = time.monotonic()
+        self.samples = []
+        self.stalls = [0] * (len(STALL_BUCKETS) + 1)
+
+        self.stopped = threading.Event()
+        self.watchdog = threading.Thread(
+            target=self.watch, name="lagMonitor", daemon=True
+        )
+
+        self.heartbeat = QTimer(self)
+        self.heartbeat.setTimerType(Qt.PreciseTimer)
+        self.heartbeat.setInterval(round(interval * 1000))
+        self.heartbeat.timeout.connect(self.beat)
+
+    def start(self):
+        self.lastBeat = time.monotonic()
+        self.heartbeat.start()
+        self.watchdog.start()
+
+    def stop(self):
+        self.heartbeat.stop()
+        self.stopped.set()
+
+    @pyqtSlot()
+    def beat(self):
+        now = time.monotonic()
+        with self.lock:
+            lag = max(0.0, now - self.lastBeat - self.interval)
+            self.lastBeat = now
+            samples, self.samples = self.samples, []
+
+        registry.observe("event_loop_lag_seconds", lag, events=False)
+        if lag < self.threshold:
+            return
+
+        for i, bound in enumerate(STALL_BUCKETS):
+            if lag <= bound:
+                self.stalls[i] += 1
+                break
+        else:
+            self.stalls[-1] += 1
+
+        site = samples[0][1] if samples else "?"
+        registry.observe("gui_stall_seconds", lag, site=site)
+
+        stacks = "\n".join(
+            f"after {offset * 1000:.0f} ms:\n{''.join(traceback.format_list(stack))}"
+            for offset, _, stack in samples
+        )
+        logging.warning(
+            f"GUI thread stalled for {lag * 1000:.0f} ms in {site}\n{stacks}"
+        )
+
+    def watch(self):
+        # samples the main thread stack from outside while it is blocked,
+        # it cannot report on itself until the stall is over
+        while not self.stopped.wait(self.threshold / 2):
+            with self.lock:
+                stalled = time.monotonic() - self.lastBeat - self.interval
+                due = (len(self.samples) + 1) * self.threshold
+                if stalled < due or len(self.samples) >= self.maxSamples:
+                    continue
+
+                frame = sys._current_frames().get(self.mainThreadId)
+                if frame is None:
+                    continue
+                self.samples.append(
+                    (stalled, stallSite(frame), traceback.extract_stack(frame))
+                )
+
+    def summary(self):
+        labels = [f"<={bound * 1000:.0f} ms" for bound in STALL_BUCKETS]
+        labels.append(f">{STALL_BUCKETS[-1] * 1000:.0f} ms")
+        bounds = STALL_BUCKETS + (float("inf"),)
+        width = max(self.stalls) or 1
+        lines = [f"{sum(self.stalls)} GUI stalls over {self.threshold * 1000:.0f} ms"]
+        for label, bound, count in zip(labels, bounds, self.stalls):
+            if bound >= self.threshold:
+                lines.append(f"{label:>10} {count:>6} {'#' * round(40 * count / width)}")
+        return "\n".join(lines)
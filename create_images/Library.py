@@ -0,0 +1,144 @@
+import logging
+import os
+from PyQt5.QtGui import QImage, QPixmap
+from PIL import Image
+import PIL.ExifTags
+from create_images.ImageData import ImageData
+from create_images.Compaction import COMPACT_EXTENSIONS
+from create_images.Metrics import registry
+from create_images.PixelCache import PixelCache
+from create_images.UpscaleCache import UpscaleCache
+from create_images.Utils import IMAGE_EXTENSIONS, map_files, scan_files
+
+
+def findUpscaled(upscaledDir, filepath):
+    # the twin keeps the original name unless compaction changed its format
+    name = os.path.basename(filepath)
+    stem = os.path.splitext(name)[0]
+    for candidate in (name, *(stem + extension for extension in COMPACT_EXTENSIONS)):
+        path = os.path.join(upscaledDir, candidate)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def decodeImage(path, pixelCache: PixelCache = None):
+    image = None if pixelCache is None else pixelCache.get(path)
+    if image is None:
+        image = QImage(str(path))
+    return image
+
+
+def readImageData(
+    filepath,
+    upscaledDir,
+    upscaleCache: UpscaleCache = None,
+    pixelCache: PixelCache = None
+):
+    # only QImage and pillow are touched, so this is safe to run off the
+    # gui thread; the images are turned into pixmaps by `toPixmaps`
+    upscaledPath = findUpscaled(upscaledDir, filepath)
+    if upscaledPath is None:
+        upscaledPath = (
+            None if upscaleCache is None
+            else upscaleCache.lookupFile(filepath)
+        )
+
+    labels = {"image": os.path.basename(filepath)}
+
+    with registry.stage("decode", source="library", **labels):
+        image = decodeImage(filepath, pixelCache)
+        if image.isNull():
+            raise OSError(f"could not decode \"{filepath}\"")
+        upscaledImage = (
+            None if upscaledPath is None
+            else decodeImage(upscaledPath, pixelCache)
+        )
+
+    with registry.stage("exif", source="library", **labels):
+        with Image.open(filepath) as file:
+            prompt = file.getexif().get(PIL.ExifTags.Base.XPComment)
+
+    return ImageData(image, prompt, filepath, upscaledImage)
+
+
+def toPixmaps(data: ImageData):
+    return ImageData(
+        QPixmap.fromImage(data.image),
+        data.prompt,
+        data.file,
+        None if data.upscaled is None else QPixmap.fromImage(data.upscaled)
+    )
+
+
+def loadImageData(
+    filepath,
+    upscaledDir,
+    upscaleCache: UpscaleCache = None,
+    pixelCache: PixelCache = None
+):
+    return toPixmaps(
+        readImageData(filepath, upscaledDir, upscaleCache, pixelCache)
+    )
+
+
+def loadLibrary(
+    directory,
+    upscaledDir,
+    upscaleCache: UpscaleCache = None,
+    workers=4,
+    pixelCache: PixelCache = None
+):
+    def read(entry):
+        # the stat comes with the directory listing on windows
+        ctime = entry.stat().st_ctime
+        return ctime, readImageData(
+            entry.path, upscaledDir, upscaleCache, pixelCache
+        )
+
+    loaded = []
+    errors = []
+
+    with registry.stage("library-load"):
+        for _, (ctime, data) in map_files(
+            read,
+            scan_files(directory, IMAGE_EXTENSIONS),
+            workers=workers,
+            ordered=False,
+            errors=errors,
+            keep_entries=True
+        ):
+            loaded.append((ctime, toPixmaps(data)))
+        loaded.sort(key=lambda item: -item[0])
+
+    for filepath, e in errors:
+        logging.debug(f"Error while loading file \"{filepath}\":\n {e}")
+
+    registry.inc("library_images", len(loaded))
+    return [data for _, data in loaded]
+
+
+def listLibrary(directory):
+    # newest first, the order loadLibrary produces, without decoding
+    files = []
+    for entry in scan_files(directory, IMAGE_EXTENSIONS):
+        try:
+            files.append((entry.stat().st_ctime, entry.path))
+        except OSError:
+            continue
+    files.sort(key=lambda item: -item[0])
+    return [file for _, file in files]
+
+
+def nearestFirst(files, currentFile):
+    # the current image, then its neighbours alternating outwards
+    try:
+        current = files.index(currentFile)
+    except ValueError:
+        return list(files)
+    order = [files[current]]
+    for distance in range(1, len(files)):
+        for index in (current + distance, current - distance):
+            if 0 <= index < len(files):
+                order.append(files[index])
+    return order
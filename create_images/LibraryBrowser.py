@@ -0,0 +1,318 @@
+import os
+from PyQt5.QtMultimedia import *
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import *
+from create_images.BulkWorker import BulkWorker
+from create_images.ExportDialog import ExportDialog
+from create_images.ImageBackupWorker import ImageBackupWorker
+from create_images.ImageGrid import ImageGrid
+from create_images.UpscaleScheduler import UpscaleScheduler
+
+
+class LibraryBrowser(QDialog):
+    def __init__(
+        self,
+        bulkWorker: BulkWorker,
+        backupWorker: ImageBackupWorker,
+        upscaleScheduler: UpscaleScheduler,
+        *args,
+        pixelCache=None,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+
+        self.bulkWorker = bulkWorker
+        self.backupWorker = backupWorker
+        self.upscaleScheduler = upscaleScheduler
+        self.images = {}
+        self.job = None
+        self.upscalePending = set()
+        self.upscaleSummary = None
+        self.retagPrompt = None
+
+        self.setWindowTitle(self.tr("Library"))
+        self.resize(1000, 700)
+
+        layout = QVBoxLayout()
+
+        self.filter = QLineEdit(self)
+        self.filter.setPlaceholderText(self.tr("Filter by prompt"))
+        self.filter.textChanged.connect(self.applyFilter)
+
+        self.grid = ImageGrid(parent=self, pixelCache=pixelCache)
+        self.grid.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.grid.fileActivated.connect(self.openRequest)
+
+        self.countLabel = QLabel(self)
+        self.grid.selectionModel().selectionChanged.connect(self.updateCount)
+        self.grid.gridModel.modelReset.connect(self.updateCount)
+
+        actions = QHBoxLayout()
+        self.buttons = []
+        for text, slot in (
+            (self.tr("Select All"), self.grid.selectAll),
+            (self.tr("Upscale"), self.upscaleSelected),
+            (self.tr("Backup"), self.backupSelected),
+            (self.tr("Export"), self.exportSelected),
+            (self.tr("Re-tag"), self.retagSelected),
+            (self.tr("Delete"), self.deleteSelected),
+        ):
+            button = QPushButton(text, self)
+            button.clicked.connect(slot)
+            actions.addWidget(button)
+            self.buttons.append(button)
+
+        progress = QHBoxLayout()
+        self.progressBar = QProgressBar(self)
+        self.cancelButton = QPushButton(self.tr("Cancel"), self)
+        self.cancelButton.clicked.connect(self.cancel)
+        progress.addWidget(self.progressBar)
+        progress.addWidget(self.cancelButton)
+
+        layout.addWidget(self.filter)
+        layout.addWidget(self.grid)
+        layout.addWidget(self.countLabel)
+        layout.addLayout(actions)
+        layout.addLayout(progress)
+        self.setLayout(layout)
+
+        self.deleteRequest.connect(self.bulkWorker.deleteFiles)
+        self.retagRequest.connect(self.bulkWorker.retagFiles)
+        self.exportRequest.connect(self.bulkWorker.exportFiles)
+        self.backupRequest.connect(self.backupWorker.backupFiles)
+
+        self.bulkWorker.progress.connect(self.onProgress)
+        self.bulkWorker.completed.connect(self.onCompleted)
+        self.backupWorker.progress.connect(self.onProgress)
+        self.backupWorker.backupSaved.connect(self.onBackupSaved)
+        self.backupWorker.failed.connect(self.onBackupFailed)
+        self.upscaleScheduler.completed.connect(self.onUpscaleCompleted)
+
+        self.setBusy(None)
+
+    openRequest = pyqtSignal(str)
+    filesDeleted = pyqtSignal(object)
+    filesRetagged = pyqtSignal(object, str)
+
+    deleteRequest = pyqtSignal(object)
+    retagRequest = pyqtSignal(object, str)
+    exportRequest = pyqtSignal(object, str, str, int)
+    backupRequest = pyqtSignal(object)
+
+    def setImages(self, images):
+        self.images = {image.file: image for image in images}
+        self.applyFilter()
+
+    @pyqtSlot()
+    def applyFilter(self):
+        needle = self.filter.text().strip().lower()
+        files = [
+            file for file, image in self.images.items()
+            if not needle or needle in (image.prompt or "").lower()
+        ]
+        self.grid.setFiles(files, {
+            file: (self.images[file].prompt or "")[:24] for file in files
+        })
+
+    @pyqtSlot()
+    def updateCount(self):
+        self.countLabel.setText(
+            self.tr("{selected} of {shown} images selected").format(
+                selected=len(self.grid.selectedFiles()),
+                shown=self.grid.gridModel.rowCount(),
+            )
+        )
+
+    def setBusy(self, job):
+        self.job = job
+        for button in self.buttons:
+            button.setEnabled(job is None)
+        self.filter.setEnabled(job is None)
+        self.progressBar.setVisible(job is not None)
+        self.cancelButton.setVisible(job is not None)
+        if job is not None:
+            self.progressBar.setRange(0, 0)
+
+    def selection(self):
+        files = self.grid.selectedFiles()
+        if not files:
+            QMessageBox.information(
+                self, self.tr("Library"), self.tr("Select some images first")
+            )
+        return files
+
+    @pyqtSlot()
+    def deleteSelected(self):
+        files = self.selection()
+        if not files:
+            return
+        answer = QMessageBox.question(
+            self,
+            self.tr("Delete"),
+            self.tr("Delete {count} images?").format(count=len(files))
+        )
+        if answer == QMessageBox.Yes:
+            self.setBusy("delete")
+            self.deleteRequest.emit(files)
+
+    @pyqtSlot()
+    def retagSelected(self):
+        files = self.selection()
+        if not files:
+            return
+        prompt, accepted = QInputDialog.getText(
+            self,
+            self.tr("Re-tag"),
+            self.tr("New prompt for {count} images:").format(count=len(files)),
+            text=self.images[files[0]].prompt or ""
+        )
+        if accepted and prompt:
+            self.setBusy("retag")
+            self.retagPrompt = prompt
+            self.retagRequest.emit(files, prompt)
+
+    @pyqtSlot()
+    def exportSelected(self):
+        files = self.selection()
+        if not files:
+            return
+        dialog = ExportDialog(self)
+        if dialog.exec_() != QDialog.Accepted or not dialog.target.text():
+            return
+        format, maxSize = dialog.options()
+        self.setBusy("export")
+        self.exportRequest.emit(files, dialog.target.text(), format, maxSize)
+
+    @pyqtSlot()
+    def backupSelected(self):
+        files = self.selection()
+        if files:
+            self.setBusy("backup")
+            self.backupRequest.emit(files)
+
+    @pyqtSlot()
+    def upscaleSelected(self):
+        files = [
+            file for file in self.selection()
+            if self.images[file].upscaled is None
+            and not self.images[file].placeholder
+        ]
+        if not files:
+            return
+
+        self.setBusy("upscale")
+        self.upscalePending = set(files)
+        self.upscaleSummary = {
+            "operation": "upscale",
+            "files": len(files),
+            "done": [],
+            "errors": [],
+            "cancelled": False,
+        }
+        self.onProgress(0, len(files))
+        for file in files:
+            self.upscaleScheduler.speculate(
+                UpscaleScheduler.BULK, file, self.images[file].image
+            )
+
+    @pyqtSlot()
+    def cancel(self):
+        if self.job == "upscale":
+            self.upscaleScheduler.cancel(UpscaleScheduler.BULK)
+            self.upscaleSummary["cancelled"] = True
+            self.onCompleted(self.upscaleSummary)
+        elif self.job == "backup":
+            self.backupWorker.cancel()
+        elif self.job is not None:
+            self.bulkWorker.cancel()
+
+    @pyqtSlot(int, int)
+    def onProgress(self, done, total):
+        self.progressBar.setRange(0, max(total, 1))
+        self.progressBar.setValue(done)
+
+    @pyqtSlot(str, int, bool)
+    def onUpscaleCompleted(self, file, priority, ok):
+        if self.job != "upscale" or file not in self.upscalePending:
+            return
+        self.upscalePending.discard(file)
+        if ok:
+            self.upscaleSummary["done"].append(file)
+        else:
+            self.upscaleSummary["errors"].append((file, None))
+
+        done = self.upscaleSummary["files"] - len(self.upscalePending)
+        self.onProgress(done, self.upscaleSummary["files"])
+        if not self.upscalePending:
+            self.onCompleted(self.upscaleSummary)
+
+    @pyqtSlot(object)
+    def onBackupSaved(self, summary):
+        if self.job != "backup":
+            return
+        self.onCompleted({
+            "operation": "backup",
+            "files": summary["files"],
+            "done": [None] * (summary["files"] - len(summary["errors"])),
+            "errors": [(error, None) for error in summary["errors"]],
+            "cancelled": summary["cancelled"],
+        })
+
+    @pyqtSlot(object)
+    def onBackupFailed(self, e):
+        if self.job == "backup":
+            self.onCompleted({
+                "operation": "backup",
+                "files": 0,
+                "done": [],
+                "errors": [(str(e), e)],
+                "cancelled": False,
+            })
+
+    @pyqtSlot(object)
+    def onCompleted(self, summary):
+        if self.job is None:
+            return
+        self.setBusy(None)
+        self.upscalePending = set()
+
+        if summary["operation"] == "delete":
+            for file in summary["done"]:
+                self.images.pop(file, None)
+            self.grid.gridModel.removeFiles(summary["done"])
+            self.filesDeleted.emit(summary["done"])
+        elif summary["operation"] == "retag":
+            for file in summary["done"]:
+                if file in self.images:
+                    self.images[file].prompt = self.retagPrompt
+            self.applyFilter()
+            self.filesRetagged.emit(summary["done"], self.retagPrompt)
+
+        self.showSummary(summary)
+
+    def showSummary(self, summary):
+        lines = [
+            self.tr("{operation}: {done} of {files} images").format(
+                operation=summary["operation"].capitalize(),
+                done=len(summary["done"]),
+                files=summary["files"],
+            )
+        ]
+        if summary.get("imagesPerSecond"):
+            lines.append(
+                self.tr("{rate:.1f} images/s, {size:.1f} MiB").format(
+                    rate=summary["imagesPerSecond"],
+                    size=summary["bytes"] / 2 ** 20,
+                )
+            )
+        if summary["cancelled"]:
+            lines.append(self.tr("Cancelled before finishing"))
+        if summary["errors"]:
+            lines.append(self.tr("{count} failed:").format(count=len(summary["errors"])))
+            lines.extend(
+                f"{os.path.basename(str(file))}: {error}" if error is not None
+                else os.path.basename(str(file))
+                for file, error in summary["errors"][:10]
+            )
+        QMessageBox.information(self, self.tr("Library"), "\n".join(lines))
@@ -0,0 +1,65 @@
+import logging
+from PyQt5.QtMultimedia import *
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import *
+from create_images.Library import listLibrary, nearestFirst, readImageData
+from create_images.Metrics import registry
+from create_images.PixelCache import PixelCache
+from create_images.UpscaleCache import UpscaleCache
+from create_images.Utils import map_files
+
+
+class LibraryLoadWorker(QObject):
+    def __init__(
+        self,
+        directory,
+        upscaledDir,
+        upscaleCache: UpscaleCache = None,
+        pixelCache: PixelCache = None,
+        workers=4,
+        *args,
+        **kwargs
+    ):
+        super().__init__(*args, **kwargs)
+
+        self.directory = directory
+        self.upscaledDir = upscaledDir
+        self.upscaleCache = upscaleCache
+        self.pixelCache = pixelCache
+        self.workers = workers
+
+    listed = pyqtSignal(object)
+    decoded = pyqtSignal(object)
+    failed = pyqtSignal(object)
+    started = pyqtSignal()
+    finished = pyqtSignal()
+
+    @pyqtSlot(str)
+    def load(self, currentFile):
+        # the listing comes first so the order is right at once, then the
+        # images are decoded around the one on screen; pixmaps are made
+        # from the decoded QImages on the gui thread
+        self.started.emit()
+        errors = []
+        try:
+            with registry.stage("library-load", source="snapshot"):
+                files = listLibrary(self.directory)
+                self.listed.emit(files)
+
+                for _, data in map_files(
+                    lambda file: readImageData(
+                        file, self.upscaledDir, self.upscaleCache, self.pixelCache
+                    ),
+                    nearestFirst(files, currentFile),
+                    workers=self.workers,
+                    ordered=False,
+                    errors=errors
+                ):
+                    self.decoded.emit(data)
+        finally:
+            for filepath, e in errors:
+                logging.debug(f"Error while loading file \"{filepath}\":\n {e}")
+            if errors:
+                self.failed.emit([filepath for filepath, _ in errors])
+            self.finished.emit()
@@ -0,0 +1,180 @@
+import argparse
+import collections
+import json
+import logging
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from create_images.BingStub import BingStub, pointGeneratorAt
+from create_images.Metrics import quantile, registry
+
+
+class LoadTest:
+    def __init__(self, url, concurrency, outDir, maskFile="res/bing-mask.png"):
+        import BingImageCreator
+        import cv2
+        from PyQt5.QtCore import Qt
+        from create_images.ImageGenerationWorker import ImageGenerationWorker
+
+        pointGeneratorAt(url)
+
+        mask = cv2.imread(maskFile, cv2.IMREAD_GRAYSCALE)
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.images = 0
+        self.errors = collections.Counter()
+
+        # one worker per concurrent slot, the same way the application
+        # owns one worker and one generator session per thread
+        self.workers = []
+        for i in range(concurrency):
+            worker = ImageGenerationWorker(
+                outDir=pathlib.Path(outDir),
+                historyFile=os.path.join(outDir, f"history-{i}.txt"),
+                generator=BingImageCreator.ImageGen(
+                    auth_cookie="load-test", quiet=True
+                ),
+                watermarkMask=mask,
+            )
+            worker.generated.connect(self.onGenerated, Qt.DirectConnection)
+            self.workers.append(worker)
+        self.idle = list(self.workers)
+
+    def onGenerated(self, images):
+        with self.lock:
+            self.images += len(images)
+
+    def generate(self, prompt):
+        with self.lock:
+            worker = self.idle.pop()
+        startTime = time.perf_counter()
+        try:
+            worker.generateImages(prompt)
+            with self.lock:
+                self.latencies.append(time.perf_counter() - startTime)
+        except Exception as e:
+            with self.lock:
+                self.errors[f"{type(e).__name__}: {str(e)[:80]}"] += 1
+        finally:
+            with self.lock:
+                self.idle.append(worker)
+
+    def run(self, prompts):
+        startTime = time.perf_counter()
+        with ThreadPoolExecutor(len(self.workers)) as executor:
+            list(executor.map(self.generate, prompts))
+        return time.perf_counter() - startTime
+
+    def report(self, prompts, elapsed):
+        stages = {
+            dict(h["labels"]).get("stage"): h
+            for h in registry.snapshot()["histograms"]
+            if h["name"] == "stage_seconds"
+        }
+        failed = sum(self.errors.values())
+        return {
+            "prompts": len(prompts),
+            "concurrency": len(self.workers),
+            "elapsed": elapsed,
+            "images": self.images,
+            "imagesPerMinute": self.images / elapsed * 60 if elapsed else 0,
+            "p50": quantile(self.latencies, 0.50),
+            "p90": quantile(self.latencies, 0.90),
+            "p99": quantile(self.latencies, 0.99),
+            "errorRate": failed / len(prompts) if prompts else 0,
+            "errors": dict(self.errors),
+            "stages": {
+                stage: {"median": h["p50"], "p99": h["p99"], "total": h["sum"]}
+                for stage, h in stages.items()
+            },
+        }
+
+
+def printReport(report, stubStats=None):
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f} s"
+
+    print(
+        f"{report['prompts']} prompts with concurrency {report['concurrency']} "
+        f"in {report['elapsed']:.1f} s"
+    )
+    print(
+        f"{report['images']} images, "
+        f"{report['imagesPerMinute']:.1f} images/min"
+    )
+    print(
+        f"latency p50 {seconds(report['p50'])}, p90 {seconds(report['p90'])}, "
+        f"p99 {seconds(report['p99'])}"
+    )
+    print(f"error rate {report['errorRate'] * 100:.1f}%")
+    for error, count in sorted(report["errors"].items(), key=lambda e: -e[1]):
+        print(f"  {count:>5} {error}")
+    for stage, times in sorted(
+        report["stages"].items(), key=lambda s: -s[1]["total"]
+    ):
+        print(
+            f"  {stage:<14} median {seconds(times['median'])}, "
+            f"p99 {seconds(times['p99'])}, total {seconds(times['total'])}"
+        )
+    if stubStats:
+        print(f"stub: {stubStats}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--url", default=None,
+        help="an already running stub, one is started in process otherwise"
+    )
+    parser.add_argument("--latency", type=float, default=3.0)
+    parser.add_argument("--jitter", type=float, default=1.0)
+    parser.add_argument("--download-latency", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--block-rate", type=float, default=0.0)
+    parser.add_argument("--download-error-rate", type=float, default=0.0)
+    parser.add_argument("--rate", type=float, default=0.0)
+    parser.add_argument("--burst", type=int, default=10)
+    parser.add_argument("--report", default=None)
+    args = parser.parse_args()
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication(sys.argv)
+
+    stub = None
+    if args.url is None:
+        stub = BingStub(
+            latency=args.latency,
+            jitter=args.jitter,
+            downloadLatency=args.download_latency,
+            errorRate=args.error_rate,
+            blockRate=args.block_rate,
+            downloadErrorRate=args.download_error_rate,
+            rate=args.rate,
+            burst=args.burst,
+        ).start()
+
+    outDir = tempfile.mkdtemp(prefix="bic-load-")
+    try:
+        test = LoadTest(stub.url if stub else args.url, args.concurrency, outDir)
+        prompts = [f"load test prompt {i}" for i in range(args.prompts)]
+        elapsed = test.run(prompts)
+        report = test.report(prompts, elapsed)
+    finally:
+        shutil.rmtree(outDir, ignore_errors=True)
+        if stub:
+            stub.stop()
+
+    printReport(report, stub.stats if stub else None)
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(report, file, indent=1)
@@ -1,9 +1,11 @@
 import math
+import time
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtMultimedia import *
 import numpy as np
+from create_images.Metrics import registry
 
 
 class LoadingSpinnerWidget(QWidget):
@@ -22,22 +24,51 @@ class LoadingSpinnerWidget(QWidget):
         self._innerRadius = 10
         self._currentCounter = 0
         self._isSpinning = False
+        self._frames = None
 
         self._timer = QTimer(self)
         self._timer.timeout.connect(self.rotate)
 
+        # cpu the gui thread burns per second of wall time while spinning
+        self._cpuUsage = 0.0
+        self._cpuSample = (0.0, 0.0)
+        self._cpuTimer = QTimer(self)
+        self._cpuTimer.setInterval(1000)
+        self._cpuTimer.timeout.connect(self.sampleCpu)
+
         self.updateSize()
         self.updateTimer()
         self.hide()
 
     def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.fillRect(self.rect(), Qt.transparent)
-        painter.setRenderHint(QPainter.Antialiasing, True)
-
         if self._currentCounter >= self._numberOfLines:
             self._currentCounter = 0
 
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.frames()[self._currentCounter])
+
+    def frames(self):
+        # every tick only advances the highlighted line, so all the frames
+        # are drawn once and then blitted
+        if self._frames is None:
+            self._frames = [
+                self.renderFrame(counter)
+                for counter in range(self._numberOfLines)
+            ]
+        return self._frames
+
+    def invalidateFrames(self):
+        self._frames = None
+        self.update()
+
+    def renderFrame(self, counter):
+        ratio = self.devicePixelRatioF()
+        frame = QPixmap(self.size() * ratio)
+        frame.setDevicePixelRatio(ratio)
+        frame.fill(Qt.transparent)
+
+        painter = QPainter(frame)
+        painter.setRenderHint(QPainter.Antialiasing, True)
         painter.setPen(Qt.NoPen)
 
         for i in range(self._numberOfLines):
@@ -52,7 +83,7 @@ class LoadingSpinnerWidget(QWidget):
 
             painter.setBrush(
                 self.currentLineColor(
-                    self.lineCountDistanceFromPrimary(i)
+                    self.lineCountDistanceFromPrimary(i, counter)
                 )
             )
 
@@ -65,6 +96,9 @@ class LoadingSpinnerWidget(QWidget):
             )
             painter.restore()
 
+        painter.end()
+        return frame
+
     stopped = pyqtSignal()
     started = pyqtSignal()
 
@@ -80,6 +114,10 @@ class LoadingSpinnerWidget(QWidget):
             self._timer.start()
             self._currentCounter = 0
 
+        if not self._cpuTimer.isActive():
+            self._cpuSample = (time.perf_counter(), time.thread_time())
+            self._cpuTimer.start()
+
         self.started.emit()
 
     def stop(self):
@@ -93,6 +131,8 @@ class LoadingSpinnerWidget(QWidget):
             self._timer.stop()
             self._currentCounter = 0
 
+        self._cpuTimer.stop()
+
         self.stopped.emit()
 
     def rotate(self):
@@ -101,9 +141,22 @@ class LoadingSpinnerWidget(QWidget):
             self._currentCounter = 0
         self.update()
 
+    def sampleCpu(self):
+        # thread_time only counts the calling thread, which is the gui one
+        wall, cpu = time.perf_counter(), time.thread_time()
+        lastWall, lastCpu = self._cpuSample
+        self._cpuSample = (wall, cpu)
+        if wall > lastWall:
+            self._cpuUsage = (cpu - lastCpu) / (wall - lastWall)
+            registry.observe("spinner_gui_cpu_ratio", self._cpuUsage)
+
+    def cpuUsage(self):
+        return self._cpuUsage
+
     def updateSize(self):
         size = (self._innerRadius + self._lineLength) * 2
         self.setFixedSize(size, size)
+        self.invalidateFrames()
 
     def updateTimer(self):
         self._timer.setInterval(
@@ -118,8 +171,10 @@ class LoadingSpinnerWidget(QWidget):
                 self.parentWidget().geometry().center().y() - h // 2
             )
 
-    def lineCountDistanceFromPrimary(self, current):
-        distance = self._currentCounter - current
+    def lineCountDistanceFromPrimary(self, current, counter=None):
+        if counter is None:
+            counter = self._currentCounter
+        distance = counter - current
         if (distance < 0):
             distance += self._numberOfLines
         return distance
@@ -150,6 +205,7 @@ class LoadingSpinnerWidget(QWidget):
         self._numberOfLines = lines
         self._currentCounter = 0
         self.updateTimer()
+        self.invalidateFrames()
 
     def setLineLength(self, length):
         self._lineLength = length
@@ -157,6 +213,7 @@ class LoadingSpinnerWidget(QWidget):
 
     def setLineWidth(self, width):
         self._lineWidth = width
+        self.invalidateFrames()
 
     def setInnerRadius(self, radius):
         self._innerRadius = radius
@@ -194,9 +251,11 @@ class LoadingSpinnerWidget(QWidget):
 
     def setRoundingPercent(self, roundness):
         self._roundingPercent = np.clip(roundness, 0.0, 1.0)
+        self.invalidateFrames()
 
     def setColor(self, color):
         self._color = color
+        self.invalidateFrames()
 
     def setRevolutionsPerSecond(self, revolutionsPerSecond):
         self._revolutionsPerSecond = revolutionsPerSecond
@@ -204,9 +263,11 @@ class LoadingSpinnerWidget(QWidget):
 
     def setTrailFadePercentage(self, trail):
         self._trailFadePercentage = trail
+        self.invalidateFrames()
 
     def setMinimumTrailOpacity(self, minimumTrailOpacity):
         self._minimumTrailOpacity = minimumTrailOpacity
+        self.invalidateFrames()
 
 
 class LoadingManager:
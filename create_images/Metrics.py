@@ -0,0 +1,210 @@
+import collections
+import json
+import math
+import os
+import threading
+import time
+from create_images.Utils import TimeThis
+
+DEFAULT_BUCKETS = (
+    0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+
+# labels that identify a single prompt or image would explode the number of
+# series, they are kept on the recent events only
+EVENT_ONLY_LABELS = ("prompt", "image")
+
+
+def quantile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS, reservoir=2048):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=reservoir)
+
+    def observe(self, value):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.recent.append(value)
+
+    def summary(self):
+        recent = list(self.recent)
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max,
+            "p50": quantile(recent, 0.50),
+            "p95": quantile(recent, 0.95),
+            "p99": quantile(recent, 0.99),
+            "buckets": dict(zip(
+                [str(bound) for bound in self.buckets] + ["+Inf"],
+                self.counts
+            )),
+        }
+
+
+class Registry:
+    def __init__(self, prefix="bic", events=1000):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.events = collections.deque(maxlen=events)
+
+    @staticmethod
+    def seriesKey(name, labels):
+        return name, tuple(sorted(
+            (key, str(value))
+            for key, value in labels.items()
+            if key not in EVENT_ONLY_LABELS and value is not None
+        ))
+
+    def inc(self, name, amount=1, **labels):
+        key = self.seriesKey(name, labels)
+        with self.lock:
+            self.counters.setdefault(key, Counter()).inc(amount)
+
+    def observe(self, name, value, events=True, **labels):
+        # high frequency samples pass events=False so they do not push the
+        # per prompt and per image events out of the buffer
+        key = self.seriesKey(name, labels)
+        with self.lock:
+            self.histograms.setdefault(key, Histogram()).observe(value)
+            if not events:
+                return
+            self.events.append({
+                "time": time.time(),
+                "name": name,
+                "value": value,
+                **{k: str(v) for k, v in labels.items() if v is not None},
+            })
+
+    def timer(self, name, **labels):
+        return TimeThis(
+            lambda elapsed: self.observe(name, elapsed / 1_000_000_000, **labels)
+        )
+
+    def stage(self, stage, **labels):
+        return self.timer("stage_seconds", stage=stage, **labels)
+
+    def byLabel(self, label):
+        # per prompt / per image totals over the recent events
+        totals = {}
+        with self.lock:
+            for event in self.events:
+                if label in event and "stage" in event:
+                    stages = totals.setdefault(event[label], {})
+                    stages[event["stage"]] = stages.get(event["stage"], 0) + event["value"]
+        return totals
+
+    def snapshot(self):
+        prompts = self.byLabel("prompt")
+        with self.lock:
+            return {
+                "time": time.time(),
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": counter.value}
+                    for (name, labels), counter in self.counters.items()
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram.summary()}
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+                "prompts": prompts,
+                "events": list(self.events),
+            }
+
+    def prometheus(self):
+        lines = []
+
+        def formatLabels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (
+                '{}="{}"'.format(
+                    key, value.replace("\\", "\\\\").replace('"', '\\"')
+                )
+                for key, value in pairs
+            )
+            return "{" + ",".join(escaped) + "}"
+
+        with self.lock:
+            seen = set()
+            for (name, labels), counter in sorted(self.counters.items()):
+                metric = f"{self.prefix}_{name}_total"
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} counter")
+                    seen.add(metric)
+                lines.append(f"{metric}{formatLabels(labels)} {counter.value}")
+
+            seen = set()
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                metric = f"{self.prefix}_{name}"
+                if metric not in seen:
+                    lines.append(f"# TYPE {metric} histogram")
+                    seen.add(metric)
+
+                cumulative = 0
+                bounds = [str(bound) for bound in histogram.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f"{metric}_bucket{formatLabels(labels, [('le', bound)])} "
+                        f"{cumulative}"
+                    )
+                lines.append(f"{metric}_sum{formatLabels(labels)} {histogram.sum}")
+                lines.append(f"{metric}_count{formatLabels(labels)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, jsonPath=None, prometheusPath=None):
+        if jsonPath:
+            writeAtomically(
+                jsonPath,
+                json.dumps(self.snapshot(), indent=1, default=jsonDefault)
+            )
+        if prometheusPath:
+            writeAtomically(prometheusPath, self.prometheus())
+
+
+def jsonDefault(value):
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return str(value)
+
+
+def writeAtomically(path, text):
+    tmpPath = f"{path}.tmp"
+    with open(tmpPath, "w") as file:
+        file.write(text)
+    os.replace(tmpPath, path)
+
+
+registry = Registry()
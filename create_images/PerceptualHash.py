@@ -0,0 +1,301 @@
+import argparse
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from create_images.Utils import IMAGE_EXTENSIONS, apply_function_to_files
+
+INDEX_FILE = "phash-index.npz"
+# past this the segments are too narrow to split the library into buckets
+MAX_THRESHOLD = 16
+# distances computed at once while comparing inside a bucket
+PAIR_BUDGET = 1 << 22
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return _POPCOUNT8[values.view(np.uint8)].reshape(*values.shape, 8).sum(-1)
+
+
+def packBits(bits: np.ndarray) -> np.ndarray:
+    # (..., 64) booleans into one big endian uint64 per row
+    packed = np.ascontiguousarray(np.packbits(bits, axis=-1))
+    return packed.view(">u8")[..., 0].astype(np.uint64)
+
+
+def dctMatrix(n):
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT32 = dctMatrix(32)
+
+
+def dhash(gray: np.ndarray) -> np.ndarray:
+    # gray is (..., 8, 9), one bit per horizontally adjacent pair
+    bits = gray[..., 1:] > gray[..., :-1]
+    return packBits(bits.reshape(*bits.shape[:-2], 64))
+
+
+def phash(gray: np.ndarray) -> np.ndarray:
+    # gray is (..., 32, 32), keep the 8x8 lowest frequencies
+    low = (_DCT32 @ gray @ _DCT32.T)[..., :8, :8]
+    flat = low.reshape(*low.shape[:-2], 64)
+    median = np.median(flat[..., 1:], axis=-1, keepdims=True)
+    return packBits(flat > median)
+
+
+def thumbnails(path):
+    with Image.open(path) as image:
+        # let the jpeg decoder skip most of the work by decoding at 1/8
+        image.draft("L", (64, 64))
+        gray = image.convert("L")
+        small = np.asarray(gray.resize((9, 8), Image.BOX), dtype=np.float32)
+        medium = np.asarray(gray.resize((32, 32), Image.BOX), dtype=np.float32)
+    return small, medium
+
+
+def hashFiles(paths, workers=None):
+    count = len(paths)
+    small = np.zeros((count, 8, 9), dtype=np.float32)
+    medium = np.zeros((count, 32, 32), dtype=np.float32)
+    valid = np.zeros(count, dtype=bool)
+
+    with ProcessPoolExecutor(workers) as executor:
+        results = executor.map(safeThumbnails, paths, chunksize=64)
+        for i, result in enumerate(results):
+            if result is not None:
+                small[i], medium[i] = result
+                valid[i] = True
+
+    return dhash(small), phash(medium), valid
+
+
+def safeThumbnails(path):
+    try:
+        return thumbnails(path)
+    except Exception as e:
+        logging.debug(f"Error while hashing file \"{path}\":\n {e}")
+        return None
+
+
+class PerceptualHashIndex:
+    def __init__(self, paths, stamps, dhashes, phashes):
+        self.paths = np.asarray(paths, dtype=str)
+        self.stamps = np.asarray(stamps, dtype=np.int64).reshape(-1, 2)
+        self.dhashes = np.asarray(dhashes, dtype=np.uint64)
+        self.phashes = np.asarray(phashes, dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.paths)
+
+    @classmethod
+    def empty(cls):
+        return cls([], np.zeros((0, 2)), [], [])
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with np.load(path) as data:
+                return cls(
+                    data["paths"], data["stamps"], data["dhashes"], data["phashes"]
+                )
+        except (OSError, KeyError, ValueError):
+            return cls.empty()
+
+    def save(self, path):
+        tmpPath = f"{path}.tmp.npz"
+        np.savez(
+            tmpPath,
+            paths=self.paths,
+            stamps=self.stamps,
+            dhashes=self.dhashes,
+            phashes=self.phashes,
+        )
+        os.replace(tmpPath, path)
+
+    @classmethod
+    def build(cls, directory, cachePath=None, workers=None):
+        files = []
+        apply_function_to_files(
+            lambda f: files.append(f)
+            if f.lower().endswith(IMAGE_EXTENSIONS) else None,
+            str(directory)
+        )
+
+        stamps = np.zeros((len(files), 2), dtype=np.int64)
+        for i, file in enumerate(files):
+            stat = os.stat(file)
+            stamps[i] = (stat.st_size, stat.st_mtime_ns)
+
+        cached = cls.load(cachePath) if cachePath else cls.empty()
+        known = {
+            path: i for i, path in enumerate(cached.paths.tolist())
+        }
+
+        dhashes = np.zeros(len(files), dtype=np.uint64)
+        phashes = np.zeros(len(files), dtype=np.uint64)
+        valid = np.ones(len(files), dtype=bool)
+        stale = []
+
+        for i, file in enumerate(files):
+            j = known.get(file)
+            if j is not None and (cached.stamps[j] == stamps[i]).all():
+                dhashes[i], phashes[i] = cached.dhashes[j], cached.phashes[j]
+            else:
+                stale.append(i)
+
+        if stale:
+            logging.info(f"Hashing {len(stale)} of {len(files)} images")
+            fresh, freshP, freshValid = hashFiles(
+                [files[i] for i in stale], workers
+            )
+            dhashes[stale], phashes[stale], valid[stale] = fresh, freshP, freshValid
+
+        index = cls(
+            np.asarray(files, dtype=str)[valid],
+            stamps[valid],
+            dhashes[valid],
+            phashes[valid],
+        )
+        if cachePath:
+            index.save(cachePath)
+        return index
+
+    def lookup(self, dhash, threshold):
+        distances = popcount(self.dhashes ^ np.uint64(dhash))
+        matches = np.flatnonzero(distances <= threshold)
+        return matches[np.argsort(distances[matches], kind="stable")]
+
+    def candidatePairs(self, threshold):
+        # pigeonhole: two hashes within `threshold` bits agree exactly on at
+        # least one of threshold + 1 disjoint segments, so only rows that
+        # share a segment value have to be compared
+        if not 0 <= threshold <= MAX_THRESHOLD:
+            raise ValueError(
+                f"threshold must be between 0 and {MAX_THRESHOLD}, got {threshold}"
+            )
+        segments = threshold + 1
+        bounds = np.linspace(0, 64, segments + 1).astype(int)
+        pairs = []
+
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            mask = np.uint64((1 << (stop - start)) - 1)
+            keys = (self.dhashes >> np.uint64(start)) & mask
+            order = np.argsort(keys, kind="stable")
+            sortedKeys = keys[order]
+
+            boundaries = np.flatnonzero(np.diff(sortedKeys)) + 1
+            starts = np.concatenate(([0], boundaries))
+            stops = np.concatenate((boundaries, [len(sortedKeys)]))
+
+            for first, last in zip(starts, stops):
+                if last - first < 2:
+                    continue
+                pairs.extend(self.closePairs(order[first:last], threshold))
+
+        if not pairs:
+            return np.zeros((0, 2), dtype=np.int64)
+        return np.unique(np.concatenate(pairs), axis=0)
+
+    def closePairs(self, members, threshold):
+        # flat or near identical images crowd a bucket, it is compared a few
+        # rows at a time and only pairs within `threshold` are kept
+        hashes = self.dhashes[members]
+        rows = max(1, PAIR_BUDGET // len(members))
+        for first in range(0, len(members) - 1, rows):
+            block = np.arange(first, min(first + rows, len(members) - 1))
+            distances = popcount(hashes[block, None] ^ hashes[None, :])
+            left, right = np.nonzero(
+                (distances <= threshold)
+                & (np.arange(len(members))[None, :] > block[:, None])
+            )
+            if len(left):
+                yield np.stack((members[block[left]], members[right]), axis=1)
+
+    def duplicateGroups(self, threshold=4, phashThreshold=10):
+        pairs = self.candidatePairs(threshold)
+        if len(pairs):
+            left, right = pairs[:, 0], pairs[:, 1]
+            close = (
+                (popcount(self.dhashes[left] ^ self.dhashes[right]) <= threshold)
+                & (popcount(self.phashes[left] ^ self.phashes[right]) <= phashThreshold)
+            )
+            pairs = pairs[close]
+
+        parent = list(range(len(self)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for a, b in pairs.tolist():
+            rootA, rootB = find(a), find(b)
+            if rootA != rootB:
+                parent[max(rootA, rootB)] = min(rootA, rootB)
+
+        groups = {}
+        for i in np.unique(pairs).tolist():
+            groups.setdefault(find(i), []).append(i)
+        return [[self.paths[i] for i in group] for group in groups.values()]
+
+
+def prune(groups, trash=None):
+    removed = []
+    for group in groups:
+        # keep the largest file, it is the least compressed of the bunch
+        keep = max(group, key=os.path.getsize)
+        for path in group:
+            if path == keep:
+                continue
+            if trash:
+                os.makedirs(trash, exist_ok=True)
+                shutil.move(path, os.path.join(trash, os.path.basename(path)))
+            else:
+                os.remove(path)
+            removed.append(path)
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("directory")
+    parser.add_argument("--cache", default=INDEX_FILE)
+    parser.add_argument("--threshold", type=int, default=4)
+    parser.add_argument("--phash-threshold", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--prune", action="store_true")
+    parser.add_argument("--trash", default=None)
+    args = parser.parse_args()
+
+    startTime = time.perf_counter()
+    index = PerceptualHashIndex.build(args.directory, args.cache, args.workers)
+    indexed = time.perf_counter()
+    groups = index.duplicateGroups(args.threshold, args.phash_threshold)
+    grouped = time.perf_counter()
+
+    for group in groups:
+        print("\n".join(group), end="\n\n")
+
+    print(
+        f"{len(index)} images indexed in {indexed - startTime:.2f} s, "
+        f"{len(groups)} duplicate groups "
+        f"({sum(len(g) - 1 for g in groups)} redundant) "
+        f"found in {grouped - indexed:.2f} s"
+    )
+
+    if args.prune:
+        removed = prune(groups, args.trash)
+        print(f"{len(removed)} duplicates {'moved' if args.trash else 'removed'}")
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pathlib
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from PyQt5 import sip
+from PyQt5.QtGui import QImage, QPixmap
+
+# magic, width, height, bytes per line, source mtime
+HEADER = struct.Struct("<4sIIIq")
+MAGIC = b"BICP"
+# the index is rewritten at most this often while buffers are added, and on
+# shutdown; buffers missing from a stale index are written again when needed
+SAVE_INTERVAL = 5.0
+
+
+class PixelCache:
+    def __init__(self, directory, budget):
+        self.directory = pathlib.Path(directory)
+        self.indexPath = self.directory / "index.json"
+        self.budget = budget
+        self.lock = threading.Lock()
+        # writes happen off the gui thread, one at a time
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix="pixelCache")
+
+        self.lastSave = time.monotonic()
+        self.entries = {}
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "evictions": 0}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.indexPath) as file:
+                index = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Pixel cache index is unreadable, resetting: {e}")
+            return
+
+        self.entries = index.get("entries", {})
+        self.stats.update(index.get("stats", {}))
+
+        for key in [k for k in self.entries if not self.path(k).exists()]:
+            del self.entries[key]
+
+    def save(self):
+        with self.lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmpPath = self.indexPath.with_suffix(".tmp")
+            with open(tmpPath, "w") as file:
+                json.dump({"entries": self.entries, "stats": self.stats}, file)
+            os.replace(tmpPath, self.indexPath)
+            self.lastSave = time.monotonic()
+
+    @staticmethod
+    def key(file, variant):
+        name = f"{os.path.abspath(file)}\0{variant}".encode()
+        return hashlib.blake2b(name, digest_size=16).hexdigest()
+
+    def path(self, key):
+        return self.directory / key[:2] / f"{key}.rgb"
+
+    def get(self, file, variant="original"):
+        # the pixels are mapped rather than read, the returned image points
+        # straight into the mapping and keeps it alive
+        key = self.key(file, variant)
+        try:
+            mtime = os.stat(file).st_mtime_ns
+        except OSError:
+            return None
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry["mtime"] != mtime:
+                self.stats["stale"] += 1
+                self.drop(key)
+                return None
+            entry["used"] = time.time()
+
+        try:
+            with open(self.path(key), "rb") as input:
+                # copy on write, qt gets a writable pointer it never writes to
+                mapping = mmap.mmap(input.fileno(), 0, access=mmap.ACCESS_COPY)
+        except (OSError, ValueError):
+            with self.lock:
+                self.drop(key)
+            return None
+
+        magic, width, height, bytesPerLine, sourceMtime = HEADER.unpack_from(mapping)
+        if (
+            magic != MAGIC
+            or sourceMtime != mtime
+            or len(mapping) != HEADER.size + bytesPerLine * height
+        ):
+            mapping.close()
+            with self.lock:
+                self.drop(key)
+            return None
+
+        pixels = memoryview(mapping)[HEADER.size:]
+        image = QImage(
+            sip.voidptr(pixels), width, height, bytesPerLine, QImage.Format_RGB888
+        )
+        image.mapping = pixels
+        with self.lock:
+            self.stats["hits"] += 1
+        return image
+
+    def put(self, file, image: QImage, variant="original"):
+        key = self.key(file, variant)
+        path = self.path(key)
+        try:
+            mtime = os.stat(file).st_mtime_ns
+        except OSError:
+            return
+
+        image = image.convertToFormat(QImage.Format_RGB888)
+        pixels = image.constBits()
+        pixels.setsize(image.sizeInBytes())
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmpPath = path.with_suffix(".tmp")
+        with open(tmpPath, "wb") as output:
+            output.write(HEADER.pack(
+                MAGIC, image.width(), image.height(), image.bytesPerLine(), mtime
+            ))
+            output.write(pixels.asstring())
+        os.replace(tmpPath, path)
+
+        with self.lock:
+            self.entries[key] = {
+                "size": HEADER.size + image.sizeInBytes(),
+                "used": time.time(),
+                "mtime": mtime,
+            }
+            self.evict()
+        if time.monotonic() - self.lastSave >= SAVE_INTERVAL:
+            self.save()
+
+    def remember(self, file, image, variant="original"):
+        # cheap to call on every navigation, known images are only touched
+        key = self.key(file, variant)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry["used"] = time.time()
+                return
+        if isinstance(image, QPixmap):
+            image = image.toImage()
+        self.writer.submit(self.put, file, image, variant)
+
+    def drop(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # still mapped somewhere on windows, it is overwritten later
+            logging.debug(f"Could not drop pixel buffer {key}: {e}")
+        self.entries.pop(key, None)
+
+    def evict(self):
+        total = sum(entry["size"] for entry in self.entries.values())
+        if total <= self.budget:
+            return
+
+        for key, entry in sorted(
+            self.entries.items(), key=lambda item: item[1]["used"]
+        ):
+            if total <= self.budget:
+                break
+            total -= entry["size"]
+            self.drop(key)
+            self.stats["evictions"] += 1
+
+    def shutdown(self):
+        self.writer.shutdown(wait=True)
+        self.save()
+
+    def summary(self):
+        with self.lock:
+            size = sum(entry["size"] for entry in self.entries.values())
+            return (
+                f"{len(self.entries)} buffers, {size / 2 ** 20:.1f} MiB, "
+                f"{self.stats['hits']} hits, {self.stats['misses']} misses, "
+                f"{self.stats['stale']} stale, "
+                f"{self.stats['evictions']} evictions"
+            )
@@ -0,0 +1,130 @@
+import cProfile
+import functools
+import heapq
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import dotenv
+
+config = dotenv.dotenv_values(".env")
+
+# decided once at import, when disabled `profiled` hands back the function
+# itself so the workers run exactly the same code as without profiling
+ENABLED = os.environ.get("BIC_PROFILE", config.get("PROFILE", "False")) in (
+    "True", "true", "1"
+)
+PROFILE_DIR = os.environ.get(
+    "BIC_PROFILE_DIR", config.get("PROFILE_DIR", "profiles")
+)
+KEEP_SLOWEST = int(os.environ.get(
+    "BIC_PROFILE_KEEP", config.get("PROFILE_KEEP", "5")
+))
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+
+class SlowestJobs:
+    def __init__(self, directory, keep):
+        self.directory = directory
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def offer(self, name, elapsed, write):
+        # min-heap of the slowest jobs per name, only jobs that make it in
+        # are written to disk
+        with self.lock:
+            heap = self.jobs.setdefault(name, [])
+            if len(heap) >= self.keep and elapsed <= heap[0][0]:
+                return None
+
+            os.makedirs(self.directory, exist_ok=True)
+            stem = os.path.join(
+                self.directory,
+                f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{round(elapsed * 1000)}ms"
+            )
+            write(stem)
+
+            if len(heap) >= self.keep:
+                _, evicted = heapq.heapreplace(heap, (elapsed, stem))
+                for extension in (".prof", ".txt"):
+                    if os.path.exists(evicted + extension):
+                        os.remove(evicted + extension)
+            else:
+                heapq.heappush(heap, (elapsed, stem))
+            return stem
+
+
+slowestJobs = SlowestJobs(PROFILE_DIR, KEEP_SLOWEST)
+
+
+def describeCall(args, kwargs):
+    parts = [repr(arg) for arg in args] + [f"{k}={v!r}" for k, v in kwargs.items()]
+    text = ", ".join(parts)
+    return text if len(text) <= 300 else text[:297] + "..."
+
+
+def runProfiled(name, function, args, kwargs):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(16)
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # only one profiler can be active at a time on newer pythons, a job
+        # overlapping another one only gets its allocations traced
+        profile = None
+
+    startTime = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        elapsed = time.perf_counter() - startTime
+        if profile is not None:
+            profile.disable()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+
+        def write(stem):
+            report = io.StringIO()
+            report.write(f"{name}({describeCall(args[1:], kwargs)})\n")
+            report.write(f"took {elapsed:.3f} s, peak traced memory {peak / 2 ** 20:.1f} MiB\n\n")
+
+            if profile is not None:
+                profile.dump_stats(stem + ".prof")
+                stats = pstats.Stats(profile, stream=report)
+                stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+
+            # allocations of other threads during the job are included too
+            report.write("top allocation sites:\n")
+            for stat in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]:
+                report.write(f"{stat}\n")
+
+            with open(stem + ".txt", "w") as file:
+                file.write(report.getvalue())
+
+        try:
+            stem = slowestJobs.offer(name, elapsed, write)
+            if stem is not None:
+                logging.info(f"Profiled {name} ({elapsed:.3f} s): {stem}")
+        except Exception:
+            logging.exception(f"Could not write profile of {name}")
+
+
+def profiled(name):
+    def decorator(function):
+        if not ENABLED:
+            return function
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return runProfiled(name, function, args, kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,118 @@
+import itertools
+import logging
+import math
+import re
+
+# "a | b" lists alternatives for a whole field, "{red,blue} car" expands
+# in place; both can be combined and nested groups are not supported
+ALTERNATIVE_SEPARATOR = "|"
+GROUP = re.compile(r"\{([^{}]*)\}")
+DEFAULT_LIMIT = 64
+
+
+def normalize(prompt):
+    # what counts as the same prompt for the generator
+    return " ".join(prompt.split()).lower()
+
+
+def templateChoices(text):
+    parts = GROUP.split(text)
+    # odd parts are the contents of the groups
+    return [
+        [option.strip() for option in part.split(",")] if i % 2 else [part]
+        for i, part in enumerate(parts)
+    ]
+
+
+def iterTemplate(text):
+    for combination in itertools.product(*templateChoices(text)):
+        yield "".join(combination)
+
+
+def expandTemplate(text):
+    return list(iterTemplate(text))
+
+
+def alternatives(text):
+    return [
+        alternative.strip()
+        for alternative in (text or "").split(ALTERNATIVE_SEPARATOR)
+    ]
+
+
+def iterField(text):
+    # lazy, a few groups are enough for millions of expansions
+    for alternative in alternatives(text):
+        yield from iterTemplate(alternative)
+
+
+def expandField(text):
+    return list(iterField(text)) or [""]
+
+
+def countField(text):
+    return sum(
+        math.prod(len(choices) for choices in templateChoices(alternative))
+        for alternative in alternatives(text)
+    ) or 1
+
+
+def combinations(prepend, prompt, append):
+    # prepend x prompt x append in field order; itertools.product would
+    # materialize every field first
+    for first in iterField(prepend):
+        for second in iterField(prompt):
+            for third in iterField(append):
+                yield " ".join(
+                    part.strip() for part in (first, second, third) if part.strip()
+                )
+
+
+def expand(prepend, prompt, append):
+    # lazily, without duplicates
+    seen = set()
+    for combined in combinations(prepend, prompt, append):
+        key = normalize(combined)
+        if key and key not in seen:
+            seen.add(key)
+            yield combined
+
+
+def readHistory(historyFile):
+    # every line is "<prompt> :: [<file>]", one per generated image
+    prompts = set()
+    try:
+        with open(historyFile, errors="replace") as history:
+            for line in history:
+                prompt, separator, _ = line.rstrip("\n").rpartition(" :: [")
+                if separator:
+                    prompts.add(normalize(prompt))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Could not read history \"{historyFile}\": {e}")
+    return prompts
+
+
+def plan(prepend, prompt, append, historyFile, limit=DEFAULT_LIMIT):
+    # returns (prompts to generate, prompts skipped as already generated,
+    # number of combinations left unexamined once the limit was reached)
+    history = readHistory(historyFile)
+    total = countField(prepend) * countField(prompt) * countField(append)
+    prompts = []
+    skipped = []
+    seen = set()
+    examined = 0
+    for combined in combinations(prepend, prompt, append):
+        if len(prompts) >= limit:
+            break
+        examined += 1
+        key = normalize(combined)
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        if key in history:
+            skipped.append(combined)
+        else:
+            prompts.append(combined)
+    return prompts, skipped, total - examined
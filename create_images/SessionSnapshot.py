@@ -0,0 +1,112 @@
+import logging
+import os
+import sqlite3
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice, QSize, Qt
+from PyQt5.QtGui import QPixmap
+
+SCHEMA = """
+create table if not exists state (key text primary key, value text);
+create table if not exists library (
+    position integer primary key, file text, prompt text
+);
+create table if not exists resident (file text primary key, thumbnail blob);
+"""
+THUMBNAIL_QUALITY = 90
+
+
+def encodeThumbnail(pixmap: QPixmap, size: QSize):
+    if pixmap is None or pixmap.isNull():
+        return None
+    if size.isValid() and not size.isEmpty():
+        pixmap = pixmap.scaled(size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    data = QByteArray()
+    buffer = QBuffer(data)
+    buffer.open(QIODevice.WriteOnly)
+    pixmap.save(buffer, "JPEG", THUMBNAIL_QUALITY)
+    return bytes(data)
+
+
+def decodeThumbnail(data):
+    pixmap = QPixmap()
+    if data is not None:
+        pixmap.loadFromData(data, "JPEG")
+    return pixmap
+
+
+class SessionSnapshot:
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.executescript(SCHEMA)
+        return connection
+
+    def save(self, state, images, currentImage, displaySize, radius):
+        # the images around the current one are what the next start shows
+        # first, they are kept at the size they were displayed at
+        resident = []
+        if images:
+            for offset in range(-radius, radius + 1):
+                data = images[(currentImage + offset) % len(images)]
+                if getattr(data, "placeholder", False):
+                    continue
+                resident.append(
+                    (data.file, encodeThumbnail(data.image, displaySize))
+                )
+
+        state = dict(state)
+        state["currentFile"] = images[currentImage].file if images else ""
+
+        tmpPath = f"{self.path}.tmp"
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        connection = sqlite3.connect(tmpPath)
+        try:
+            connection.executescript(SCHEMA)
+            with connection:
+                connection.executemany(
+                    "insert into state values (?, ?)", state.items()
+                )
+                connection.executemany(
+                    "insert into library values (?, ?, ?)",
+                    (
+                        (position, data.file, data.prompt)
+                        for position, data in enumerate(images)
+                    )
+                )
+                connection.executemany(
+                    "insert or replace into resident values (?, ?)", resident
+                )
+        finally:
+            connection.close()
+        # a crash while saving leaves the previous snapshot intact
+        os.replace(tmpPath, self.path)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            connection = self.connect()
+            try:
+                state = dict(connection.execute("select key, value from state"))
+                library = connection.execute(
+                    "select file, prompt from library order by position"
+                ).fetchall()
+                resident = dict(
+                    connection.execute("select file, thumbnail from resident")
+                )
+            finally:
+                connection.close()
+        except sqlite3.Error as e:
+            logging.warning(f"Session snapshot is unreadable, ignoring it: {e}")
+            return None
+
+        return {
+            "state": state,
+            "library": library,
+            "resident": {
+                file: decodeThumbnail(thumbnail)
+                for file, thumbnail in resident.items()
+            },
+        }
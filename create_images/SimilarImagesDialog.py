@@ -0,0 +1,39 @@
+from PyQt5.QtMultimedia import *
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import *
+from create_images.ImageGrid import ImageGrid
+
+
+class SimilarImagesDialog(QDialog):
+    def __init__(self, *args, pixelCache=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.setWindowTitle(self.tr("Similar Images"))
+        self.resize(800, 600)
+
+        layout = QVBoxLayout()
+
+        self.label = QLabel(self)
+        self.grid = ImageGrid(parent=self, pixelCache=pixelCache)
+        self.grid.fileActivated.connect(self.openRequest)
+        self.grid.fileActivated.connect(self.accept)
+
+        layout.addWidget(self.label)
+        layout.addWidget(self.grid)
+
+        self.setLayout(layout)
+
+    openRequest = pyqtSignal(str)
+
+    def exec_(self, results, elapsed):
+        self.grid.setFiles(
+            [path for path, _ in results],
+            {path: f"{score:.2f}" for path, score in results}
+        )
+        self.label.setText(
+            self.tr("{count} most similar images, found in {ms:.1f} ms").format(
+                count=len(results), ms=elapsed * 1000
+            )
+        )
+        return super().exec_()
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import pathlib
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from create_images.Utils import IMAGE_EXTENSIONS, apply_function_to_files
+
+HISTOGRAM_BINS = 4
+EMBEDDING_SIZE = 8
+FEATURES = HISTOGRAM_BINS ** 3 + EMBEDDING_SIZE * EMBEDDING_SIZE * 3
+
+
+def normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def features(image: Image.Image) -> np.ndarray:
+    small = np.asarray(
+        image.convert("RGB").resize((64, 64), Image.BOX), dtype=np.float32
+    )
+
+    # colour distribution, square rooted so that cosine similarity of two
+    # histograms becomes the hellinger affinity
+    bins = (small // (256 // HISTOGRAM_BINS)).astype(np.int64)
+    codes = (bins[..., 0] * HISTOGRAM_BINS + bins[..., 1]) * HISTOGRAM_BINS + bins[..., 2]
+    histogram = np.bincount(codes.ravel(), minlength=HISTOGRAM_BINS ** 3)
+    histogram = normalize(np.sqrt(histogram / histogram.sum()))
+
+    # coarse layout, mean removed so overall brightness does not dominate
+    embedding = small.reshape(
+        EMBEDDING_SIZE, 64 // EMBEDDING_SIZE, EMBEDDING_SIZE, 64 // EMBEDDING_SIZE, 3
+    ).mean(axis=(1, 3)).ravel()
+    embedding = normalize(embedding - embedding.mean())
+
+    return normalize(np.concatenate((histogram, embedding))).astype(np.float32)
+
+
+def featuresFromFile(path):
+    with Image.open(path) as image:
+        image.draft("RGB", (128, 128))
+        return features(image)
+
+
+class SimilarityIndex:
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
+        self.lock = threading.Lock()
+        self.matrix = np.zeros((1024, FEATURES), dtype=np.float32)
+        self.alive = np.zeros(1024, dtype=bool)
+        self.paths = []
+        self.rows = {}
+        self.count = 0
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            matrix = np.load(self.directory / "features.npy")
+            with open(self.directory / "paths.json") as file:
+                paths = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        if matrix.shape != (len(paths), FEATURES):
+            logging.warning("Similarity index is inconsistent, rebuilding")
+            return
+
+        # older indexes could hold the same file under two spellings, the
+        # last row of a file wins
+        paths = [self.key(path) if path else "" for path in paths]
+        rows = {path: i for i, path in enumerate(paths) if path}
+        with self.lock:
+            capacity = max(1024, 2 * len(paths))
+            self.matrix = np.zeros((capacity, FEATURES), dtype=np.float32)
+            self.matrix[:len(paths)] = matrix
+            self.alive = np.zeros(capacity, dtype=bool)
+            self.alive[list(rows.values())] = True
+            self.paths = [
+                path if rows.get(path) == i else ""
+                for i, path in enumerate(paths)
+            ]
+            self.rows = rows
+            self.count = len(paths)
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            matrix = self.matrix[:self.count].copy()
+            paths = list(self.paths)
+            self.dirty = False
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        np.save(self.directory / "features.tmp.npy", matrix)
+        with open(self.directory / "paths.tmp.json", "w") as file:
+            json.dump(paths, file)
+        os.replace(self.directory / "features.tmp.npy", self.directory / "features.npy")
+        os.replace(self.directory / "paths.tmp.json", self.directory / "paths.json")
+
+    @staticmethod
+    def key(path):
+        # every caller's spelling of a file maps to the same row
+        return os.path.abspath(path)
+
+    def __contains__(self, path):
+        return self.key(path) in self.rows
+
+    def add(self, path, vector):
+        path = self.key(path)
+        with self.lock:
+            row = self.rows.get(path)
+            if row is None:
+                if self.count == len(self.matrix):
+                    grown = np.zeros((2 * len(self.matrix), FEATURES), dtype=np.float32)
+                    grown[:self.count] = self.matrix
+                    self.matrix = grown
+                    self.alive = np.concatenate(
+                        (self.alive, np.zeros(len(self.alive), dtype=bool))
+                    )
+                row = self.count
+                self.count += 1
+                self.paths.append(path)
+                self.rows[path] = row
+            self.matrix[row] = vector
+            self.alive[row] = True
+            self.dirty = True
+
+    def addImage(self, path, image: Image.Image):
+        self.add(path, features(image))
+
+    def remove(self, path):
+        path = self.key(path)
+        with self.lock:
+            row = self.rows.pop(path, None)
+            if row is not None:
+                self.paths[row] = ""
+                self.matrix[row] = 0
+                self.alive[row] = False
+                self.dirty = True
+
+    def update(self, paths, workers=None):
+        missing = [path for path in map(self.key, paths) if path not in self.rows]
+        if not missing:
+            return 0
+
+        logging.info(f"Indexing {len(missing)} images for similarity search")
+
+        def compute(path):
+            try:
+                return path, featuresFromFile(path)
+            except Exception as e:
+                logging.debug(f"Error while indexing file \"{path}\":\n {e}")
+                return path, None
+
+        with ThreadPoolExecutor(workers) as executor:
+            for path, vector in executor.map(compute, missing):
+                if vector is not None:
+                    self.add(path, vector)
+
+        self.save()
+        return len(missing)
+
+    def query(self, vector, k=20, exclude=None):
+        exclude = None if exclude is None else self.key(exclude)
+        with self.lock:
+            scores = self.matrix[:self.count] @ vector
+            scores[~self.alive[:self.count]] = -np.inf
+            if exclude in self.rows:
+                scores[self.rows[exclude]] = -np.inf
+
+            k = min(k, self.count)
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                (self.paths[row], float(scores[row]))
+                for row in top
+                if np.isfinite(scores[row])
+            ]
+
+    def queryFile(self, path, k=20):
+        path = self.key(path)
+        with self.lock:
+            row = self.rows.get(path)
+            vector = None if row is None else self.matrix[row].copy()
+        if vector is None:
+            vector = featuresFromFile(path)
+            self.add(path, vector)
+        return self.query(vector, k, exclude=path)
+
+
+def imageFiles(directory):
+    files = []
+    apply_function_to_files(
+        lambda f: files.append(os.path.abspath(f))
+        if f.lower().endswith(IMAGE_EXTENSIONS) else None,
+        str(directory)
+    )
+    return files
+
+
+if __name__ == "__main__":
+    index = SimilarityIndex(sys.argv[1])
+    index.update(imageFiles(sys.argv[2]))
+
+    startTime = time.perf_counter()
+    results = index.queryFile(os.path.abspath(sys.argv[3]))
+    elapsed = time.perf_counter() - startTime
+
+    for path, score in results:
+        print(f"{score:.3f} {path}")
+    print(f"{index.count} images, query took {elapsed * 1000:.1f} ms")
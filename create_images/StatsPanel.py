@@ -0,0 +1,100 @@
+from PyQt5.QtMultimedia import *
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+from PyQt5.QtGui import *
+from create_images.Metrics import Registry
+
+
+class StatsPanel(QDialog):
+    COLUMNS = ("Stage", "Count", "Mean", "p50", "p95", "p99", "Max", "Total")
+
+    def __init__(self, registry: Registry, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.registry = registry
+
+        self.setWindowTitle(self.tr("Statistics"))
+        self.resize(700, 400)
+
+        layout = QVBoxLayout()
+
+        self.stages = QTableWidget(0, len(self.COLUMNS), self)
+        self.stages.setHorizontalHeaderLabels(
+            [self.tr(column) for column in self.COLUMNS]
+        )
+        self.stages.horizontalHeader().setSectionResizeMode(
+            QHeaderView.Stretch
+        )
+        self.stages.verticalHeader().hide()
+        self.stages.setEditTriggers(QAbstractItemView.NoEditTriggers)
+
+        self.counters = QLabel(self)
+        self.counters.setWordWrap(True)
+
+        layout.addWidget(self.stages)
+        layout.addWidget(self.counters)
+        self.setLayout(layout)
+
+        self.refreshTimer = QTimer(self)
+        self.refreshTimer.setInterval(1000)
+        self.refreshTimer.timeout.connect(self.refresh)
+
+    def showEvent(self, e: QShowEvent):
+        self.refresh()
+        self.refreshTimer.start()
+        super().showEvent(e)
+
+    def hideEvent(self, e: QHideEvent):
+        self.refreshTimer.stop()
+        super().hideEvent(e)
+
+    @staticmethod
+    def formatSeconds(value):
+        if value is None:
+            return "-"
+        if value < 1:
+            return f"{value * 1000:.1f} ms"
+        return f"{value:.2f} s"
+
+    @staticmethod
+    def formatLabels(labels):
+        return ", ".join(f"{key}={value}" for key, value in labels.items())
+
+    @pyqtSlot()
+    def refresh(self):
+        snapshot = self.registry.snapshot()
+
+        histograms = sorted(
+            (h for h in snapshot["histograms"] if h["name"] == "stage_seconds"),
+            key=lambda h: -h["sum"]
+        )
+
+        self.stages.setRowCount(len(histograms))
+        for row, histogram in enumerate(histograms):
+            labels = dict(histogram["labels"])
+            stage = labels.pop("stage", "?")
+            if labels:
+                stage = f"{stage} ({self.formatLabels(labels)})"
+
+            cells = (
+                stage,
+                str(histogram["count"]),
+                self.formatSeconds(histogram["mean"]),
+                self.formatSeconds(histogram["p50"]),
+                self.formatSeconds(histogram["p95"]),
+                self.formatSeconds(histogram["p99"]),
+                self.formatSeconds(histogram["max"]),
+                self.formatSeconds(histogram["sum"]),
+            )
+            for column, text in enumerate(cells):
+                item = QTableWidgetItem(text)
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.stages.setItem(row, column, item)
+
+        self.counters.setText(" | ".join(
+            f"{counter['name']}"
+            + (f" ({self.formatLabels(counter['labels'])})" if counter["labels"] else "")
+            + f": {counter['value']}"
+            for counter in sorted(snapshot["counters"], key=lambda c: c["name"])
+        ))
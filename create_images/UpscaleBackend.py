@@ -0,0 +1,259 @@
+import hashlib
+import logging
+import os
+import pathlib
+import sys
+import time
+import numpy as np
+import torch
+from PIL import Image
+from RealESRGAN import RealESRGAN
+from create_images.Utils import formatTime, psnr
+
+# RealESRGAN.predict feeds the network fixed size patches
+# (patches_size + 2 * padding) in batches of up to 4
+PATCH_SIZE = 192
+PATCH_PADDING = 24
+PATCH_BATCH = 4
+
+
+def patchShape(batch=1):
+    side = PATCH_SIZE + 2 * PATCH_PADDING
+    return (batch, 3, side, side)
+
+
+def artifactKey(weightsPath, scale, backend, quantize):
+    stat = os.stat(weightsPath)
+    digest = hashlib.sha1(
+        "|".join([
+            os.path.abspath(weightsPath),
+            str(stat.st_size),
+            str(stat.st_mtime_ns),
+            str(scale),
+            backend,
+            str(quantize),
+            str(patchShape()),
+            torch.__version__,
+        ]).encode()
+    ).hexdigest()[:16]
+    return f"{pathlib.Path(weightsPath).stem}-x{scale}-{digest}"
+
+
+class EagerBackend:
+    name = "eager"
+
+    def __init__(self, network, artifactPath=None, quantize=False):
+        if quantize:
+            raise ValueError("eager backend does not support quantization")
+        self.network = network
+
+    def __call__(self, batch):
+        return self.network(batch)
+
+
+class TorchScriptBackend:
+    name = "torchscript"
+    suffix = ".pt"
+
+    def __init__(self, network, artifactPath, quantize=False):
+        if quantize:
+            # dynamic quantization in torch only covers Linear/LSTM layers,
+            # RRDBNet is all convolutions so it would be a no-op
+            raise ValueError(
+                "torchscript backend does not support quantization, "
+                "use onnx backend instead"
+            )
+
+        if not artifactPath.exists():
+            self.export(network, artifactPath)
+
+        self.module = torch.jit.optimize_for_inference(
+            torch.jit.load(artifactPath.as_posix(), map_location="cpu")
+        )
+
+    @staticmethod
+    def export(network, artifactPath):
+        logging.info(f"Tracing upscale model to \"{artifactPath}\"")
+        with torch.no_grad():
+            traced = torch.jit.trace(
+                network, torch.rand(patchShape()), check_trace=False
+            )
+        tmpPath = artifactPath.with_suffix(".tmp")
+        traced.save(tmpPath.as_posix())
+        os.replace(tmpPath, artifactPath)
+
+    def __call__(self, batch):
+        return self.module(batch)
+
+
+class OnnxRuntimeBackend:
+    name = "onnx"
+    suffix = ".onnx"
+
+    def __init__(self, network, artifactPath, quantize=False):
+        import onnxruntime
+
+        if not artifactPath.exists():
+            self.export(network, artifactPath, quantize)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = (
+            onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        )
+        options.intra_op_num_threads = torch.get_num_threads()
+
+        self.session = onnxruntime.InferenceSession(
+            artifactPath.as_posix(),
+            options,
+            providers=["CPUExecutionProvider"]
+        )
+
+    @staticmethod
+    def export(network, artifactPath, quantize):
+        logging.info(f"Exporting upscale model to \"{artifactPath}\"")
+        tmpPath = artifactPath.with_suffix(".tmp")
+
+        with torch.no_grad():
+            torch.onnx.export(
+                network,
+                torch.rand(patchShape()),
+                tmpPath.as_posix(),
+                input_names=["input"],
+                output_names=["output"],
+                dynamic_axes={"input": {0: "batch"}, "output": {0: "batch"}},
+                opset_version=17,
+            )
+
+        if quantize:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantizedPath = artifactPath.with_suffix(".int8.tmp")
+            quantize_dynamic(
+                tmpPath.as_posix(),
+                quantizedPath.as_posix(),
+                weight_type=QuantType.QUInt8
+            )
+            os.remove(tmpPath)
+            tmpPath = quantizedPath
+
+        os.replace(tmpPath, artifactPath)
+
+    def __call__(self, batch):
+        output = self.session.run(
+            None, {"input": batch.detach().cpu().numpy()}
+        )[0]
+        return torch.from_numpy(output)
+
+
+class InterruptibleNetwork:
+    def __init__(self, network, interrupt):
+        self.network = network
+        self.interrupt = interrupt
+
+    def __call__(self, batch):
+        # called once per patch batch, so a pending interruption stops the
+        # upscale within a single batch worth of work
+        self.interrupt()
+        return self.network(batch)
+
+
+BACKENDS = {
+    EagerBackend.name: EagerBackend,
+    TorchScriptBackend.name: TorchScriptBackend,
+    OnnxRuntimeBackend.name: OnnxRuntimeBackend,
+}
+
+
+def attachBackend(
+    model: RealESRGAN,
+    backend,
+    weightsPath,
+    cacheDir,
+    quantize=False
+):
+    if backend not in BACKENDS:
+        raise ValueError(
+            f"Unknown upscale backend \"{backend}\", "
+            f"expected one of: {', '.join(BACKENDS)}"
+        )
+
+    backendType = BACKENDS[backend]
+    artifactPath = None
+
+    if backendType is not EagerBackend:
+        cacheDir = pathlib.Path(cacheDir)
+        cacheDir.mkdir(parents=True, exist_ok=True)
+        artifactPath = cacheDir / (
+            artifactKey(weightsPath, model.scale, backend, quantize)
+            + backendType.suffix
+        )
+
+    network = model.model
+    if isinstance(network, tuple(BACKENDS.values())):
+        raise ValueError("model already has an inference backend attached")
+
+    model.model = backendType(network.eval(), artifactPath, quantize)
+    logging.info(
+        f"Selected upscale backend: {backend}{' (int8)' if quantize else ''}"
+    )
+    return model
+
+
+def loadModel(weightsPath, scale, backend="eager", cacheDir=None, quantize=False):
+    model = RealESRGAN(torch.device("cpu"), scale=scale)
+    model.load_weights(weightsPath, download=True)
+    return attachBackend(model, backend, weightsPath, cacheDir, quantize)
+
+
+def benchmark(imagePath, weightsPath, scale=4, cacheDir="res/models/compiled", runs=3):
+    image = Image.open(imagePath).convert("RGB")
+    variants = [
+        ("eager", False),
+        ("torchscript", False),
+        ("onnx", False),
+        ("onnx", True),
+    ]
+
+    reference = None
+    results = []
+
+    for backend, quantize in variants:
+        try:
+            model = loadModel(weightsPath, scale, backend, cacheDir, quantize)
+        except (ImportError, ValueError) as e:
+            print(f"Skipping {backend}: {e}")
+            continue
+
+        # warm up, first call also pays for lazy initialization
+        output = np.asarray(model.predict(image))
+
+        timings = []
+        for _ in range(runs):
+            startTime = time.perf_counter_ns()
+            output = np.asarray(model.predict(image))
+            timings.append(time.perf_counter_ns() - startTime)
+
+        if reference is None:
+            reference = output
+
+        results.append((
+            backend + ("-int8" if quantize else ""),
+            int(np.median(timings)),
+            psnr(reference, output),
+        ))
+
+    print(f"{'backend':<16}{'latency':>12}{'ms':>10}{'psnr':>10}")
+    for name, latency, quality in results:
+        print(
+            f"{name:<16}{formatTime(latency // 1_000_000):>12}"
+            f"{latency / 1_000_000:>10.0f}{quality:>10.2f}"
+        )
+
+    return results
+
+
+if __name__ == "__main__":
+    benchmark(
+        sys.argv[1],
+        sys.argv[2] if len(sys.argv) > 2 else "res/models/RealESRGAN_x4.pth"
+    )
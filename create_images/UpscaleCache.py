@@ -0,0 +1,199 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+import numpy as np
+
+# the index is rewritten at most this often while entries are added, and on
+# shutdown; tiles put the cache on the path of every region upscale
+SAVE_INTERVAL = 5.0
+
+
+class UpscaleCache:
+    def __init__(self, directory, budget, scale, model):
+        self.directory = pathlib.Path(directory)
+        self.indexPath = self.directory / "index.json"
+        self.budget = budget
+        self.suffix = f"x{scale}-{model}"
+        self.lock = threading.Lock()
+
+        self.lastSave = time.monotonic()
+        self.total = 0
+        self.entries = {}
+        self.files = {}
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.indexPath) as file:
+                index = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logging.warning(f"Upscale cache index is unreadable, resetting: {e}")
+            return
+
+        self.entries = index.get("entries", {})
+        self.files = index.get("files", {})
+        self.stats.update(index.get("stats", {}))
+
+        # drop entries whose files were removed behind our back
+        for key in [k for k in self.entries if not self.path(k).exists()]:
+            del self.entries[key]
+        self.total = sum(entry["size"] for entry in self.entries.values())
+
+    def save(self):
+        with self.lock:
+            # tile keys carry their position after a dot, see tileDigest
+            digests = {
+                key.split("-", 1)[0].split(".", 1)[0] for key in self.entries
+            }
+            self.files = {
+                stamp: digest
+                for stamp, digest in self.files.items()
+                if digest in digests
+            }
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmpPath = self.indexPath.with_suffix(".tmp")
+            with open(tmpPath, "w") as file:
+                json.dump(
+                    {
+                        "entries": self.entries,
+                        "files": self.files,
+                        "stats": self.stats,
+                    },
+                    file
+                )
+            os.replace(tmpPath, self.indexPath)
+            self.lastSave = time.monotonic()
+
+    @staticmethod
+    def digest(pixels: np.ndarray):
+        pixels = np.ascontiguousarray(pixels)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(pixels.shape).encode())
+        digest.update(pixels.data)
+        return digest.hexdigest()
+
+    @staticmethod
+    def stamp(file):
+        # size and mtime survive renames and copies that preserve metadata,
+        # which lets us find the digest of a file without decoding it
+        stat = os.stat(file)
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+    def key(self, digest):
+        return f"{digest}-{self.suffix}"
+
+    def path(self, key):
+        return self.directory / key[:2] / f"{key}.jpg"
+
+    @staticmethod
+    def tileDigest(digest, x, y):
+        return f"{digest}.{x}x{y}"
+
+    def contains(self, digest):
+        with self.lock:
+            return self.key(digest) in self.entries
+
+    def get(self, digest):
+        key = self.key(digest)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or not self.path(key).exists():
+                if entry is not None:
+                    self.total -= self.entries.pop(key)["size"]
+                self.stats["misses"] += 1
+                return None
+            entry["used"] = time.time()
+            self.stats["hits"] += 1
+            return self.path(key)
+
+    def put(self, digest, image):
+        key = self.key(digest)
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        image.save(path.as_posix())
+
+        with self.lock:
+            previous = self.entries.get(key)
+            if previous is not None:
+                self.total -= previous["size"]
+            self.entries[key] = {
+                "size": path.stat().st_size,
+                "used": time.time(),
+            }
+            self.total += self.entries[key]["size"]
+            self.evict()
+        if time.monotonic() - self.lastSave >= SAVE_INTERVAL:
+            self.save()
+        return path
+
+    def evict(self):
+        if self.total <= self.budget:
+            return
+
+        for key, entry in sorted(
+            self.entries.items(), key=lambda item: item[1]["used"]
+        ):
+            if self.total <= self.budget:
+                break
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+            self.total -= entry["size"]
+            del self.entries[key]
+            self.stats["evictions"] += 1
+
+    def rememberFile(self, file, digest):
+        try:
+            stamp = self.stamp(file)
+        except OSError:
+            return
+        with self.lock:
+            self.files[stamp] = digest
+
+    def repointFile(self, stamp, file):
+        # the file was rewritten without changing its pixels, the digest
+        # recorded for its old stamp follows it to the new one
+        with self.lock:
+            digest = self.files.get(stamp)
+        if digest:
+            self.rememberFile(file, digest)
+
+    def fileDigest(self, file):
+        try:
+            stamp = self.stamp(file)
+        except OSError:
+            return None
+        with self.lock:
+            return self.files.get(stamp)
+
+    def lookupFile(self, file):
+        try:
+            stamp = self.stamp(file)
+        except OSError:
+            return None
+        with self.lock:
+            digest = self.files.get(stamp)
+            key = digest and self.key(digest)
+            if key not in self.entries or not self.path(key).exists():
+                return None
+            self.entries[key]["used"] = time.time()
+            return self.path(key)
+
+    def summary(self):
+        with self.lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self.entries),
+                "bytes": sum(entry["size"] for entry in self.entries.values()),
+                "hitRate": self.stats["hits"] / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,229 @@
+import itertools
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from PIL import Image
+
+
+class UpscaleError(Exception):
+    pass
+
+
+class UpscaleHostCrashed(UpscaleError):
+    pass
+
+
+class UpscaleCancelled(UpscaleError):
+    pass
+
+
+def sharedArray(memory, shape):
+    return np.ndarray(shape, dtype=np.uint8, buffer=memory.buf)
+
+
+def serve(requests, responses, cancelledJob, method, scale, weights, cacheDir):
+    from create_images.Upscaler import loadUpscaler
+
+    currentJob = None
+
+    def interrupt():
+        if cancelledJob.value == currentJob:
+            raise UpscaleCancelled(f"job {currentJob} cancelled")
+
+    upscaler = loadUpscaler(
+        method, scale, weights=weights, cacheDir=cacheDir, interrupt=interrupt
+    )
+
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+
+        jobId, inName, outName, inShape, outShape = request
+        currentJob = jobId
+        inMemory = shared_memory.SharedMemory(name=inName)
+        outMemory = shared_memory.SharedMemory(name=outName)
+        status, error = "ok", None
+
+        try:
+            lowRes = Image.fromarray(sharedArray(inMemory, inShape).copy())
+            highRes = np.asarray(upscaler(lowRes).convert("RGB"))
+
+            if highRes.shape != tuple(outShape):
+                raise ValueError(
+                    f"upscaler returned {highRes.shape}, expected {outShape}"
+                )
+
+            output = sharedArray(outMemory, outShape)
+            output[:] = highRes
+            del output
+        except UpscaleCancelled as e:
+            status, error = "cancelled", str(e)
+        except Exception as e:
+            status, error = "error", f"{type(e).__name__}: {e}"
+        finally:
+            inMemory.close()
+            outMemory.close()
+
+        responses.put((jobId, status, error))
+
+
+class UpscaleHost:
+    def __init__(
+        self,
+        method,
+        scale,
+        weights,
+        cacheDir,
+        maxRestarts=3,
+        restartWindow=60
+    ):
+        self.method = method
+        self.scale = scale
+        self.weights = weights
+        self.cacheDir = cacheDir
+        self.maxRestarts = maxRestarts
+        self.restartWindow = restartWindow
+
+        self.context = multiprocessing.get_context("spawn")
+        self.lock = threading.Lock()
+        self.jobIds = itertools.count()
+        self.restartTimes = []
+        self.process = None
+        self.currentJob = None
+        # id of the job the child should abandon at its next checkpoint
+        self.cancelledJob = self.context.Value("q", -1, lock=False)
+
+        self.start()
+
+    def start(self):
+        self.requests = self.context.Queue()
+        self.responses = self.context.Queue()
+        self.process = self.context.Process(
+            target=serve,
+            args=(
+                self.requests,
+                self.responses,
+                self.cancelledJob,
+                self.method,
+                self.scale,
+                self.weights,
+                self.cacheDir,
+            ),
+            name="upscaleHost",
+            daemon=True,
+        )
+        self.process.start()
+        logging.info(f"Upscale host started with pid {self.process.pid}")
+
+    def restart(self):
+        now = time.monotonic()
+        self.restartTimes = [
+            t for t in self.restartTimes if now - t < self.restartWindow
+        ]
+        if len(self.restartTimes) >= self.maxRestarts:
+            raise UpscaleHostCrashed(
+                f"upscale host crashed {len(self.restartTimes)} times "
+                f"in the last {self.restartWindow} seconds, giving up"
+            )
+        self.restartTimes.append(now)
+
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+
+        # back off a little more with every restart in the window
+        time.sleep(0.5 * len(self.restartTimes))
+        self.start()
+
+    def stop(self):
+        if self.process is None or not self.process.is_alive():
+            return
+        self.requests.put(None)
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def cancel(self):
+        # safe to call from any thread while upscale() is blocked
+        currentJob = self.currentJob
+        if currentJob is not None:
+            self.cancelledJob.value = currentJob
+
+    def upscale(self, pixels: np.ndarray) -> np.ndarray:
+        with self.lock:
+            if not self.process.is_alive():
+                logging.warning(
+                    f"Upscale host exited with code {self.process.exitcode}, "
+                    f"restarting"
+                )
+                self.restart()
+
+            try:
+                return self.submit(pixels)
+            except UpscaleHostCrashed as e:
+                logging.warning(f"{e}, restarting and retrying once")
+                self.restart()
+                return self.submit(pixels)
+
+    def submit(self, pixels):
+        height, width, _ = pixels.shape
+        inShape = (height, width, 3)
+        outShape = (height * self.scale, width * self.scale, 3)
+
+        inMemory = shared_memory.SharedMemory(
+            create=True, size=int(np.prod(inShape))
+        )
+        outMemory = shared_memory.SharedMemory(
+            create=True, size=int(np.prod(outShape))
+        )
+
+        try:
+            view = sharedArray(inMemory, inShape)
+            view[:] = pixels
+            del view
+
+            jobId = next(self.jobIds)
+            self.currentJob = jobId
+            self.requests.put(
+                (jobId, inMemory.name, outMemory.name, inShape, outShape)
+            )
+            try:
+                self.waitFor(jobId)
+            finally:
+                self.currentJob = None
+
+            view = sharedArray(outMemory, outShape)
+            result = view.copy()
+            del view
+            return result
+        finally:
+            inMemory.close()
+            inMemory.unlink()
+            outMemory.close()
+            outMemory.unlink()
+
+    def waitFor(self, jobId):
+        while True:
+            try:
+                responseId, status, error = self.responses.get(timeout=0.5)
+            except queue.Empty:
+                if not self.process.is_alive():
+                    raise UpscaleHostCrashed(
+                        f"upscale host exited with code "
+                        f"{self.process.exitcode} while upscaling"
+                    )
+                continue
+
+            # responses of jobs abandoned before a restart are dropped
+            if responseId != jobId:
+                continue
+            if status == "cancelled":
+                raise UpscaleCancelled(error)
+            if status == "error":
+                raise UpscaleError(error)
+            return
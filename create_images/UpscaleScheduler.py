@@ -0,0 +1,197 @@
+import heapq
+import itertools
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+from create_images.ImageUpscaleWorker import ImageUpscaleWorker
+
+
+class UpscaleScheduler(QObject):
+    EXPLICIT = 0
+    REGION = 1
+    BULK = 2
+    NEIGHBOUR = 3
+    GENERATED = 4
+
+    def __init__(self, worker: ImageUpscaleWorker, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.worker = worker
+        self.pending = []
+        self.order = itertools.count()
+        self.running = None
+        self.dropRunning = False
+
+        self.worker.upscaled.connect(self.onUpscaled)
+        self.worker.cancelled.connect(self.onCancelled)
+        self.worker.failed.connect(self.onFailed)
+        self.worker.regionFinished.connect(self.onRegionFinished)
+
+    upscaled = pyqtSignal(str, QImage)
+    failed = pyqtSignal(str, object)
+    completed = pyqtSignal(str, int, bool)
+    explicitStarted = pyqtSignal()
+    explicitFinished = pyqtSignal()
+
+    def request(self, file, image: QPixmap):
+        # the explicit job completes the file for whoever queued it before
+        self.dropPending(file)
+
+        if (
+            self.running is not None
+            and self.running[1] == file
+            and self.running[0] != self.REGION
+        ):
+            # already being upscaled speculatively, just wait for it
+            if self.running[0] != self.EXPLICIT:
+                self.running = (self.EXPLICIT, *self.running[1:])
+                self.explicitStarted.emit()
+            return
+
+        self.push(self.EXPLICIT, file, image)
+
+        if self.running is not None and self.running[0] != self.EXPLICIT:
+            self.worker.preempt()
+        self.dispatch()
+
+    def speculate(self, priority, file, image: QPixmap):
+        # a job already there for the file is raised to the more urgent
+        # priority, clearing the less urgent one must not lose the request
+        if (
+            self.running is not None
+            and self.running[1] == file
+            and self.running[0] != self.REGION
+        ):
+            if priority < self.running[0]:
+                self.running = (priority, *self.running[1:])
+            return
+
+        for job in self.pending:
+            if job[3] == file and job[0] != self.REGION:
+                if priority < job[0]:
+                    self.pending.remove(job)
+                    heapq.heapify(self.pending)
+                    self.push(priority, file, image)
+                return
+
+        self.push(priority, file, image)
+        self.dispatch()
+
+    def requestRegion(self, file, image: QPixmap, region: QRect):
+        # a detail being inspected goes ahead of speculative full upscales,
+        # which are preempted and requeued as usual; only the latest region
+        # is worth finishing
+        self.clear(self.REGION)
+        if self.running is not None and self.running[0] == self.REGION:
+            self.dropRunning = True
+        if self.running is not None and self.running[0] != self.EXPLICIT:
+            self.worker.preempt()
+
+        self.push(self.REGION, file, image, region)
+        self.dispatch()
+
+    def clear(self, priority):
+        self.pending = [job for job in self.pending if job[0] != priority]
+        heapq.heapify(self.pending)
+
+    def cancel(self, priority):
+        self.clear(priority)
+        if self.running is not None and self.running[0] == priority:
+            self.dropRunning = True
+            self.worker.preempt()
+
+    def discard(self, file):
+        # whoever waits for the file is told it is not coming
+        for priority, _, _, file, _ in self.dropPending(file):
+            if priority != self.REGION:
+                self.completed.emit(file, priority, False)
+
+    def dropPending(self, file):
+        dropped = [job for job in self.pending if job[3] == file]
+        self.pending = [job for job in self.pending if job[3] != file]
+        heapq.heapify(self.pending)
+        return dropped
+
+    def isBusy(self):
+        return self.running is not None
+
+    def push(self, priority, file, image, region=None):
+        heapq.heappush(
+            self.pending, (priority, next(self.order), image, file, region)
+        )
+
+    def dispatch(self):
+        if self.running is not None or not self.pending:
+            return
+
+        priority, _, image, file, region = heapq.heappop(self.pending)
+        self.running = (priority, file, image, region)
+
+        if priority == self.EXPLICIT:
+            self.explicitStarted.emit()
+
+        # read on this thread, a later preempt() moves it on even before the
+        # worker gets to the job
+        generation = self.worker.generation
+        if priority == self.REGION:
+            QMetaObject.invokeMethod(
+                self.worker,
+                "upscaleRegion",
+                Qt.ConnectionType.QueuedConnection,
+                Q_ARG(str, file),
+                Q_ARG(QPixmap, image),
+                Q_ARG(QRect, region),
+                Q_ARG(int, generation),
+            )
+            return
+
+        QMetaObject.invokeMethod(
+            self.worker,
+            "upscaleImage",
+            Qt.ConnectionType.QueuedConnection,
+            Q_ARG(str, file),
+            Q_ARG(QPixmap, image),
+            Q_ARG(int, generation),
+        )
+
+    def finish(self):
+        priority, file, image, region = self.running
+        self.running = None
+        self.dropRunning = False
+        if priority == self.EXPLICIT:
+            self.explicitFinished.emit()
+        return priority, file, image, region
+
+    @pyqtSlot(str, QImage)
+    def onUpscaled(self, file, image):
+        priority, _, _, _ = self.finish()
+        self.upscaled.emit(file, image)
+        self.completed.emit(file, priority, True)
+        self.dispatch()
+
+    @pyqtSlot(str)
+    def onCancelled(self, file):
+        dropped = self.dropRunning
+        priority, file, image, _ = self.finish()
+        # preempted speculative work goes back to the queue behind the
+        # explicit request that displaced it
+        if not dropped:
+            self.push(priority, file, image)
+        self.dispatch()
+
+    @pyqtSlot(str, bool)
+    def onRegionFinished(self, file, cancelled):
+        dropped = self.dropRunning
+        priority, file, image, region = self.finish()
+        # tiles done before the preemption are cached, the rest follows
+        # once the explicit upscale is through
+        if cancelled and not dropped:
+            self.push(priority, file, image, region)
+        self.dispatch()
+
+    @pyqtSlot(str, object)
+    def onFailed(self, file, e):
+        priority, file, _, _ = self.finish()
+        if priority == self.EXPLICIT:
+            self.failed.emit(file, e)
+        self.completed.emit(file, priority, False)
+        self.dispatch()
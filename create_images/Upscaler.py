@@ -1,52 +1,92 @@
+import numpy as np
 import torch
 from PIL import Image
 from RealESRGAN import RealESRGAN
 import sys
-from Utils import TimeThis, formatTime
+from create_images.Metrics import registry
+from create_images.Utils import TimeThis, formatTime
+from create_images.UpscaleBackend import InterruptibleNetwork, attachBackend
 from super_image import EdsrModel, ImageLoader
 
+ESRGAN_WEIGHTS = 'res/models/RealESRGAN_x4.pth'
+MODEL_CACHE_DIR = 'res/models/compiled'
+
 
 def printTime(time):
+    registry.observe("stage_seconds", time / 1_000_000_000, stage="upscale")
     print(
         f"Upscale took: {time} ns | {formatTime(round(time / 1_000_000))}")
 
 
-def edsrUpscale(i, o, scale):
-    image = Image.open(i)
-
+def loadEdsr(scale, weights=None, cacheDir=None, interrupt=None):
     model = EdsrModel.from_pretrained('res/models/edsr', scale=scale)
-    inputs = ImageLoader.load_image(image)
-    preds = model(inputs)
 
-    ImageLoader.save_image(preds, o)
+    def edsrUpscale(image):
+        # edsr runs the whole image in one pass, it can only be
+        # interrupted before it starts
+        if interrupt:
+            interrupt()
+        with torch.no_grad():
+            preds = model(ImageLoader.load_image(image.convert('RGB')))
+        pixels = preds[0].clamp(0, 1).permute(1, 2, 0).numpy()
+        return Image.fromarray((pixels * 255).round().astype(np.uint8))
+
+    return edsrUpscale
 
 
-def esrganUpscale(i, o, scale):
-    with TimeThis(printTime):
+def makeEsrganLoader(backend, quantize=False):
+    def loadEsrgan(scale, weights=None, cacheDir=None, interrupt=None):
         device_type = 'cuda' if torch.cuda.is_available() else 'cpu'
         print(f"Selected device type: {device_type}")
 
-        device = torch.device(device_type)
-
-        model = RealESRGAN(device, scale=scale)
-        model.load_weights(
-            f'res/models/RealESRGAN_x4.pth', download=True
+        model = RealESRGAN(torch.device(device_type), scale=scale)
+        model.load_weights(weights or ESRGAN_WEIGHTS, download=True)
+        if device_type == 'cpu':
+            attachBackend(
+                model,
+                backend,
+                weights or ESRGAN_WEIGHTS,
+                cacheDir or MODEL_CACHE_DIR,
+                quantize
+            )
+        if interrupt:
+            model.model = InterruptibleNetwork(model.model, interrupt)
+
+        def esrganUpscale(image):
+            return model.predict(image.convert('RGB'))
+
+        return esrganUpscale
+
+    return loadEsrgan
+
+
+UPSCALERS = {
+    "edsr": loadEdsr,
+    "esrgan": makeEsrganLoader("eager"),
+    "esrgan-torchscript": makeEsrganLoader("torchscript"),
+    "esrgan-onnx": makeEsrganLoader("onnx"),
+    "esrgan-onnx-int8": makeEsrganLoader("onnx", quantize=True),
+}
+
+
+def loadUpscaler(method, scale, weights=None, cacheDir=None, interrupt=None):
+    if method not in UPSCALERS:
+        raise ValueError(
+            f"Unknown upscale method \"{method}\", "
+            f"expected one of: {', '.join(UPSCALERS)}"
         )
-
-        image = Image.open(i).convert('RGB')
-
-        sr_image = model.predict(image)
-        sr_image.save(o)
+    return UPSCALERS[method](scale, weights, cacheDir, interrupt)
 
 
 def upscale(i, o, scale=4, method="edsr"):
-    methods = {
-        "edsr": edsrUpscale,
-        "esrgan": esrganUpscale,
-    }
-    methods[method](i, o, scale)
+    with registry.stage("model-load", method=method):
+        upscaler = loadUpscaler(method, scale)
+    with Image.open(i) as image:
+        with TimeThis(printTime):
+            result = upscaler(image)
+        result.save(o)
 
 
 if __name__ == "__main__":
     i, o = sys.argv[1], sys.argv[2]
-    upscale(i, o, 4)
+    upscale(i, o, 4, sys.argv[3] if len(sys.argv) > 3 else "edsr")
@@ -0,0 +1,267 @@
+import argparse
+import datetime
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import queue
+import sys
+import time
+import numpy as np
+from PIL import Image
+from create_images.Utils import psnr
+
+SIZES = (64, 128, 256)
+REPORT_FILE = "upscale-benchmark.json"
+
+
+def machineFingerprint():
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def peakRss():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in kilobytes on linux and in bytes on macos
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset
+
+
+def syntheticImage(size, seed):
+    # smooth gradients, stripes and blobs give the models some edges and
+    # texture to reconstruct while staying byte for byte reproducible
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / size
+
+    channels = []
+    for _ in range(3):
+        fx, fy, phase = rng.uniform(2, 12), rng.uniform(2, 12), rng.uniform(0, math.pi)
+        channel = (
+            0.5 * np.sin(2 * math.pi * (fx * x + fy * y) + phase)
+            + 0.3 * (x if rng.random() > 0.5 else y)
+        )
+        channels.append(channel)
+    pixels = np.stack(channels, axis=-1)
+
+    for _ in range(8):
+        cx, cy = rng.uniform(0, 1, 2)
+        radius = rng.uniform(0.05, 0.2)
+        blob = ((x - cx) ** 2 + (y - cy) ** 2) < radius ** 2
+        pixels[blob] = rng.uniform(-0.5, 1.0, 3)
+
+    pixels += rng.normal(0, 0.02, pixels.shape)
+    pixels = (pixels - pixels.min()) / (pixels.max() - pixels.min())
+    return Image.fromarray((pixels * 255).round().astype(np.uint8))
+
+
+def corpus(sizes, scale):
+    images = []
+    for seed, size in enumerate(sizes):
+        groundTruth = syntheticImage(size * scale, seed)
+        lowRes = groundTruth.resize((size, size), Image.BICUBIC)
+        images.append((size, lowRes, groundTruth))
+    return images
+
+
+def runCase(method, threads, scale, sizes, runs, results):
+    try:
+        import torch
+        from create_images.Upscaler import loadUpscaler
+
+        torch.set_num_threads(threads)
+
+        startTime = time.perf_counter()
+        upscaler = loadUpscaler(method, scale)
+        loadSeconds = time.perf_counter() - startTime
+
+        images = corpus(sizes, scale)
+        # warm up on the smallest image so lazy exports are not timed
+        upscaler(images[0][1])
+
+        rows = []
+        for size, lowRes, groundTruth in images:
+            timings = []
+            for _ in range(runs):
+                startTime = time.perf_counter()
+                output = upscaler(lowRes)
+                timings.append(time.perf_counter() - startTime)
+
+            rows.append({
+                "method": method,
+                "threads": threads,
+                "size": size,
+                "seconds": float(np.median(timings)),
+                "psnr": min(psnr(groundTruth, output.resize(groundTruth.size)), 100.0),
+                "loadSeconds": loadSeconds,
+            })
+
+        rss = peakRss()
+        for row in rows:
+            row["peakRss"] = rss
+        results.put(rows)
+    except Exception as e:
+        results.put([{"method": method, "threads": threads, "error": str(e)}])
+
+
+def waitForRows(process, results, method, threads):
+    while True:
+        try:
+            return results.get(timeout=1)
+        except queue.Empty:
+            if process.is_alive():
+                continue
+        # the process might have exited right after putting its results
+        try:
+            return results.get_nowait()
+        except queue.Empty:
+            return [{
+                "method": method,
+                "threads": threads,
+                "error": f"benchmark process exited with code {process.exitcode}",
+            }]
+
+
+def run(methods, threads, scale=4, sizes=SIZES, runs=3):
+    # every case runs in a fresh process, otherwise peak rss would only
+    # ever grow and models would share the same torch thread pool
+    context = multiprocessing.get_context("spawn")
+    rows = []
+
+    for method in methods:
+        for threadCount in threads:
+            print(f"Benchmarking {method} with {threadCount} threads")
+            results = context.Queue()
+            process = context.Process(
+                target=runCase,
+                args=(method, threadCount, scale, sizes, runs, results)
+            )
+            process.start()
+            rows.extend(waitForRows(process, results, method, threadCount))
+            process.join()
+
+    return {
+        "machine": machineFingerprint(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "scale": scale,
+        "results": rows,
+    }
+
+
+def writeReport(report, path=REPORT_FILE):
+    tmpPath = f"{path}.tmp"
+    with open(tmpPath, "w") as file:
+        json.dump(report, file, indent=2)
+    os.replace(tmpPath, path)
+
+
+def loadReport(path=REPORT_FILE):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        logging.info(f"Upscale benchmark report \"{path}\" unavailable: {e}")
+        return None
+
+
+def summarize(report, threads=None):
+    rows = [row for row in report["results"] if "error" not in row]
+    if not rows:
+        return {}
+
+    if threads is None or threads not in {row["threads"] for row in rows}:
+        threads = max(row["threads"] for row in rows)
+
+    rows = [row for row in rows if row["threads"] == threads]
+    # a method that failed on the large sizes would look fast on the sum of
+    # the small ones, methods are compared on the sizes all of them finished
+    sizes = {}
+    for row in rows:
+        sizes.setdefault(row["method"], set()).add(row["size"])
+    common = set.intersection(*sizes.values())
+
+    summary = {}
+    for row in rows:
+        if row["size"] not in common:
+            continue
+        seconds, quality, count = summary.get(row["method"], (0.0, 0.0, 0))
+        summary[row["method"]] = (
+            seconds + row["seconds"], quality + row["psnr"], count + 1
+        )
+
+    return {
+        method: (seconds, quality / count)
+        for method, (seconds, quality, count) in summary.items()
+    }
+
+
+def selectUpscaler(reportPath, qualityFloor, scale, threads=None):
+    report = loadReport(reportPath)
+    if report is None:
+        return None
+
+    if report.get("machine") != machineFingerprint():
+        logging.info("Upscale benchmark report was made on another machine")
+        return None
+
+    if report.get("scale") != scale:
+        logging.info("Upscale benchmark report was made for another scale")
+        return None
+
+    candidates = [
+        (seconds, method)
+        for method, (seconds, quality) in summarize(report, threads).items()
+        if quality >= qualityFloor
+    ]
+    if not candidates:
+        logging.info(f"No upscaler meets quality floor of {qualityFloor} dB")
+        return None
+
+    return min(candidates)[1]
+
+
+def printReport(report):
+    print(
+        f"{'method':<20}{'threads':>8}{'size':>6}{'seconds':>10}"
+        f"{'psnr':>8}{'rss MiB':>10}"
+    )
+    for row in report["results"]:
+        if "error" in row:
+            print(f"{row['method']:<20}{row['threads']:>8}  failed: {row['error']}")
+            continue
+        print(
+            f"{row['method']:<20}{row['threads']:>8}{row['size']:>6}"
+            f"{row['seconds']:>10.3f}{row['psnr']:>8.2f}"
+            f"{row['peakRss'] / 2 ** 20:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    from create_images.Upscaler import UPSCALERS
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--report", default=REPORT_FILE)
+    parser.add_argument("--methods", nargs="+", default=list(UPSCALERS))
+    parser.add_argument(
+        "--threads",
+        nargs="+",
+        type=int,
+        default=sorted({1, max(1, os.cpu_count() // 2), os.cpu_count()})
+    )
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--scale", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    report = run(args.methods, args.threads, args.scale, args.sizes, args.runs)
+    writeReport(report, args.report)
+    printReport(report)
@@ -1,6 +1,17 @@
+import collections
+import math
 import os
 import logging
 import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+import numpy as np
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".jfif", ".png", ".webp")
 
 
 def formatTime(millis):
@@ -13,15 +24,128 @@ def formatTime(millis):
 
 
 class TimeThis:
-    def __init__(self, getter):
+    def __init__(self, getter=None):
         self.startTime = 0
+        self.elapsed = 0
         self.getter = getter
 
     def __enter__(self):
-        self.startTime = time.time_ns()
+        self.startTime = time.perf_counter_ns()
+        return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.getter(time.time_ns() - self.startTime)
+        self.elapsed = time.perf_counter_ns() - self.startTime
+        if self.getter is not None:
+            self.getter(self.elapsed)
+
+
+def psnr(reference, image):
+    reference = np.asarray(reference, dtype=np.float64)
+    image = np.asarray(image, dtype=np.float64)
+    mse = np.mean((reference - image) ** 2)
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def scan_files(directory, extensions=None, newer_than=None, recursive=True):
+    # DirEntry carries the file type from the directory listing, so no
+    # extra stat is needed unless the mtime filter asks for it
+    if extensions is not None:
+        extensions = tuple(extension.lower() for extension in extensions)
+
+    pending = [str(directory)]
+    while pending:
+        path = pending.pop()
+        try:
+            entries = os.scandir(path)
+        except OSError as e:
+            logging.info(f"could not scan directory: \"{path}\": {e}")
+            continue
+
+        subdirectories = []
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        if recursive:
+                            subdirectories.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                    if extensions and not entry.name.lower().endswith(extensions):
+                        continue
+                    if newer_than is not None and entry.stat().st_mtime <= newer_than:
+                        continue
+                except OSError:
+                    continue
+                yield entry
+
+        # visited depth first in listing order, like the recursion it replaces
+        pending.extend(reversed(subdirectories))
+
+
+def _call_safely(function, file):
+    path = file.path if isinstance(file, os.DirEntry) else file
+    try:
+        return path, function(file), None
+    except Exception as e:
+        return path, None, e
+
+
+def map_files(
+    function,
+    files,
+    workers=0,
+    processes=False,
+    ordered=True,
+    errors=None,
+    keep_entries=False
+):
+    # yields (path, result) lazily; failures are appended to `errors` as
+    # (path, exception) or logged when no list is given. `keep_entries`
+    # hands DirEntry objects to the function as they are, so their cached
+    # stat is reused; they do not pickle, so not with processes
+    if keep_entries and processes:
+        raise ValueError("DirEntry objects cannot be sent to processes")
+    paths = (
+        files if keep_entries
+        else (file.path if isinstance(file, os.DirEntry) else file for file in files)
+    )
+
+    def collect(outcome):
+        path, result, error = outcome
+        if error is None:
+            yield path, result
+        elif errors is not None:
+            errors.append((path, error))
+        else:
+            logging.debug(f"Error while processing file \"{path}\":\n {error}")
+
+    if not workers:
+        for path in paths:
+            yield from collect(_call_safely(function, path))
+        return
+
+    executorType = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executorType(workers) as executor:
+        # a bounded window keeps the walk lazy and memory flat
+        window = workers * 4
+        pending = collections.deque()
+
+        def nextDone():
+            if ordered:
+                return pending.popleft().result()
+            done = next(iter(wait(pending, return_when=FIRST_COMPLETED).done))
+            pending.remove(done)
+            return done.result()
+
+        for path in paths:
+            pending.append(executor.submit(_call_safely, function, path))
+            while len(pending) >= window:
+                yield from collect(nextDone())
+        while pending:
+            yield from collect(nextDone())
 
 
 def apply_function_to_files(function, input_directory, output_directory=None):
@@ -38,31 +162,21 @@ def apply_function_to_files(function, input_directory, output_directory=None):
         return
 
     if output_directory is None:
-        for filename in os.listdir(input_directory):
-            input_file_path = os.path.join(input_directory, filename)
-
-            if os.path.isfile(input_file_path):
-                function(input_file_path)
+        for entry in scan_files(input_directory):
+            function(entry.path)
+        return
 
-            elif os.path.isdir(input_file_path):
-                apply_function_to_files(function, input_file_path)
+    if not os.path.exists(output_directory):
+        os.mkdir(output_directory)
+        logging.info(
+            f"directory: \"{output_directory}\" successfully created"
+        )
     else:
-        if not os.path.exists(output_directory):
-            os.mkdir(output_directory)
-            logging.info(
-                f"directory: \"{output_directory}\" successfully created"
-            )
-        else:
-            logging.info(f"output directory: \"{output_directory}\"")
+        logging.info(f"output directory: \"{output_directory}\"")
 
-        for filename in os.listdir(input_directory):
-            input_file_path = os.path.join(input_directory, filename)
-            output_file_path = os.path.join(output_directory, filename)
-
-            if os.path.isfile(input_file_path):
-                function(input_file_path, output_file_path)
-
-            elif os.path.isdir(input_file_path):
-                apply_function_to_files(
-                    function, input_file_path, output_file_path
-                )
+    for entry in scan_files(input_directory):
+        output_file_path = os.path.join(
+            output_directory, os.path.relpath(entry.path, input_directory)
+        )
+        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+        function(entry.path, output_file_path)
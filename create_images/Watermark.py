@@ -0,0 +1,70 @@
+import numpy as np
+from PIL import Image
+import PIL.ExifTags
+
+# written to the exif software tag of every image whose watermark was dealt
+# with, so that batch reprocessing can skip it without decoding
+PROCESSED_MARKER = "BingImageCreatorView: watermark removed"
+DEFAULT_THRESHOLD = 0.3
+
+
+class WatermarkDetector:
+    def __init__(self, mask, threshold=DEFAULT_THRESHOLD):
+        mask = np.asarray(mask)
+        if mask.ndim == 3:
+            mask = mask.max(axis=-1)
+
+        self.shape = mask.shape
+        self.threshold = threshold
+        self.roi = None
+
+        rows = np.flatnonzero(mask.any(axis=1))
+        cols = np.flatnonzero(mask.any(axis=0))
+        if not len(rows):
+            return
+
+        # a ring of background around the logo gives the correlation
+        # something to contrast against
+        padY = max(8, (rows[-1] - rows[0]) // 4)
+        padX = max(8, (cols[-1] - cols[0]) // 4)
+        self.roi = (
+            slice(max(0, rows[0] - padY), min(mask.shape[0], rows[-1] + padY + 1)),
+            slice(max(0, cols[0] - padX), min(mask.shape[1], cols[-1] + padX + 1)),
+        )
+
+        template = mask[self.roi].astype(np.float32)
+        template -= template.mean()
+        self.template = template / (np.linalg.norm(template) or 1)
+
+    def score(self, pixels):
+        # normalized cross correlation of the mask with the pixels under it,
+        # the logo lines up with the mask while an inpainted or clean region
+        # does not; None when the image is not the size the mask was made for
+        pixels = np.asarray(pixels)
+        if self.roi is None or pixels.shape[:2] != self.shape:
+            return None
+
+        roi = pixels[self.roi].astype(np.float32)
+        if roi.ndim == 3:
+            roi = roi[..., :3].mean(axis=-1)
+        roi -= roi.mean()
+
+        norm = np.linalg.norm(roi)
+        if norm == 0:
+            return 0.0
+        return float(abs((roi * self.template).sum()) / norm)
+
+    def present(self, pixels):
+        score = self.score(pixels)
+        return None if score is None else score >= self.threshold
+
+
+def isProcessed(path):
+    # only the header is parsed, the pixels are never decoded
+    with Image.open(path) as image:
+        return image.getexif().get(PIL.ExifTags.Base.Software) == PROCESSED_MARKER
+
+
+def markProcessed(metadata):
+    metadata[PIL.ExifTags.Base.Software] = PROCESSED_MARKER
+    return metadata
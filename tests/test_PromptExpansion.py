@@ -0,0 +1,104 @@
+import itertools
+from create_images.PromptExpansion import (
+    countField,
+    expand,
+    expandField,
+    expandTemplate,
+    normalize,
+    plan,
+    readHistory,
+)
+
+
+def writeHistory(path, prompts):
+    with open(path, "w") as history:
+        for i, prompt in enumerate(prompts):
+            history.write(f"{prompt} :: [out/{i}.jpeg]\n")
+
+
+def test_expandTemplate_without_groups():
+    assert expandTemplate("a red car") == ["a red car"]
+
+
+def test_expandTemplate_groups_in_order():
+    assert expandTemplate("{red, blue} car at {dawn,dusk}") == [
+        "red car at dawn",
+        "red car at dusk",
+        "blue car at dawn",
+        "blue car at dusk",
+    ]
+
+
+def test_expandField_alternatives_and_groups():
+    assert expandField("cat | {red,blue} dog") == ["cat", "red dog", "blue dog"]
+
+
+def test_expandField_empty():
+    assert expandField("") == [""]
+    assert expandField(None) == [""]
+
+
+def test_countField_matches_expansion():
+    for text in ("", "cat", "cat | dog", "{a,b,c} x | {d,e} {f,g}"):
+        assert countField(text) == len(expandField(text))
+
+
+def test_expand_skips_duplicates_and_empty_parts():
+    assert list(expand("A | a", "cat", "")) == ["A cat"]
+
+
+def test_expand_is_lazy():
+    huge = " ".join("{" + ",".join(map(str, range(10))) + "}" for _ in range(6))
+    assert list(itertools.islice(expand("", huge, ""), 3)) == [
+        "0 0 0 0 0 0",
+        "0 0 0 0 0 1",
+        "0 0 0 0 0 2",
+    ]
+
+
+def test_readHistory_normalizes_prompts(tmp_path):
+    historyFile = tmp_path / "history.txt"
+    with open(historyFile, "w") as history:
+        history.write("A  Red Car :: [out/1.jpeg]\n")
+        history.write("not a history line\n")
+        history.write("with :: [inside] :: [out/2.jpeg]\n")
+
+    assert readHistory(historyFile) == {"a red car", "with :: [inside]"}
+
+
+def test_readHistory_missing_file(tmp_path):
+    assert readHistory(tmp_path / "missing.txt") == set()
+
+
+def test_plan_skips_generated_prompts(tmp_path):
+    historyFile = tmp_path / "history.txt"
+    writeHistory(historyFile, ["red car"])
+
+    prompts, skipped, overflow = plan("", "{red,blue} car", "", historyFile)
+
+    assert prompts == ["blue car"]
+    assert skipped == ["red car"]
+    assert overflow == 0
+
+
+def test_plan_limit_and_overflow(tmp_path):
+    prompts, skipped, overflow = plan(
+        "a | b", "{1,2,3}", "", tmp_path / "history.txt", limit=4
+    )
+
+    assert prompts == ["a 1", "a 2", "a 3", "b 1"]
+    assert skipped == []
+    assert overflow == 2
+
+
+def test_plan_huge_expansion_stops_at_limit(tmp_path):
+    huge = " ".join("{" + ",".join(map(str, range(10))) + "}" for _ in range(6))
+
+    prompts, _, overflow = plan("", huge, "", tmp_path / "history.txt", limit=5)
+
+    assert len(prompts) == 5
+    assert overflow == 10 ** 6 - 5
+
+
+def test_normalize():
+    assert normalize("  A   Red\tCar ") == "a red car"